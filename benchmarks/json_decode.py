@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+# compare the time taken to decode big API responses with each JSON
+# backend installed.  See src/voip_ms_moxad/decode.py
+#
+#   python3 benchmarks/json_decode.py [number-of-CDRs [repeats]]
+#
+# A synthetic getCDR response is decoded from bytes by each backend, and
+# by the standard json module after decoding the bytes to a string, the
+# way send_request() used to with res.text
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import time
+import random
+
+from voip_ms_moxad import decode
+
+
+# build a getCDR response
+#
+# Arguments:
+#   number of CDRs
+# Returns:
+#   body as bytes
+
+def make_body( num_cdrs ):
+    rand = random.Random( 1 )
+    cdrs = []
+    for i in range( 0, num_cdrs ):
+        seconds = rand.randint( 0, 3600 )
+        cdrs.append( {
+            'date':         "2024-01-{0:02d} {1:02d}:{2:02d}:{3:02d}". \
+                format( rand.randint( 1, 28 ), rand.randint( 0, 23 ),
+                        rand.randint( 0, 59 ), rand.randint( 0, 59 )),
+            'callerid':     "\"Fred\" <416555{0:04d}>".format( i % 10000 ),
+            'destination':  "1416555{0:04d}".format( rand.randint( 0, 9999 )),
+            'description':  'Outgoing',
+            'account':      rand.choice( [ '100000', '100000_fred' ] ),
+            'disposition':  rand.choice( [ 'ANSWERED', 'NO ANSWER', 'BUSY' ] ),
+            'duration':     "{0:02d}:{1:02d}:{2:02d}".format( seconds // 3600,
+                                ( seconds // 60 ) % 60, seconds % 60 ),
+            'seconds':      str( seconds ),
+            'rate':         '0.01000000',
+            'total':        "{0:.8f}".format( seconds * 0.01 / 60 ),
+            'uniqueid':     str( 1000000000 + i ),
+        } )
+
+    return( json.dumps( { 'status': 'success', 'cdr': cdrs } ). \
+        encode( 'utf-8' ))
+
+
+# time a decoder
+#
+# Arguments:
+#   1:  function to decode the body
+#   2:  body
+#   3:  number of times to repeat
+# Returns:
+#   best time in seconds
+
+def best_time( func, body, repeats ):
+    best = None
+    for i in range( 0, repeats ):
+        start = time.perf_counter()
+        func( body )
+        taken = time.perf_counter() - start
+        if best == None or taken < best:
+            best = taken
+
+    return( best )
+
+
+def main( argv=sys.argv ):
+    num_cdrs = 100000
+    repeats  = 5
+    try:
+        if len( argv ) > 1:
+            num_cdrs = int( argv[1] )
+        if len( argv ) > 2:
+            repeats = int( argv[2] )
+    except ValueError:
+        sys.stderr.write( "usage: {0} [number-of-CDRs [repeats]]\n". \
+            format( argv[0] ))
+        return(1)
+
+    body = make_body( num_cdrs )
+    print( "{0:d} CDRs, {1:.1f} MB, best of {2:d}\n". \
+        format( num_cdrs, len( body ) / 1e6, repeats ))
+
+    results = [ ( 'json (from str)',
+        best_time( lambda b: json.loads( b.decode( 'utf-8' )), body, repeats )) ]
+    for name in decode.available():
+        name, loads = decode.get_loads( name )
+        results.append( ( name, best_time( loads, body, repeats )))
+
+    baseline = results[0][1]
+    print( "  {0:<16s} {1:>10s} {2:>8s}".format( 'backend', 'seconds',
+                                                 'speedup' ))
+    for name, taken in results:
+        print( "  {0:<16s} {1:>10.4f} {2:>7.1f}x".format( name, taken,
+                                                          baseline / taken ))
+
+    missing = [ n for n in decode.BACKENDS if n not in decode.available() ]
+    if missing:
+        print( "\nnot installed: {0}".format( ', '.join( missing )))
+
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+# send a load of SMS callbacks to sms-receiver, the way voip.ms would,
+# and report how many a second were stored
+#
+#   python3 benchmarks/sms_webhook_load.py [options]
+#       [--url url]          (default=http://127.0.0.1:8088/sms)
+#       [--token str]        (token the receiver wants)
+#       [--messages num]     (messages to send (default=10000))
+#       [--connections num]  (connections sending at once (default=20))
+#       [--json]             (POST JSON webhooks instead of forms)
+#
+# Each connection is kept open and sends its messages one after another,
+# waiting for each to be answered.  A message is only answered once the
+# receiver has stored it.
+
+# Copyright 2019 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import time
+import asyncio
+import urllib.parse
+
+
+# build the request of a message
+#
+# Arguments:
+#   1:  parsed URL of the receiver
+#   2:  token.  None if none
+#   3:  number of the message
+#   4:  True to send JSON
+# Returns:
+#   request as bytes
+
+def build_request( url, token, n, json_flag ):
+    target = url.path
+    if token != None:
+        target = target + '?' + urllib.parse.urlencode( { 'token': token } )
+
+    fields = {
+        'id':       "load-{0:d}-{1:d}".format( int( time.time() ), n ),
+        'date':     time.strftime( '%Y-%m-%d %H:%M:%S' ),
+        'from':     "416555{0:04d}".format( n % 10000 ),
+        'to':       '5195551212',
+        'message':  "load test message {0:d}".format( n ),
+    }
+    if json_flag:
+        body = json.dumps( { 'data': { 'payload': {
+            'id':           fields[ 'id' ],
+            'received_at':  fields[ 'date' ],
+            'from':         { 'phone_number': fields[ 'from' ] },
+            'to':           [ { 'phone_number': fields[ 'to' ] } ],
+            'text':         fields[ 'message' ],
+        } } } )
+        content_type = 'application/json'
+    else:
+        body = urllib.parse.urlencode( fields )
+        content_type = 'application/x-www-form-urlencoded'
+
+    body = body.encode( 'utf-8' )
+    head = "POST {0} HTTP/1.1\r\nHost: {1}\r\nContent-Type: {2}\r\n" \
+        "Content-Length: {3}\r\n\r\n".format( target, url.netloc,
+                                              content_type, len( body ))
+
+    return( head.encode( 'latin-1' ) + body )
+
+
+# send messages over one connection
+#
+# Arguments:
+#   1:  parsed URL of the receiver
+#   2:  token
+#   3:  list of numbers of the messages to send
+#   4:  True to send JSON
+#   5:  dictionary of HTTP status -> count, to add to
+# Returns:
+#   None
+
+async def sender( url, token, numbers, json_flag, statuses ):
+    reader, writer = await asyncio.open_connection( url.hostname,
+                                                    url.port or 80 )
+    try:
+        for n in numbers:
+            writer.write( build_request( url, token, n, json_flag ))
+            await writer.drain()
+
+            status = int( ( await reader.readline() ).split()[1] )
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in ( b'\r\n', b'' ):
+                    break
+                name, colon, value = line.decode( 'latin-1' ).partition( ':' )
+                if name.strip().lower() == 'content-length':
+                    length = int( value )
+            await reader.readexactly( length )
+            statuses[ status ] = statuses.get( status, 0 ) + 1
+    finally:
+        writer.close()
+
+
+async def run( url, token, num_messages, num_connections, json_flag ):
+    statuses = {}
+    tasks = []
+    for c in range( 0, num_connections ):
+        numbers = range( c, num_messages, num_connections )
+        tasks.append( sender( url, token, numbers, json_flag, statuses ))
+
+    start = time.perf_counter()
+    await asyncio.gather( *tasks )
+    taken = time.perf_counter() - start
+
+    return( statuses, taken )
+
+
+def main( argv=sys.argv ):
+    url             = 'http://127.0.0.1:8088/sms'
+    token           = None
+    num_messages    = 10000
+    num_connections = 20
+    json_flag       = False
+
+    i = 1
+    try:
+        while i < len( argv ):
+            arg = argv[i]
+            if arg == '--url':
+                i = i + 1 ;     url = argv[i]
+            elif arg == '--token':
+                i = i + 1 ;     token = argv[i]
+            elif arg == '--messages':
+                i = i + 1 ;     num_messages = int( argv[i] )
+            elif arg == '--connections':
+                i = i + 1 ;     num_connections = int( argv[i] )
+            elif arg == '--json':
+                json_flag = True
+            else:
+                raise ValueError( "no such option: {0}".format( arg ))
+            i = i + 1
+    except ( IndexError, ValueError ) as err:
+        sys.stderr.write( "{0}: {1}\n".format( argv[0], err or 'bad option' ))
+        return(1)
+
+    statuses, taken = asyncio.run( run( urllib.parse.urlsplit( url ), token,
+        num_messages, max( 1, num_connections ), json_flag ))
+
+    print( "{0:d} messages over {1:d} connections in {2:.2f}s: " \
+        "{3:.0f} a second, {4:.0f} a minute".format( num_messages,
+        num_connections, taken, num_messages / taken,
+        num_messages * 60 / taken ))
+    for status in sorted( statuses ):
+        print( "  HTTP {0}: {1}".format( status, statuses[ status ] ))
+
+    if list( statuses ) != [ 200 ]:
+        return(1)
+
+    return(0)
+
+
+if __name__ == '__main__':
+    sys.exit( main() )
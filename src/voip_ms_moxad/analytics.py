@@ -0,0 +1,752 @@
+"""
+analysis of CDRs (Call Display Records)
+
+CDRs are fed one at a time to add_cdr(), so they can be analyzed as they
+are read without being kept.  Everything is kept in structures whose size
+does not grow with the number of CDRs:
+
+  - the top destinations by cost, using the Space-Saving algorithm with
+    a fixed number of counters.  Exact unless there are more distinct
+    destinations than counters, in which case the biggest ones are
+    still found and the costs are upper bounds
+  - a heatmap of calls per day-of-week and hour-of-day
+  - a histogram of call durations per disposition, giving the average
+    and percentiles
+  - calls and cost per day, to find days with a spike compared to the
+    average of the days before them.  One counter per day in the range
+  - distinct callers and destinations per month, with HyperLogLog
+    sketches, and call duration percentiles per account, with DDSketch.
+    See sketches.py
+
+  analysis = new_analysis( top_n=10 )
+  for cdr in cdrs:
+      add_cdr( analysis, cdr )
+  for line in report_lines( finish( analysis )):
+      print( line )
+
+Analyses of separate date ranges can be combined with merge_analysis().
+get-cdrs --analyze fetches and analyzes the CDRs a few days at a time,
+so only those days' CDRs are held, and merges an analysis per day.  The
+analyses of days that are over never change, so with a state directory
+they are saved, and later reports merge them rather than fetching the
+CDRs again.  They are saved in:
+
+  <state-dir>/analyses/<query-key>/<YYYY-MM-DD>.json
+
+where the query key is as for rollups (see rollups.py) plus the number
+of top destinations, which sets the number of counters kept.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import heapq
+import datetime
+
+from .dates import weekday as weekday_of
+from . import money
+
+from .sketches import new_hll, hll_add, hll_count, hll_merge, hll_dump, \
+    hll_load, new_ddsketch, ddsketch_add, ddsketch_quantile, ddsketch_merge, \
+    ddsketch_dump, ddsketch_load, BadSketch
+
+ANALYSIS_DIR = 'analyses'
+
+# most days of CDRs fetched, and so held, at once by get-cdrs --analyze
+DAYS_PER_FETCH = 7
+
+WEEKDAYS = [ 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun' ]
+
+# upper bounds, in seconds, of the call duration histogram buckets
+DURATION_BUCKETS = [ 0, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600,
+                     7200 ]
+
+PERCENTILES = [ 0.5, 0.9, 0.95 ]
+
+# most top destinations.  10 counters are kept for each
+MAX_TOP_N = 1000
+
+
+def new_analysis( top_n=10, baseline_days=7, spike_factor=3.0,
+                  min_spike_calls=10 ):
+    """
+    create an empty analysis
+
+    Arguments:
+        1:  optional number of top destinations wanted
+        2:  optional number of previous days making up the baseline
+            a day is compared to
+        3:  optional factor over the baseline that makes a day a spike
+        4:  optional minimum number of calls in a day to be a spike
+    Returns:
+        analysis dictionary
+    Exceptions:
+        none
+    """
+
+    return( {
+        'top-n':            top_n,
+        'capacity':         max( 100, 10 * top_n ),
+        'baseline-days':    baseline_days,
+        'spike-factor':     spike_factor,
+        'min-spike-calls':  min_spike_calls,
+        'num-cdrs':         0,
+        'total-cost':       0,          # micro-cents.  See money.py
+        'total-seconds':    0,
+        'destinations':     {},     # destination -> [ cost, error, calls ]
+        'heap':             [],     # ( cost, destination ).  See below
+        'heatmap':          [ [ 0 ] * 24 for d in range( 0, 7 ) ],
+        'durations':        {},     # disposition -> histogram
+        'days':             {},     # YYYY-MM-DD -> [ calls, cost ]
+        'months':           {},     # YYYY-MM -> { 'callers', 'destinations' }
+        'accounts':         {},     # account -> DDSketch of durations
+    } )
+
+
+def space_saving_add( counters, heap, capacity, key, weight ):
+    """
+    add a weight to a key with the Space-Saving algorithm.  When all the
+    counters are used, the smallest is given to the new key, which
+    inherits its count as the possible error.
+
+    The smallest counter is found with a min-heap of ( count, key ),
+    one entry per counter.  Counts only go up, so an entry's count is
+    never more than the counter's, and entries are only brought up to
+    date when they come to the top of the heap.  So adding a weight is
+    O(log capacity) rather than a scan of all the counters
+
+    Arguments:
+        1:  dictionary of key -> [ count, error, calls ]
+        2:  heap list for the counters.  See build_heap()
+        3:  maximum number of counters
+        4:  key
+        5:  weight to add
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    entry = counters.get( key )
+    if entry != None:
+        entry[0] += weight
+        entry[2] += 1
+        return( None )
+
+    if len( counters ) < capacity:
+        counters[ key ] = [ weight, 0, 1 ]
+        heapq.heappush( heap, ( weight, key ))
+        return( None )
+
+    while True:
+        count, smallest = heap[0]
+        if counters[ smallest ][0] == count:
+            break
+        heapq.heapreplace( heap, ( counters[ smallest ][0], smallest ))
+
+    floor = counters.pop( smallest )[0]
+    counters[ key ] = [ floor + weight, floor, 1 ]
+    heapq.heapreplace( heap, ( floor + weight, key ))
+
+    return( None )
+
+
+def build_heap( counters ):
+    """
+    build the heap of Space-Saving counters used by space_saving_add()
+
+    Arguments:
+        dictionary of key -> [ count, error, calls ]
+    Returns:
+        heap list
+    Exceptions:
+        none
+    """
+
+    heap = [ ( entry[0], key ) for key, entry in counters.items() ]
+    heapq.heapify( heap )
+
+    return( heap )
+
+
+def new_histogram():
+    """
+    create an empty call duration histogram
+
+    Arguments:
+        none
+    Returns:
+        dictionary with 'buckets', 'count' and 'sum'
+    Exceptions:
+        none
+    """
+
+    return( { 'buckets': [ 0 ] * ( len( DURATION_BUCKETS ) + 1 ),
+              'count': 0, 'sum': 0 } )
+
+
+def histogram_add( histogram, seconds ):
+    """
+    add a call duration to a histogram
+
+    Arguments:
+        1:  histogram
+        2:  seconds
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    i = 0
+    for bound in DURATION_BUCKETS:
+        if seconds <= bound:
+            break
+        i = i + 1
+
+    histogram[ 'buckets' ][i] += 1
+    histogram[ 'count' ] += 1
+    histogram[ 'sum' ] += seconds
+
+    return( None )
+
+
+def histogram_percentile( histogram, fraction ):
+    """
+    estimate a percentile of a histogram, as the upper bound of the
+    bucket it falls into
+
+    Arguments:
+        1:  histogram
+        2:  fraction.  eg: 0.95
+    Returns:
+        seconds.  None if the histogram is empty.  -1 if the percentile
+        is past the biggest bucket
+    Exceptions:
+        none
+    """
+
+    if histogram[ 'count' ] == 0:
+        return( None )
+
+    wanted = fraction * histogram[ 'count' ]
+    seen = 0
+    for i in range( 0, len( DURATION_BUCKETS )):
+        seen = seen + histogram[ 'buckets' ][i]
+        if seen >= wanted:
+            return( DURATION_BUCKETS[i] )
+
+    return( -1 )
+
+
+def add_cdr( analysis, cdr ):
+    """
+    add a CDR to an analysis
+
+    Arguments:
+        1:  analysis
+        2:  CDR dictionary, as returned by the getCDR API method
+    Returns:
+        None
+    Exceptions:
+        none.  Fields that are missing or can't be parsed count as 0
+    """
+
+    cost = money.cdr_cost( cdr )
+    try:
+        seconds = int( cdr.get( 'seconds', 0 ))
+    except ValueError:
+        seconds = 0
+
+    analysis[ 'num-cdrs' ] += 1
+    analysis[ 'total-cost' ] += cost
+    analysis[ 'total-seconds' ] += seconds
+
+    destination = str( cdr.get( 'destination', 'unknown' ))
+    space_saving_add( analysis[ 'destinations' ], analysis[ 'heap' ],
+                      analysis[ 'capacity' ], destination, cost )
+
+    disposition = cdr.get( 'disposition', 'unknown' )
+    histogram = analysis[ 'durations' ].get( disposition )
+    if histogram == None:
+        histogram = new_histogram()
+        analysis[ 'durations' ][ disposition ] = histogram
+    histogram_add( histogram, seconds )
+
+    account = cdr.get( 'account', 'unknown' )
+    sketch = analysis[ 'accounts' ].get( account )
+    if sketch == None:
+        sketch = new_ddsketch()
+        analysis[ 'accounts' ][ account ] = sketch
+    ddsketch_add( sketch, seconds )
+
+    # date is YYYY-MM-DD HH:MM:SS
+    date = cdr.get( 'date', '' )
+    day = date[ :10 ]
+    try:
+        weekday = weekday_of( day )
+    except ValueError:
+        return( None )
+
+    try:
+        hour = int( date[ 11:13 ] )
+    except ValueError:
+        hour = 0
+    if hour < 0 or hour > 23:
+        hour = 0
+    analysis[ 'heatmap' ][ weekday ][ hour ] += 1
+
+    totals = analysis[ 'days' ].get( day )
+    if totals == None:
+        analysis[ 'days' ][ day ] = [ 1, cost ]
+    else:
+        totals[0] += 1
+        totals[1] += cost
+
+    month = day[ :7 ]
+    distinct = analysis[ 'months' ].get( month )
+    if distinct == None:
+        distinct = { 'callers': new_hll(), 'destinations': new_hll() }
+        analysis[ 'months' ][ month ] = distinct
+    hll_add( distinct[ 'callers' ], cdr.get( 'callerid', '' ))
+    hll_add( distinct[ 'destinations' ], destination )
+
+    return( None )
+
+
+def merge_analysis( analysis, other ):
+    """
+    merge an analysis into another, as if all the CDRs of both had been
+    added to the one.  Both must have been created with the same settings
+
+    Arguments:
+        1:  analysis to merge into
+        2:  analysis to merge from.  Not changed
+    Returns:
+        None
+    Exceptions:
+        BadSketch
+    """
+
+    analysis[ 'num-cdrs' ] += other[ 'num-cdrs' ]
+    analysis[ 'total-cost' ] += other[ 'total-cost' ]
+    analysis[ 'total-seconds' ] += other[ 'total-seconds' ]
+
+    # merged Space-Saving counters keep the biggest, as when adding
+    destinations = analysis[ 'destinations' ]
+    for key, ( cost, error, calls ) in other[ 'destinations' ].items():
+        entry = destinations.get( key )
+        if entry == None:
+            destinations[ key ] = [ cost, error, calls ]
+        else:
+            entry[0] += cost
+            entry[1] += error
+            entry[2] += calls
+    if len( destinations ) > analysis[ 'capacity' ]:
+        keep = sorted( destinations, key=lambda k: destinations[k][0],
+                       reverse=True )[ :analysis[ 'capacity' ] ]
+        analysis[ 'destinations' ] = { k: destinations[k] for k in keep }
+    analysis[ 'heap' ] = build_heap( analysis[ 'destinations' ] )
+
+    for weekday in range( 0, 7 ):
+        for hour in range( 0, 24 ):
+            analysis[ 'heatmap' ][ weekday ][ hour ] += \
+                other[ 'heatmap' ][ weekday ][ hour ]
+
+    for disposition, h in other[ 'durations' ].items():
+        histogram = analysis[ 'durations' ].get( disposition )
+        if histogram == None:
+            histogram = new_histogram()
+            analysis[ 'durations' ][ disposition ] = histogram
+        for i, n in enumerate( h[ 'buckets' ] ):
+            histogram[ 'buckets' ][i] += n
+        histogram[ 'count' ] += h[ 'count' ]
+        histogram[ 'sum' ] += h[ 'sum' ]
+
+    for day, ( calls, cost ) in other[ 'days' ].items():
+        totals = analysis[ 'days' ].get( day )
+        if totals == None:
+            analysis[ 'days' ][ day ] = [ calls, cost ]
+        else:
+            totals[0] += calls
+            totals[1] += cost
+
+    for month, distinct in other[ 'months' ].items():
+        mine = analysis[ 'months' ].get( month )
+        if mine == None:
+            mine = { 'callers': new_hll(), 'destinations': new_hll() }
+            analysis[ 'months' ][ month ] = mine
+        hll_merge( mine[ 'callers' ], distinct[ 'callers' ] )
+        hll_merge( mine[ 'destinations' ], distinct[ 'destinations' ] )
+
+    for account, sketch in other[ 'accounts' ].items():
+        mine = analysis[ 'accounts' ].get( account )
+        if mine == None:
+            mine = new_ddsketch()
+            analysis[ 'accounts' ][ account ] = mine
+        ddsketch_merge( mine, sketch )
+
+    return( None )
+
+
+def dump_analysis( analysis ):
+    """
+    get an analysis in a form that can be saved as JSON
+
+    Arguments:
+        analysis
+    Returns:
+        dictionary
+    Exceptions:
+        none
+    """
+
+    saved = {}
+    for key in [ 'top-n', 'num-cdrs', 'total-cost', 'total-seconds',
+                 'destinations', 'heatmap', 'durations', 'days' ]:
+        saved[ key ] = analysis[ key ]
+
+    saved[ 'months' ] = {}
+    for month, distinct in analysis[ 'months' ].items():
+        saved[ 'months' ][ month ] = {
+            'callers':      hll_dump( distinct[ 'callers' ] ),
+            'destinations': hll_dump( distinct[ 'destinations' ] ),
+        }
+
+    saved[ 'accounts' ] = {}
+    for account, sketch in analysis[ 'accounts' ].items():
+        saved[ 'accounts' ][ account ] = ddsketch_dump( sketch )
+
+    return( saved )
+
+
+def load_analysis( saved ):
+    """
+    get an analysis back from dump_analysis().  The baseline and spike
+    settings are the defaults, since only a merged analysis is reported
+
+    Arguments:
+        dictionary from dump_analysis()
+    Returns:
+        analysis
+    Exceptions:
+        BadSketch
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        analysis = new_analysis( int( saved[ 'top-n' ] ))
+        for key in [ 'num-cdrs', 'total-cost', 'total-seconds' ]:
+            analysis[ key ] = int( saved[ key ] )
+        for key, entry in saved[ 'destinations' ].items():
+            analysis[ 'destinations' ][ key ] = [ int( n ) for n in entry ]
+        analysis[ 'heap' ] = build_heap( analysis[ 'destinations' ] )
+        heatmap = saved[ 'heatmap' ]
+        if len( heatmap ) != 7 or any( len( h ) != 24 for h in heatmap ):
+            raise ValueError( "wrong size of heatmap" )
+        analysis[ 'heatmap' ] = [ [ int( n ) for n in h ] for h in heatmap ]
+        for disposition, h in saved[ 'durations' ].items():
+            if len( h[ 'buckets' ] ) != len( DURATION_BUCKETS ) + 1:
+                raise ValueError( "wrong number of duration buckets" )
+            analysis[ 'durations' ][ disposition ] = {
+                'buckets': [ int( n ) for n in h[ 'buckets' ] ],
+                'count': int( h[ 'count' ] ), 'sum': int( h[ 'sum' ] ) }
+        for day, ( calls, cost ) in saved[ 'days' ].items():
+            analysis[ 'days' ][ day ] = [ int( calls ), int( cost ) ]
+        for month, distinct in saved[ 'months' ].items():
+            analysis[ 'months' ][ month ] = {
+                'callers':      hll_load( distinct[ 'callers' ] ),
+                'destinations': hll_load( distinct[ 'destinations' ] ),
+            }
+        for account, sketch in saved[ 'accounts' ].items():
+            analysis[ 'accounts' ][ account ] = ddsketch_load( sketch )
+    except ( KeyError, TypeError, ValueError, AttributeError ) as err:
+        raise BadSketch( "{0}bad saved analysis: {1}".format( sprefix, err )) \
+            from None
+
+    return( analysis )
+
+
+def analysis_pathname( state_dir, key, day ):
+    """
+    get the pathname the analysis of a day is saved in
+
+    Arguments:
+        1:  state directory
+        2:  query key.  See rollups.query_key()
+        3:  day.  YYYY-MM-DD
+    Returns:
+        pathname
+    Exceptions:
+        BadSketch
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if not state_dir:
+        raise BadSketch( "{0}no state directory to keep analyses in". \
+            format( sprefix ))
+
+    return( os.path.join( state_dir, ANALYSIS_DIR, key, day + '.json' ))
+
+
+def load_day( state_dir, key, day ):
+    """
+    get the saved analysis of a day
+
+    Arguments:
+        1:  state directory
+        2:  query key
+        3:  day.  YYYY-MM-DD
+    Returns:
+        analysis, or None if there isn't one saved
+    Exceptions:
+        BadSketch
+    """
+
+    pathname = analysis_pathname( state_dir, key, day )
+    try:
+        with open( pathname ) as f:
+            saved = json.load( f )
+        analysis = load_analysis( saved )
+    except ( OSError, ValueError, BadSketch ):
+        return( None )
+
+    return( analysis )
+
+
+def save_day( state_dir, key, day, analysis ):
+    """
+    save the analysis of a day.  Only days that are over should be saved
+
+    Arguments:
+        1:  state directory
+        2:  query key
+        3:  day.  YYYY-MM-DD
+        4:  analysis.  Empty if the day had no CDRs
+    Returns:
+        None
+    Exceptions:
+        BadSketch.  A failure to write is ignored
+    """
+
+    pathname = analysis_pathname( state_dir, key, day )
+    try:
+        os.makedirs( os.path.dirname( pathname ), exist_ok=True )
+        tmp_pathname = "{0}.{1}.tmp".format( pathname, os.getpid() )
+        with open( tmp_pathname, 'w' ) as f:
+            json.dump( dump_analysis( analysis ), f )
+        os.replace( tmp_pathname, pathname )
+    except OSError:
+        pass
+
+    return( None )
+
+
+def find_spikes( days, baseline_days, factor, min_calls ):
+    """
+    find days with many more calls than the average of the days before
+
+    Arguments:
+        1:  dictionary of YYYY-MM-DD -> [ calls, cost ]
+        2:  number of previous days making up the baseline.  Days with
+            no calls count as 0
+        3:  factor over the baseline that makes a day a spike
+        4:  minimum number of calls in a day to be a spike
+    Returns:
+        list of ( day, calls, baseline-average )
+    Exceptions:
+        none
+    """
+
+    spikes = []
+    if len( days ) == 0:
+        return( spikes )
+
+    ordered = sorted( days )
+    first = datetime.date.fromisoformat( ordered[0] )
+    last  = datetime.date.fromisoformat( ordered[-1] )
+
+    window = []
+    window_sum = 0
+    day = first
+    one_day = datetime.timedelta( days=1 )
+    while day <= last:
+        key = day.isoformat()
+        calls = days.get( key, [ 0, 0 ] )[0]
+
+        if len( window ) == baseline_days:
+            average = window_sum / baseline_days
+            if calls >= min_calls and calls > factor * max( average, 1 ):
+                spikes.append( ( key, calls, average ))
+
+        window.append( calls )
+        window_sum += calls
+        if len( window ) > baseline_days:
+            window_sum -= window.pop( 0 )
+
+        day = day + one_day
+
+    return( spikes )
+
+
+def finish( analysis ):
+    """
+    get the results of an analysis
+
+    Arguments:
+        analysis
+    Returns:
+        dictionary of results
+    Exceptions:
+        none
+    """
+
+    destinations = analysis[ 'destinations' ]
+    top = sorted( destinations, key=lambda k: destinations[k][0],
+                  reverse=True )[ :analysis[ 'top-n' ] ]
+
+    durations = {}
+    for disposition in sorted( analysis[ 'durations' ] ):
+        h = analysis[ 'durations' ][ disposition ]
+        result = { 'calls': h[ 'count' ], 'average': 0.0 }
+        if h[ 'count' ]:
+            result[ 'average' ] = h[ 'sum' ] / h[ 'count' ]
+        for p in PERCENTILES:
+            result[ p ] = histogram_percentile( h, p )
+        durations[ disposition ] = result
+
+    months = {}
+    for month in sorted( analysis[ 'months' ] ):
+        distinct = analysis[ 'months' ][ month ]
+        months[ month ] = ( hll_count( distinct[ 'callers' ] ),
+                            hll_count( distinct[ 'destinations' ] ))
+
+    accounts = {}
+    for account in sorted( analysis[ 'accounts' ] ):
+        sketch = analysis[ 'accounts' ][ account ]
+        result = { 'calls': sketch[ 'count' ], 'average': 0.0 }
+        if sketch[ 'count' ]:
+            result[ 'average' ] = sketch[ 'sum' ] / sketch[ 'count' ]
+        for p in PERCENTILES:
+            result[ p ] = ddsketch_quantile( sketch, p )
+        accounts[ account ] = result
+
+    return( {
+        'num-cdrs':         analysis[ 'num-cdrs' ],
+        'total-cost':       analysis[ 'total-cost' ],
+        'total-seconds':    analysis[ 'total-seconds' ],
+        'top-destinations': [ ( d, destinations[d][0], destinations[d][2],
+                                destinations[d][1] ) for d in top ],
+        'heatmap':          analysis[ 'heatmap' ],
+        'durations':        durations,
+        'months':           months,
+        'accounts':         accounts,
+        'spikes':           find_spikes( analysis[ 'days' ],
+                                         analysis[ 'baseline-days' ],
+                                         analysis[ 'spike-factor' ],
+                                         analysis[ 'min-spike-calls' ] ),
+    } )
+
+
+def report_lines( results ):
+    """
+    get a human-readable report of the results of an analysis
+
+    Arguments:
+        results from finish()
+    Returns:
+        list of lines
+    Exceptions:
+        none
+    """
+
+    lines = []
+    lines.append( "{0:d} calls costing ${1} totalling {2:d} seconds". \
+        format( results[ 'num-cdrs' ],
+                money.format_dollars( results[ 'total-cost' ] ),
+                results[ 'total-seconds' ] ))
+
+    lines.append( "" )
+    lines.append( "Top destinations by cost:" )
+    lines.append( "  {0:<20s} {1:>10s} {2:>7s}".format( 'Destination',
+        'Cost', 'Calls' ))
+    for destination, cost, calls, error in results[ 'top-destinations' ]:
+        approx = ''
+        if error:
+            approx = '  (approximate)'
+        lines.append( "  {0:<20s} {1:>10s} {2:>7d}{3}". \
+            format( destination, money.format_dollars( cost, 4 ), calls,
+                    approx ))
+
+    lines.append( "" )
+    lines.append( "Call durations by disposition (seconds):" )
+    lines.append( "  {0:<15s} {1:>7s} {2:>9s} {3:>7s} {4:>7s} {5:>7s}". \
+        format( 'Disposition', 'Calls', 'Average', 'p50<=', 'p90<=', 'p95<=' ))
+    for disposition in results[ 'durations' ]:
+        d = results[ 'durations' ][ disposition ]
+        pcts = []
+        for p in PERCENTILES:
+            v = d[ p ]
+            if v == None:
+                pcts.append( '-' )
+            elif v < 0:
+                pcts.append( '>' + str( DURATION_BUCKETS[-1] ))
+            else:
+                pcts.append( str( v ))
+        lines.append( "  {0:<15s} {1:>7d} {2:>9.1f} {3:>7s} {4:>7s} {5:>7s}". \
+            format( disposition, d[ 'calls' ], d[ 'average' ], *pcts ))
+
+    lines.append( "" )
+    lines.append( "Call durations by account (seconds, within 1%):" )
+    lines.append( "  {0:<15s} {1:>7s} {2:>9s} {3:>7s} {4:>7s} {5:>7s}". \
+        format( 'Account', 'Calls', 'Average', 'p50', 'p90', 'p95' ))
+    for account in results[ 'accounts' ]:
+        a = results[ 'accounts' ][ account ]
+        pcts = [ "{0:.0f}".format( a[ p ] ) for p in PERCENTILES ]
+        lines.append( "  {0:<15s} {1:>7d} {2:>9.1f} {3:>7s} {4:>7s} {5:>7s}". \
+            format( account, a[ 'calls' ], a[ 'average' ], *pcts ))
+
+    lines.append( "" )
+    lines.append( "Distinct callers and destinations by month (approximate):" )
+    lines.append( "  {0:<10s} {1:>9s} {2:>13s}".format( 'Month', 'Callers',
+        'Destinations' ))
+    for month in results[ 'months' ]:
+        callers, destinations = results[ 'months' ][ month ]
+        lines.append( "  {0:<10s} {1:>9d} {2:>13d}".format( month, callers,
+            destinations ))
+
+    lines.append( "" )
+    lines.append( "Calls by day of week and hour of day:" )
+    lines.append( "     " + ''.join( "{0:>5d}".format( h )
+                                     for h in range( 0, 24 )))
+    for weekday in range( 0, 7 ):
+        lines.append( "  {0:s}".format( WEEKDAYS[ weekday ] ) +
+            ''.join( "{0:>5d}".format( n )
+                     for n in results[ 'heatmap' ][ weekday ] ))
+
+    lines.append( "" )
+    if len( results[ 'spikes' ] ) == 0:
+        lines.append( "No days with a spike in calls" )
+    else:
+        lines.append( "Days with a spike in calls:" )
+        for day, calls, average in results[ 'spikes' ]:
+            lines.append( "  {0:s}  {1:d} calls  (previous average {2:.1f})". \
+                format( day, calls, average ))
+
+    return( lines )
@@ -0,0 +1,303 @@
+"""
+a local archive of CDRs (Call Display Records) in SQLite
+
+CDRs fetched with 'get-cdrs --archive' are kept in:
+
+  <state-dir>/cdrs.sqlite
+
+in a table 'cdrs' with a column for each field of a CDR, indexed by
+date, account, callerid and destination, so questions about the history
+of calls can be answered with SQL at the speed of the local disk,
+without calling the API:
+
+  conn = open_archive( archive_pathname( state_dir ))
+  store( conn, json_struct[ 'cdr' ] )
+  columns, rows = query( archive_pathname( state_dir ), 'daily' )
+
+Besides the fields of a CDR, the column 'cost' is the total in integer
+micro-cents (see money.py), and 'record' is the whole CDR as JSON.  The
+SQL function dollars() formats micro-cents as dollars and cents.  A CDR
+fetched again replaces the one archived.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import sqlite3
+import urllib.parse
+
+from . import money
+from .keys import cdr_key
+
+ARCHIVE_FILE = 'cdrs.sqlite'
+
+# fields of a CDR with a column of their own
+FIELDS = [ 'date', 'account', 'callerid', 'destination', 'description',
+           'disposition', 'duration', 'seconds', 'rate', 'total',
+           'uniqueid' ]
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS cdrs (
+        key         TEXT PRIMARY KEY,
+        date        TEXT,
+        account     TEXT,
+        callerid    TEXT,
+        destination TEXT,
+        description TEXT,
+        disposition TEXT,
+        duration    TEXT,
+        seconds     INTEGER,
+        rate        TEXT,
+        total       TEXT,
+        uniqueid    TEXT,
+        cost        INTEGER,
+        record      TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS cdrs_date ON cdrs ( date )",
+    "CREATE INDEX IF NOT EXISTS cdrs_account ON cdrs ( account )",
+    "CREATE INDEX IF NOT EXISTS cdrs_callerid ON cdrs ( callerid )",
+    "CREATE INDEX IF NOT EXISTS cdrs_destination ON cdrs ( destination )",
+]
+
+# canned reports: name -> ( description, SQL )
+REPORTS = {
+    'daily': ( "calls, seconds and cost per day",
+        """SELECT substr( date, 1, 10 ) AS day, count(*) AS calls,
+                  sum( seconds ) AS seconds, dollars( sum( cost )) AS cost
+           FROM cdrs GROUP BY day ORDER BY day""" ),
+    'monthly': ( "calls, seconds and cost per month",
+        """SELECT substr( date, 1, 7 ) AS month, count(*) AS calls,
+                  sum( seconds ) AS seconds, dollars( sum( cost )) AS cost
+           FROM cdrs GROUP BY month ORDER BY month""" ),
+    'accounts': ( "calls, seconds and cost per account",
+        """SELECT account, count(*) AS calls, sum( seconds ) AS seconds,
+                  dollars( sum( cost )) AS cost
+           FROM cdrs GROUP BY account ORDER BY account""" ),
+    'destinations': ( "the 20 destinations costing the most",
+        """SELECT destination, count(*) AS calls, sum( seconds ) AS seconds,
+                  dollars( sum( cost )) AS cost
+           FROM cdrs GROUP BY destination
+           ORDER BY sum( cost ) DESC, destination LIMIT 20""" ),
+    'callers': ( "the 20 caller IDs making the most calls",
+        """SELECT callerid, count(*) AS calls, sum( seconds ) AS seconds,
+                  dollars( sum( cost )) AS cost
+           FROM cdrs GROUP BY callerid
+           ORDER BY calls DESC, callerid LIMIT 20""" ),
+    'dispositions': ( "calls and seconds per disposition",
+        """SELECT disposition, count(*) AS calls, sum( seconds ) AS seconds
+           FROM cdrs GROUP BY disposition ORDER BY calls DESC""" ),
+}
+
+
+class BadArchive( Exception ): pass
+
+
+def archive_pathname( state_dir ):
+    """
+    get the pathname of the archive
+
+    Arguments:
+        state directory
+    Returns:
+        pathname
+    Exceptions:
+        BadArchive
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if not state_dir:
+        raise BadArchive( "{0}no state directory to keep the archive in". \
+            format( sprefix ))
+
+    return( os.path.join( state_dir, ARCHIVE_FILE ))
+
+
+def _dollars( units ):
+    """
+    the SQL function dollars().  See money.format_dollars()
+    """
+
+    if units == None:
+        return( None )
+
+    return( money.format_dollars( int( units )))
+
+
+def open_archive( pathname, read_only=False ):
+    """
+    open the archive, creating it if need be
+
+    Arguments:
+        1:  pathname of the archive
+        2:  optional True to open it only for reading.  It has to exist
+    Returns:
+        sqlite3 connection
+    Exceptions:
+        BadArchive
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        if read_only:
+            if not os.path.exists( pathname ):
+                raise BadArchive( "{0}no archive of CDRs in \'{1}\'. Use " \
+                    "--archive first".format( sprefix, pathname ))
+            uri = "file:{0}?mode=ro".format( urllib.parse.quote( pathname ))
+            conn = sqlite3.connect( uri, uri=True )
+        else:
+            os.makedirs( os.path.dirname( pathname ) or '.', exist_ok=True )
+            conn = sqlite3.connect( pathname, timeout=30 )
+            conn.execute( "PRAGMA journal_mode=WAL" )
+            conn.execute( "PRAGMA synchronous=NORMAL" )
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute( statement )
+        conn.create_function( 'dollars', 1, _dollars, deterministic=True )
+    except ( OSError, sqlite3.Error ) as err:
+        raise BadArchive( "{0}can't open archive \'{1}\': {2}". \
+            format( sprefix, pathname, err )) from None
+
+    return( conn )
+
+
+def store( conn, cdrs ):
+    """
+    add CDRs to the archive, in a single transaction
+
+    Arguments:
+        1:  sqlite3 connection from open_archive()
+        2:  iterable of CDR dictionaries
+    Returns:
+        number of CDRs stored
+    Exceptions:
+        BadArchive
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    def rows():
+        for cdr in cdrs:
+            row = [ cdr_key( cdr ) ]
+            for field in FIELDS:
+                row.append( cdr.get( field ))
+            row.append( money.cdr_cost( cdr ))
+            row.append( json.dumps( cdr, sort_keys=True ))
+            yield row
+
+    statement = "INSERT OR REPLACE INTO cdrs ( key, {0}, cost, record ) " \
+        "VALUES ( {1} )".format( ', '.join( FIELDS ),
+                                 ', '.join( [ '?' ] * ( len( FIELDS ) + 3 )))
+
+    try:
+        with conn:
+            cursor = conn.executemany( statement, rows() )
+    except sqlite3.Error as err:
+        raise BadArchive( "{0}can't store CDRs: {1}".format( sprefix, err )) \
+            from None
+
+    return( cursor.rowcount )
+
+
+def query( pathname, sql ):
+    """
+    run a query or canned report against the archive, which is opened
+    only for reading
+
+    Arguments:
+        1:  pathname of the archive
+        2:  SQL, or the name of a canned report in REPORTS
+    Returns:
+        tuple of ( list of column names, list of rows )
+    Exceptions:
+        BadArchive
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if sql in REPORTS:
+        sql = REPORTS[ sql ][1]
+
+    conn = open_archive( pathname, read_only=True )
+    try:
+        cursor = conn.execute( sql )
+        rows = cursor.fetchall()
+        columns = []
+        if cursor.description != None:
+            columns = [ d[0] for d in cursor.description ]
+    except sqlite3.Error as err:
+        raise BadArchive( "{0}query failed: {1}".format( sprefix, err )) \
+            from None
+    finally:
+        conn.close()
+
+    return( columns, rows )
+
+
+def _is_number( value ):
+    """
+    check if the value of a column is a number, or empty
+    """
+
+    if value == None or isinstance( value, ( int, float )):
+        return( True )
+    try:
+        float( value )
+    except ( TypeError, ValueError ):
+        return( False )
+
+    return( True )
+
+
+def report_lines( columns, rows, padding=2 ):
+    """
+    get the results of a query as a table
+
+    Arguments:
+        1:  list of column names
+        2:  list of rows
+        3:  optional number of spaces between columns
+    Returns:
+        list of lines
+    Exceptions:
+        none
+    """
+
+    cells = [ [ '' if v == None else str( v ) for v in row ] for row in rows ]
+    sizes = [ len( c ) for c in columns ]
+    for row in cells:
+        for i, value in enumerate( row ):
+            sizes[i] = max( sizes[i], len( value ))
+
+    # columns of numbers are right-justified
+    numeric = []
+    for i in range( 0, len( columns )):
+        numeric.append( len( rows ) > 0 and
+                        all( _is_number( row[i] ) for row in rows ))
+
+    def line( values ):
+        return( ( ' ' * padding ).join(
+            values[i].rjust( sizes[i] ) if numeric[i] else
+            values[i].ljust( sizes[i] )
+            for i in range( 0, len( columns ))).rstrip() )
+
+    lines = [ line( columns ), line( [ '-' * size for size in sizes ] ) ]
+    for row in cells:
+        lines.append( line( row ))
+
+    return( lines )
@@ -35,7 +35,12 @@ try:
     from config_moxad import config
 
     from .functions import find_config_file, dprint, send_request, BadWebCall
-    from . import globals
+    from .functions import setup_api, api_url, InvalidArgument
+    from .functions import run_program
+    from .transport import redact_url
+    from .phone import canonical, BadNumber
+    from . import context
+    from . import profiling
     from . import __version__
 except ModuleNotFoundError as err:
     sys.stderr.write( "Error: missing module: %s\n" % err )
@@ -57,7 +62,8 @@ except ModuleNotFoundError as err:
 #   none
 
 def usage( values ):
-    print( "usage: {} [options]* caller-id".format( globals.progname ))
+    print( "usage: {} [options]* caller-id". \
+        format( context.current().progname ))
 
     config_file = values.get( 'config-file', '?' )
     did_number  = values.get( 'did-number', '?' )
@@ -78,7 +84,10 @@ def usage( values ):
     [-H|--hangup]           (routing=sys:hangup)
     [-N|--noservice]        (routing=sys:noservice)
     [-V|--version]          (print version of this program)
-    [-X|--delete]           (delete an entry. Also needs --filterid)\
+    [-X|--delete]           (delete an entry. Also needs --filterid)
+    [--profile]             (print a profile of where time and memory went)
+    [--profile-file file]   (--profile, and save cProfile data to file)
+    [--stats]               (print statistics about API calls)\
     """
 
     print( options.format( config_file, did_number, routing, timeout ))
@@ -95,15 +104,16 @@ def usage( values ):
 # Exceptions:
 #   none
 
-def main( argv=sys.argv ):
+def main_program( argv ):
+    ctx = context.current()
     config_file = None
 
     progname = argv[0]
     if progname == None or progname == "":
         progname = 'blacklist'
 
-    globals.progname = progname     # make available to other functions
-    globals.debug_flag = False      # used by functions.debug
+    ctx.progname = progname     # make available to other functions
+    ctx.debug_flag = False      # used by functions.debug
 
     ROUTING_NO_SERVICE   = "noservice"
     ROUTING_BUSY         = "busy"
@@ -173,7 +183,14 @@ def main( argv=sys.argv ):
             elif arg == '-X' or arg == '--delete':
                 delete_flag = True
             elif arg == '-d' or arg == '--debug':
-                globals.debug_flag = True
+                ctx.debug_flag = True
+            elif arg == '--stats':
+                ctx.stats_flag = True
+            elif arg == '--profile':
+                profiling.start()
+            elif arg == '--profile-file':
+                i = i + 1 ;     ctx.profile_file = argv[i]
+                profiling.start()
             elif arg == '-a' or arg == '--all':
                 all_info_flag = True
             elif arg == '-h' or arg == '--help':
@@ -228,6 +245,7 @@ def main( argv=sys.argv ):
 
     # find the config file we really want
 
+    profiling.phase_start( 'config' )
     config_file = find_config_file( config_file ) ;
     if not config_file:
         sys.stderr.write( "{0}: could not find a config file\n". \
@@ -235,7 +253,7 @@ def main( argv=sys.argv ):
         return(1) ;
     dprint( "using config file: " + config_file )
 
-    config.Config.set_debug( globals.debug_flag )
+    config.Config.set_debug( ctx.debug_flag )
 
     # no definitions file.  Our type info is all in our config file.
     try:
@@ -246,6 +264,14 @@ def main( argv=sys.argv ):
 
     dprint( "Config data read OK.  double-plus woohoo." )
 
+    # where and how we talk to the API
+
+    try:
+        setup_api( conf )
+    except InvalidArgument as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
     # make sure we have our mandatory sections
     num_errors = 0
     needed_sections = [ 'authentication', 'black-list' ]
@@ -279,7 +305,7 @@ def main( argv=sys.argv ):
     password = conf.get_values( 'authentication', 'pass' )
 
     dprint( "user\t= {0}".format( userid ))
-    dprint( "pass\t= {0}".format( password ))
+    dprint( "pass\t= *****" )
 
     # values from the config file over-ride any defaults
     keywords = conf.get_keywords( 'black-list' )
@@ -301,12 +327,14 @@ def main( argv=sys.argv ):
 
     timeout = int( values[ 'timeout' ] )   # must exist, because was in defaults
 
+    profiling.phase_end( 'config' )
+
     # build the base URL
 
-    base_url = "https://voip.ms/api/v1/rest.php" + \
+    base_url = api_url() + \
             "?api_username={0}&api_password={1}". \
                 format( userid, password )
-    dprint( "BASE URL = " + base_url )
+    dprint( "BASE URL = " + redact_url( base_url ))
 
     # Need to check if this is an update of one or more items.  if so, we
     # want to preserve the current values if we did not specifically give new
@@ -317,7 +345,7 @@ def main( argv=sys.argv ):
         method = methods[ 'get' ]
 
         url = base_url + "&method={0}&filtering={1}".format( method, filter_id )
-        dprint( "URL for getting OLD data  = " + url )
+        dprint( "URL for getting OLD data  = " + redact_url( url ))
 
         try:
             old_data = send_request( url, timeout )
@@ -377,10 +405,9 @@ def main( argv=sys.argv ):
     # see if DID is given, and if so, format it correctly
 
     if did != None:
-        did = did.replace( '-', '' )        # remove dashes
-        did = did.replace( ' ', '' )        # remove spaces
-
-        if did.isdigit() == False:
+        try:
+            did = canonical( did )
+        except BadNumber:
             sys.stderr.write( "{0}: DID is not numeric: {1}\n". \
                 format( progname, str( did )))
             return(1)
@@ -407,10 +434,9 @@ def main( argv=sys.argv ):
     # see if a callerID was given. If so, clean it up.
 
     if caller_id != None:
-        caller_id = caller_id.replace( '-', '' )        # remove dashes
-        caller_id = caller_id.replace( ' ', '' )        # remove spaces
-        m = re.match( "^\d+$", caller_id )
-        if not m:
+        try:
+            caller_id = canonical( caller_id )
+        except BadNumber:
             sys.stderr.write( "{0}: caller ID must be digits: \'{1}\'.\n". \
                 format( progname, caller_id ))
             return(1)
@@ -478,7 +504,7 @@ def main( argv=sys.argv ):
 
         dprint( "...adding filter ID={0}".format( filter_id )) 
 
-    dprint( "URL = " + url )
+    dprint( "URL = " + redact_url( url ))
 
     try:
         json_struct = send_request( url, timeout )
@@ -498,6 +524,7 @@ def main( argv=sys.argv ):
 
     dprint( "Number of lines is " + str( num_lines ))
 
+    profiling.phase_start( 'render' )
     # print a title if we have some entries
     # get the max size of the notes
     max_note_len = 0
@@ -534,4 +561,19 @@ def main( argv=sys.argv ):
         print( "{0:<12s} {1:<12s} {2:<20s} {3:<10d} {4:s}". \
             format( entry[ 'callerid' ], entry[ 'did' ], entry[ 'routing' ], \
                     int( entry[ 'filtering' ]), entry[ 'note' ] ))
+    profiling.phase_end( 'render' )
+
     return(0)
+
+
+# entry point of the program
+#
+# Arguments:
+#   command-line arguments
+# Returns:
+#   return value of main_program()
+# Exceptions:
+#   none
+
+def main( argv=sys.argv ):
+    return( run_program( main_program, argv ))
@@ -0,0 +1,261 @@
+"""
+cache of responses from the voip.ms API
+
+Responses of API methods given a TTL (time to live) are kept in memory,
+for programs and services making many calls, and on disk in the state
+directory, so separate runs of the programs share them.
+
+  - a response younger than its TTL is returned without calling the API
+  - a response older than its TTL, but within the stale window after
+    it, is returned too, and refreshed from the API in the background
+    (stale-while-revalidate)
+  - anything older is fetched from the API before returning
+
+Programs that change something with the API invalidate the cached
+responses of the methods that would see the change.  See invalidate()
+and methods_changed_by().
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import threading
+import contextvars
+
+from . import transport
+
+CACHE_DIR = 'cache'
+
+FRESH     = 'fresh'
+STALE     = 'stale'
+
+# default TTLs, in seconds, of API methods.  Anything else isn't cached
+DEFAULT_TTLS = {
+    'getDIDsInfo':  300,
+}
+
+# default seconds after the TTL that a stale response can still be used
+DEFAULT_STALE = 600
+
+_memory = {}            # key -> ( time stored, method, response )
+_refreshing = set()     # keys being refreshed in the background
+_lock = threading.Lock()
+
+
+def cache_pathname( state_dir, method, key ):
+    """
+    get the pathname a response is cached in on disk
+
+    Arguments:
+        1:  state directory
+        2:  API method
+        3:  request key
+    Returns:
+        pathname
+    Exceptions:
+        none
+    """
+
+    return( os.path.join( state_dir, CACHE_DIR, "{0}-{1}.json". \
+        format( method, key )))
+
+
+def lookup( url, ttl, stale=0, state_dir=None ):
+    """
+    look for a cached response to a request
+
+    Arguments:
+        1:  URL
+        2:  TTL in seconds
+        3:  optional seconds after the TTL that a response can still be used
+        4:  optional state directory for the disk cache
+    Returns:
+        tuple of ( response, FRESH | STALE ), or ( None, None ) if
+        there is nothing usable
+    Exceptions:
+        none
+    """
+
+    method = transport.request_method( url )
+    key = transport.request_key( url, with_secrets=True )
+    now = time.time()
+
+    with _lock:
+        entry = _memory.get( key )
+
+    if entry == None and state_dir:
+        try:
+            with open( cache_pathname( state_dir, method, key )) as f:
+                saved = json.load( f )
+            entry = ( saved[ 'time' ], method, saved[ 'response' ] )
+            with _lock:
+                _memory[ key ] = entry
+        except ( OSError, ValueError, KeyError ):
+            entry = None
+
+    if entry == None:
+        return( None, None )
+
+    age = now - entry[0]
+    if age < ttl:
+        return( entry[2], FRESH )
+    if age < ttl + stale:
+        return( entry[2], STALE )
+
+    return( None, None )
+
+
+def store( url, response, state_dir=None ):
+    """
+    save a response in the cache
+
+    Arguments:
+        1:  URL
+        2:  response from the API
+        3:  optional state directory for the disk cache
+    Returns:
+        None
+    Exceptions:
+        none.  A failure to write the disk cache is ignored
+    """
+
+    method = transport.request_method( url )
+    key = transport.request_key( url, with_secrets=True )
+    now = time.time()
+
+    with _lock:
+        _memory[ key ] = ( now, method, response )
+
+    if state_dir:
+        pathname = cache_pathname( state_dir, method, key )
+        try:
+            os.makedirs( os.path.dirname( pathname ), exist_ok=True )
+            tmp_pathname = "{0}.{1}.tmp".format( pathname, os.getpid() )
+            with open( tmp_pathname, 'w' ) as f:
+                json.dump( { 'time': now, 'response': response }, f )
+            os.replace( tmp_pathname, pathname )
+        except OSError:
+            pass
+
+    return( None )
+
+
+def refresh_in_background( url, fetch ):
+    """
+    refresh a stale response in a background thread.  Only one refresh
+    of the same request runs at a time.  The thread is not a daemon, so
+    a program finishes the refresh before it exits.  It runs in a copy
+    of the caller's context, so it uses the same settings.
+
+    Arguments:
+        1:  URL
+        2:  function that fetches and stores a fresh response for the URL
+    Returns:
+        True if a refresh was started
+    Exceptions:
+        none
+    """
+
+    key = transport.request_key( url, with_secrets=True )
+    with _lock:
+        if key in _refreshing:
+            return( False )
+        _refreshing.add( key )
+
+    def run():
+        try:
+            fetch()
+        except Exception:
+            pass            # keep serving the stale response
+        finally:
+            with _lock:
+                _refreshing.discard( key )
+
+    threading.Thread( target=contextvars.copy_context().run, args=( run, ),
+                      name="refresh-" + key[ :8 ] ).start()
+
+    return( True )
+
+
+def invalidate( methods=None, state_dir=None ):
+    """
+    throw away cached responses
+
+    Arguments:
+        1:  optional list of API methods.  Default is all of them
+        2:  optional state directory for the disk cache
+    Returns:
+        number of responses thrown away
+    Exceptions:
+        none
+    """
+
+    count = 0
+    with _lock:
+        for key in list( _memory ):
+            if methods == None or _memory[ key ][1] in methods:
+                del _memory[ key ]
+                count = count + 1
+
+    if state_dir:
+        directory = os.path.join( state_dir, CACHE_DIR )
+        try:
+            names = os.listdir( directory )
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith( '.json' ):
+                continue
+            if methods != None and name.split( '-', 1 )[0] not in methods:
+                continue
+            try:
+                os.remove( os.path.join( directory, name ))
+                count = count + 1
+            except OSError:
+                pass
+
+    return( count )
+
+
+def methods_changed_by( method ):
+    """
+    get the API methods whose responses could be changed by calling
+    a method.  eg: setCallerIDFiltering changes getCallerIDFiltering,
+    and anything changing a DID changes getDIDsInfo
+
+    Arguments:
+        API method
+    Returns:
+        list of API methods
+    Exceptions:
+        none
+    """
+
+    if method == None or method.startswith( 'get' ):
+        return( [] )
+
+    changed = []
+    for prefix in [ 'set', 'del', 'add', 'order', 'cancel', 'connect',
+                    'unconnect' ]:
+        if method.startswith( prefix ):
+            changed.append( 'get' + method[ len( prefix ): ] )
+            break
+
+    if 'DID' in method and 'getDIDsInfo' not in changed:
+        changed.append( 'getDIDsInfo' )
+
+    return( changed )
@@ -3,3 +3,21 @@
 FROM_DATE_FLAG    = 0
 TO_DATE_FLAG      = 1
 
+# default endpoint of the voip.ms REST API.
+# Can be over-ridden by the 'api' section of the config file or the
+# VOIP_MS_API_URL environment variable
+
+API_URL           = "https://voip.ms/api/v1/rest.php"
+
+# transports used by send_request() to talk to the API
+
+TRANSPORT_HTTP    = 'http'      # talk to the API
+TRANSPORT_RECORD  = 'record'    # talk to the API and save responses to disk
+TRANSPORT_REPLAY  = 'replay'    # serve previously recorded responses
+
+TRANSPORTS        = [ TRANSPORT_HTTP, TRANSPORT_RECORD, TRANSPORT_REPLAY ]
+
+# returned by send_request( url, if_changed=True ) when the response is
+# the same, byte for byte, as the last one to the same request
+
+UNCHANGED         = 'unchanged'
@@ -0,0 +1,210 @@
+"""
+the settings and state of a run of a program, or of a single call
+
+A Context carries what used to be module-wide globals: the program name,
+the debug flag, the API settings made by functions.setup_api(), the
+default timeout and the HTTP session.  It also holds the state gathered
+during a run: the statistics of API calls (stats.py), the phase times
+(profiling.py) and the rate-limit buckets used when there is no state
+directory (ratelimit.py).  The current context is kept in a
+context variable, so threads and asyncio tasks can each use their own
+without getting in each other's way:
+
+  ctx = Context( progname='my-service', timeout=20 )
+  with use( ctx ):
+      setup_api( conf )
+      json_struct = send_request( url )
+
+Code not running under use() gets a context shared by the whole process,
+which is what the command-line programs use.  functions.run_program()
+gives each run of a program a fresh context, so runs in the same
+process keep their statistics apart.  A copy of a context shares that
+state with the context it was copied from.  cProfile and tracemalloc,
+used by --profile, watch the whole process, so only one run at a time
+should be profiled.
+
+A new thread starts without the context variables of the thread that
+started it, so pass the context along with contextvars.copy_context():
+
+  pool.submit( contextvars.copy_context().run, func, arg )
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import copy
+import contextlib
+import contextvars
+
+# settings of a context, and their defaults
+DEFAULTS = {
+    'progname':         None,
+    'debug_flag':       False,
+    'log_level':        'warning',  # see log.py
+    'log_format':       'text',     # text or json
+    'timeout':          60,         # default timeout of API calls
+    'session':          None,       # HTTP session.  See transport.py
+
+    # set by functions.setup_api()
+    'api_url':          None,       # None means use constants.API_URL
+    'transport':        'http',     # one of constants.TRANSPORTS
+    'transport_dir':    None,       # directory for record/replay transports
+    'json_backend':     'auto',     # decoder of responses.  See decode.py
+
+    # statistics about API calls.  See stats.py
+    'stats_flag':       False,      # print a report when the program is done
+    'stats_file':       None,       # Prometheus textfile to write
+    'statsd':           None,       # host:port of a StatsD daemon
+
+    # profiling with --profile.  See profiling.py
+    'profile_file':     None,       # .prof file to save cProfile data to
+
+    # directory for state shared between runs and processes
+    'state_dir':        None,
+
+    # client-side rate limiting of API calls.  See ratelimit.py
+    'rate_limit':       0,          # calls per second per account.  0 = none
+    'rate_burst':       None,       # maximum burst of calls
+    'method_rate_limits': {},       # API method -> calls per second
+
+    # retrying of failed API calls.  See retry.py
+    'retry_policy':     None,       # None means retry.DEFAULT_POLICY
+
+    # caching of API responses.  See cache.py
+    'cache_ttls':       {},         # API method -> seconds.  Others aren't
+    'cache_stale':      0,          # seconds a stale response can be used
+
+    # digests of the last responses, for send_request( if_changed=True )
+    'response_digests': {},         # request key -> digest of the body
+
+    # state gathered during a run
+    'metrics':          {},         # API method -> statistics.  See stats.py
+    'phases':           {},         # phase -> seconds.  See profiling.py
+    'phase_starts':     {},         # phase -> start time of an open phase
+    'profiler':         None,       # cProfile.Profile of --profile
+    'rate_buckets':     {},         # used by ratelimit.py if no state dir
+}
+
+# state shared by a context and its copies
+SHARED = [ 'metrics', 'phases', 'phase_starts', 'profiler', 'rate_buckets' ]
+
+
+class BadSetting( Exception ): pass
+
+
+class Context:
+    """
+    the settings and state of a run of a program, or of a single call.
+    Each setting in DEFAULTS is an attribute
+
+    Arguments:
+        settings to change from the defaults.  eg: debug_flag=True
+    Exceptions:
+        BadSetting
+    """
+
+    def __init__( self, **settings ):
+        for name, value in DEFAULTS.items():
+            setattr( self, name, copy.copy( value ))
+        self.update( **settings )
+
+    def update( self, **settings ):
+        """
+        change settings
+
+        Arguments:
+            settings.  eg: timeout=30
+        Returns:
+            None
+        Exceptions:
+            BadSetting
+        """
+
+        sprefix = sys._getframe().f_code.co_name + "(): "
+
+        for name, value in settings.items():
+            if name not in DEFAULTS:
+                raise BadSetting( "{0}unknown setting \'{1}\'". \
+                    format( sprefix, name ))
+            setattr( self, name, value )
+
+        return( None )
+
+    def copy( self, **settings ):
+        """
+        get a copy of the context, with its own HTTP session.  The state
+        in SHARED is shared with the copy, not copied
+
+        Arguments:
+            settings to change in the copy
+        Returns:
+            Context
+        Exceptions:
+            BadSetting
+        """
+
+        new = Context()
+        for name in DEFAULTS:
+            if name in SHARED:
+                setattr( new, name, getattr( self, name ))
+            else:
+                setattr( new, name, copy.copy( getattr( self, name )))
+        new.session = None
+        new.update( **settings )
+
+        return( new )
+
+
+_default = Context()
+_current = contextvars.ContextVar( 'voip_ms_context', default=None )
+
+
+def current():
+    """
+    get the current context
+
+    Arguments:
+        none
+    Returns:
+        Context.  The context shared by the process if none is in use
+    Exceptions:
+        none
+    """
+
+    ctx = _current.get()
+    if ctx == None:
+        return( _default )
+
+    return( ctx )
+
+
+@contextlib.contextmanager
+def use( ctx ):
+    """
+    make a context the current one for a block of code
+
+    Arguments:
+        Context
+    Returns:
+        the context, for 'with use( ctx ) as c:'
+    Exceptions:
+        none
+    """
+
+    token = _current.set( ctx )
+    try:
+        yield ctx
+    finally:
+        _current.reset( token )
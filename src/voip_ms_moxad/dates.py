@@ -0,0 +1,173 @@
+"""
+date handling shared by the programs
+
+Dates are YYYY-MM-DD strings, as used by the voip.ms API, and CDR dates
+are YYYY-MM-DD HH:MM:SS in the timezone asked for.  The work is in
+integer arithmetic on days since the epoch, and anything depending only
+on the day is cached, since a lot of CDRs share a few thousand days.
+
+Timezones are given as hours from UTC, like the 'timezone' in the
+config file (eg: -5).  None means the local time of the machine.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import time
+import datetime
+import functools
+
+# YYYY-MM-DD.  The year can be 2 digits and the month and day 1 digit
+DATE_RE = re.compile( r'^(\d{2,4})-(\d{1,2})-(\d{1,2})$' )
+
+SECONDS_PER_DAY = 86400
+EPOCH_ORDINAL = datetime.date( 1970, 1, 1 ).toordinal()
+
+CACHE_SIZE = 8192
+
+
+def is_valid_format( dayt ):
+    """
+    check a date has the format YYYY-MM-DD.  Doesn't check that the
+    month and day exist
+
+    Arguments:
+        date
+    Returns:
+        True or False
+    Exceptions:
+        none
+    """
+
+    return( DATE_RE.match( dayt ) != None )
+
+
+@functools.lru_cache( maxsize=CACHE_SIZE )
+def parse_day( dayt ):
+    """
+    convert a date of format YYYY-MM-DD into a date
+
+    Arguments:
+        date.  A 2-digit year is taken to be 20xx
+    Returns:
+        datetime.date
+    Exceptions:
+        ValueError
+    """
+
+    m = DATE_RE.match( dayt )
+    if m == None:
+        raise ValueError( "bad date: \'{0}\'".format( dayt ))
+
+    year = int( m.group(1) )
+    if year < 100:
+        year = year + 2000
+
+    return( datetime.date( year, int( m.group(2) ), int( m.group(3) )))
+
+
+def utc_offset_seconds( utc_offset ):
+    """
+    convert a timezone in hours from UTC into seconds
+
+    Arguments:
+        hours from UTC.  eg: -5 or '-5' or '5.5'
+    Returns:
+        integer
+    Exceptions:
+        ValueError
+    """
+
+    return( int( round( float( utc_offset ) * 3600 )))
+
+
+@functools.lru_cache( maxsize=CACHE_SIZE )
+def day_start( dayt, utc_offset=None ):
+    """
+    get the seconds since the epoch at the start of a day
+
+    Arguments:
+        1:  date.  YYYY-MM-DD
+        2:  optional hours from UTC of the timezone.  Default is the
+            local time
+    Returns:
+        integer
+    Exceptions:
+        ValueError
+    """
+
+    d = parse_day( dayt )
+    if utc_offset == None:
+        return( int( time.mktime( ( d.year, d.month, d.day, 0, 0, 0, 0, 0,
+                                    -1 ))))
+
+    days = d.toordinal() - EPOCH_ORDINAL
+    return( days * SECONDS_PER_DAY - utc_offset_seconds( utc_offset ))
+
+
+@functools.lru_cache( maxsize=CACHE_SIZE )
+def weekday( dayt ):
+    """
+    get the day of the week of a date
+
+    Arguments:
+        date.  YYYY-MM-DD
+    Returns:
+        0 (Monday) to 6 (Sunday)
+    Exceptions:
+        ValueError
+    """
+
+    return( parse_day( dayt ).weekday() )
+
+
+def today( utc_offset=None ):
+    """
+    get today's date
+
+    Arguments:
+        optional hours from UTC of the timezone.  Default is the local time
+    Returns:
+        date.  YYYY-MM-DD
+    Exceptions:
+        ValueError
+    """
+
+    if utc_offset == None:
+        t = time.localtime()
+    else:
+        t = time.gmtime( time.time() + utc_offset_seconds( utc_offset ))
+
+    return( "{0:04d}-{1:02d}-{2:02d}".format( t[0], t[1], t[2] ))
+
+
+def days_in_range( from_date, to_date ):
+    """
+    get every day in a range
+
+    Arguments:
+        1:  FROM date.  YYYY-MM-DD.  Month and day can be 1 digit
+        2:  TO date
+    Returns:
+        list of days as YYYY-MM-DD
+    Exceptions:
+        ValueError
+    """
+
+    first = parse_day( from_date ).toordinal()
+    last  = parse_day( to_date ).toordinal()
+
+    fromordinal = datetime.date.fromordinal
+    return( [ fromordinal( n ).isoformat() for n in range( first, last + 1 ) ] )
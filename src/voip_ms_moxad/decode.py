@@ -0,0 +1,150 @@
+"""
+decoding of JSON responses from the API
+
+Responses are decoded straight from the bytes of the body, with the
+fastest JSON library installed - orjson, msgspec or ujson - or else
+with the json module of the standard library.  Big getCDR and
+getDIDsInfo responses decode faster with orjson (see
+benchmarks/json_decode.py), which can be installed with:
+
+  pip install voip_ms_moxad[fast-json]
+
+A backend can be picked with 'json-backend' in the 'api' section of
+the config file, or the VOIP_MS_JSON_BACKEND environment variable.
+The default, 'auto', uses the first one installed of BACKENDS.
+
+  json_struct = loads( body )
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import functools
+import importlib
+
+from . import context
+
+BACKEND_AUTO = 'auto'
+
+# in order of preference
+BACKENDS = [ 'orjson', 'msgspec', 'ujson', 'json' ]
+
+
+class BadBackend( Exception ): pass
+
+
+def _msgspec_loads( module ):
+    """
+    get a loads() of msgspec that raises ValueError like the others
+    """
+
+    decoder = module.json.Decoder()
+    errors = module.DecodeError
+
+    def loads( body ):
+        try:
+            return( decoder.decode( body ))
+        except errors as err:
+            raise ValueError( str( err )) from None
+
+    return( loads )
+
+
+@functools.lru_cache( maxsize=None )
+def get_loads( name ):
+    """
+    get the function decoding JSON of a backend
+
+    Arguments:
+        name of a backend in BACKENDS, or 'auto'
+    Returns:
+        tuple of ( name of the backend, function taking bytes or a
+        string and returning the decoded JSON structure.  It raises
+        ValueError if the JSON is bad )
+    Exceptions:
+        BadBackend
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if name == BACKEND_AUTO:
+        for backend in BACKENDS:
+            try:
+                return( get_loads( backend ))
+            except BadBackend:
+                pass
+
+    if name not in BACKENDS:
+        raise BadBackend( "{0}unknown JSON backend \'{1}\'. Must be one " \
+            "of: {2}".format( sprefix, name,
+                              ', '.join( [ BACKEND_AUTO ] + BACKENDS )))
+
+    if name == 'json':
+        return( ( name, json.loads ))
+
+    try:
+        module = importlib.import_module( name )
+    except ImportError:
+        raise BadBackend( "{0}JSON backend \'{1}\' isn't installed". \
+            format( sprefix, name )) from None
+
+    if name == 'msgspec':
+        return( ( name, _msgspec_loads( module )))
+
+    return( ( name, module.loads ))
+
+
+def available():
+    """
+    get the backends that are installed
+
+    Arguments:
+        none
+    Returns:
+        list of names of backends
+    Exceptions:
+        none
+    """
+
+    names = []
+    for name in BACKENDS:
+        try:
+            get_loads( name )
+            names.append( name )
+        except BadBackend:
+            pass
+
+    return( names )
+
+
+def loads( body ):
+    """
+    decode JSON with the backend of the context
+
+    Arguments:
+        JSON as bytes or a string
+    Returns:
+        JSON structure
+    Context:
+        ctx.json_backend
+    Exceptions:
+        BadBackend
+        ValueError
+    """
+
+    name, decoder = get_loads( context.current().json_backend )
+
+    return( decoder( body ))
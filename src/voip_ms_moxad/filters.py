@@ -0,0 +1,137 @@
+"""
+filters of CDRs (Call Display Records)
+
+The filters wanted are compiled once into a single predicate, which is
+applied to each CDR as it is read, so only the matching CDRs are kept
+and printed:
+
+  keep = compile_filter( min_cost=0.10, destination_prefixes=[ '011' ] )
+  cdrs = [ cdr for cdr in json_struct[ 'cdr' ] if keep( cdr ) ]
+
+Only the checks of the filters given are made, cheapest first.  A CDR
+with a field that can't be parsed doesn't match a filter on that field.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+
+from .phone import strip
+from . import money
+
+
+class BadFilter( Exception ): pass
+
+
+def split_list( values ):
+    """
+    split comma-separated values, as given to an option that can be
+    repeated or given a list
+
+    Arguments:
+        list of strings.  eg: [ '011,1900', '1876' ]
+    Returns:
+        list of values, without empty ones.  eg: [ '011', '1900', '1876' ]
+    Exceptions:
+        none
+    """
+
+    result = []
+    for value in values:
+        for v in value.split( ',' ):
+            v = v.strip()
+            if v != "":
+                result.append( v )
+
+    return( result )
+
+
+def compile_filter( min_cost=None, min_seconds=None,
+                    destination_prefixes=None, dispositions=None,
+                    callerid=None ):
+    """
+    compile filters of CDRs into a single predicate
+
+    Arguments:
+        1:  optional minimum cost in dollars (the 'total' field)
+        2:  optional minimum duration in seconds (the 'seconds' field)
+        3:  optional list of prefixes, one of which the 'destination'
+            field has to start with
+        4:  optional list of dispositions, one of which the 'disposition'
+            field has to be.  Case doesn't matter.  eg: answered
+        5:  optional phone number the 'callerid' field has to contain
+    Returns:
+        function taking a CDR dictionary, returning True if it matches
+        all the filters.  None if no filters were given
+    Exceptions:
+        BadFilter
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    checks = []
+
+    # cheapest checks first, so most CDRs are rejected quickly
+
+    if dispositions:
+        wanted = frozenset( d.upper() for d in dispositions )
+        checks.append( lambda cdr: \
+            str( cdr.get( 'disposition', '' )).upper() in wanted )
+
+    if destination_prefixes:
+        prefixes = tuple( strip( p ) for p in destination_prefixes )
+        checks.append( lambda cdr: \
+            str( cdr.get( 'destination', '' )).startswith( prefixes ))
+
+    if callerid:
+        digits = strip( callerid )
+        if digits == "":
+            raise BadFilter( "{0}empty caller ID".format( sprefix ))
+        checks.append( lambda cdr: digits in str( cdr.get( 'callerid', '' )))
+
+    if min_seconds != None:
+        try:
+            min_seconds = int( min_seconds )
+        except ValueError:
+            raise BadFilter( "{0}minimum seconds must be a number: " \
+                "\'{1}\'".format( sprefix, min_seconds )) from None
+        def seconds_check( cdr ):
+            try:
+                return( int( cdr.get( 'seconds', 0 )) >= min_seconds )
+            except ValueError:
+                return( False )
+        checks.append( seconds_check )
+
+    if min_cost != None:
+        try:
+            min_cost = money.parse( min_cost )
+        except ValueError:
+            raise BadFilter( "{0}minimum cost must be a number: \'{1}\'". \
+                format( sprefix, min_cost )) from None
+        def cost_check( cdr ):
+            try:
+                return( money.parse( cdr.get( 'total', 0 )) >= min_cost )
+            except ValueError:
+                return( False )
+        checks.append( cost_check )
+
+    if len( checks ) == 0:
+        return( None )
+
+    if len( checks ) == 1:
+        return( checks[0] )
+
+    checks = tuple( checks )
+    return( lambda cdr: all( check( cdr ) for check in checks ))
@@ -3,11 +3,23 @@ import os
 import re
 import datetime
 import time
-
-from . import globals
+import hashlib
+
+from . import context
+from . import log
+from . import transport
+from . import stats
+from . import profiling
+from . import ratelimit
+from . import retry
+from . import cache
+from . import dates
+from . import decode
 from .constants import FROM_DATE_FLAG, TO_DATE_FLAG 
+from .constants import API_URL, TRANSPORTS, TRANSPORT_HTTP
+from .constants import UNCHANGED
 
-_progname = globals.progname
+_progname = context.current().progname
 if _progname == None:
     _progname = ''
 else:
@@ -16,7 +28,6 @@ else:
 # These modules should already be installed
 try:
     import json
-    import requests
 except Exception as err:
     sys.stderr.write( "{0}{1}\n".format( _progname, err ))
     sys.stderr.write( "{0}use 'pip install' to install missing module\n". \
@@ -31,30 +42,29 @@ class InvalidArgument( Exception ): pass
 class ShouldBeEmpty_String( Exception ): pass
 class InvalidDate( Exception ): pass
 
-def dprint( str ):
+# most requests whose last response is remembered for if_changed.
+# See send_request()
+MAX_RESPONSE_DIGESTS = 256
+
+
+def dprint( fmt, *args ):
     """
-    print debug statement if globals.debug_flag is True
+    print debug statement if ctx.debug_flag is True.  The message is
+    only formatted if it is printed.  See log.py
 
     Arguments:
-        string to print
+        1:  string to print, or a format string for str.format()
+        2:  any arguments of the format string
     Returns:
-        0
+        None
     Exceptions:
         none
-    Globals:
-        globals.debug_flag
-        globals.progname
+    Context:
+        ctx.debug_flag
+        ctx.progname
     """
 
-    if globals.debug_flag == False:
-        return None
-
-    prefix = 'debug: '
-    if globals.progname != None:
-        prefix = prefix + globals.progname + ': '
-
-    print( "{}{}".format ( prefix, str ))
-    return None
+    return( log.debug( fmt, *args ))
 
 
 def find_config_file( config=None ):
@@ -74,16 +84,18 @@ def find_config_file( config=None ):
         config file pathname
     Returns:
         config-file  (could potentially be None)
-    Globals:
-        globals.progname
+    Context:
+        ctx.progname
     Exceptions:
         KeyError
     """
 
+    ctx = context.current()
+
     sprefix = sys._getframe().f_code.co_name + "(): "
     eprefix = sprefix
 
-    progname = globals.progname
+    progname = ctx.progname
     if progname:
         eprefix = "{}: {}".format( progname, sprefix )
 
@@ -136,41 +148,479 @@ def find_config_file( config=None ):
     return( final_config )
 
 
-def send_request( url, timeout=60 ):
+def setup_api( conf=None ):
+    """
+    Set the API endpoint and the transport used to talk to it.
+
+    The values come from the optional 'api' section of the config file:
+        url             = https://voip.ms/api/v1/rest.php
+        transport       = http | record | replay
+        transport-dir   = directory for recorded responses
+        stats-file      = Prometheus textfile to write API statistics to
+        statsd          = host:port of a StatsD daemon to send them to
+        state-dir       = directory for state shared between runs.
+                          Default is $HOME/.voip-ms
+        rate-limit      = API calls per second per account. 0 = no limit
+        rate-burst      = maximum burst of API calls
+        method-rate-limits (hash) = API method -> calls per second
+        retry-attempts  = maximum attempts at an API call
+        retry-backoff   = seconds to wait before the first retry
+        retry-max-backoff = longest wait between attempts
+        retry-jitter    = fraction of each wait that is randomized
+        retry-statuses (array) = HTTP and API statuses worth retrying
+        retry-deadline  = seconds after which to stop retrying
+        cache-ttls (hash) = API method -> seconds to cache responses
+        cache-stale     = seconds after the TTL a response can still be
+                          used while it is refreshed
+    and are over-ridden by the environment variables:
+        VOIP_MS_API_URL
+        VOIP_MS_TRANSPORT
+        VOIP_MS_TRANSPORT_DIR
+        VOIP_MS_JSON_BACKEND
+        VOIP_MS_STATS_FILE
+        VOIP_MS_STATSD
+        VOIP_MS_STATE_DIR
+        VOIP_MS_RATE_LIMIT
+        VOIP_MS_RETRY_ATTEMPTS
+
+    Arguments:
+        config object (can be None)
+    Returns:
+        None
+    Context:
+        ctx.api_url
+        ctx.transport
+        ctx.transport_dir
+        ctx.json_backend
+        ctx.stats_file
+        ctx.statsd
+        ctx.state_dir
+        ctx.rate_limit
+        ctx.rate_burst
+        ctx.method_rate_limits
+        ctx.retry_policy
+        ctx.cache_ttls
+        ctx.cache_stale
+    Exceptions:
+        InvalidArgument
+    """
+
+    ctx = context.current()
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    settings = {
+        'url':              API_URL,
+        'transport':        TRANSPORT_HTTP,
+        'transport-dir':    None,
+        'json-backend':     decode.BACKEND_AUTO,
+        'stats-file':       None,
+        'statsd':           None,
+        'state-dir':        None,
+        'rate-limit':       0,
+        'rate-burst':       None,
+        'method-rate-limits':   {},
+        'retry-attempts':   retry.DEFAULT_POLICY[ 'attempts' ],
+        'retry-backoff':    retry.DEFAULT_POLICY[ 'backoff' ],
+        'retry-max-backoff':    retry.DEFAULT_POLICY[ 'max-backoff' ],
+        'retry-jitter':     retry.DEFAULT_POLICY[ 'jitter' ],
+        'retry-statuses':   retry.DEFAULT_POLICY[ 'statuses' ],
+        'retry-deadline':   retry.DEFAULT_POLICY[ 'deadline' ],
+        'cache-ttls':       dict( cache.DEFAULT_TTLS ),
+        'cache-stale':      cache.DEFAULT_STALE,
+    }
+
+    home = os.environ.get( 'HOME' )
+    if home:
+        settings[ 'state-dir' ] = os.path.join( home, '.voip-ms' )
+
+    if conf != None and 'api' in conf.get_sections():
+        keywords = conf.get_keywords( 'api' )
+        for keyword in settings:
+            if keyword in keywords:
+                settings[ keyword ] = conf.get_values( 'api', keyword )
+                dprint( "{0}\'{1}\' set to \'{2}\' from config file". \
+                    format( sprefix, keyword, settings[ keyword ] ))
+
+    env_vars = {
+        'url':              'VOIP_MS_API_URL',
+        'transport':        'VOIP_MS_TRANSPORT',
+        'transport-dir':    'VOIP_MS_TRANSPORT_DIR',
+        'json-backend':     'VOIP_MS_JSON_BACKEND',
+        'stats-file':       'VOIP_MS_STATS_FILE',
+        'statsd':           'VOIP_MS_STATSD',
+        'state-dir':        'VOIP_MS_STATE_DIR',
+        'rate-limit':       'VOIP_MS_RATE_LIMIT',
+        'retry-attempts':   'VOIP_MS_RETRY_ATTEMPTS',
+    }
+
+    for keyword in env_vars:
+        value = os.environ.get( env_vars[ keyword ] )
+        if value:
+            settings[ keyword ] = value
+            dprint( "{0}\'{1}\' set to \'{2}\' from {3}". \
+                format( sprefix, keyword, value, env_vars[ keyword ] ))
+
+    if settings[ 'transport' ] not in TRANSPORTS:
+        raise InvalidArgument( "{0}unknown transport \'{1}\'. Must be one " \
+            "of: {2}".format( sprefix, settings[ 'transport' ], \
+            ', '.join( TRANSPORTS )))
+
+    if settings[ 'transport' ] != TRANSPORT_HTTP and \
+            not settings[ 'transport-dir' ]:
+        raise InvalidArgument( "{0}transport \'{1}\' needs a transport-dir". \
+            format( sprefix, settings[ 'transport' ] ))
+
+    try:
+        decode.get_loads( settings[ 'json-backend' ] )
+    except decode.BadBackend as err:
+        raise InvalidArgument( str( err )) from None
+
+    # rates can be fractional.  eg: 0.5 is a call every 2 seconds
+    rates = { 'rate-limit': settings[ 'rate-limit' ] }
+    if settings[ 'rate-burst' ] != None:
+        rates[ 'rate-burst' ] = settings[ 'rate-burst' ]
+    for method in settings[ 'method-rate-limits' ]:
+        rates[ method ] = settings[ 'method-rate-limits' ][ method ]
+
+    for name in rates:
+        try:
+            rate = float( rates[ name ] )
+            if rate < 0:
+                raise ValueError()
+        except ValueError:
+            raise InvalidArgument( "{0}rate for \'{1}\' must be a positive " \
+                "number. got \'{2}\'".format( sprefix, name, rates[ name ] )) \
+                from None
+        rates[ name ] = rate
+
+    # a bucket holding less than a token never has one to give
+    if rates.get( 'rate-burst', 1 ) < 1:
+        raise InvalidArgument( "{0}rate-burst must be at least 1. got " \
+            "'{1}'".format( sprefix, settings[ 'rate-burst' ] ))
+
+    ttls = dict( cache.DEFAULT_TTLS )
+    ttls.update( settings[ 'cache-ttls' ] )
+    ttls[ 'cache-stale' ] = settings[ 'cache-stale' ]
+    for name in ttls:
+        try:
+            ttls[ name ] = float( ttls[ name ] )
+            if ttls[ name ] < 0:
+                raise ValueError()
+        except ValueError:
+            raise InvalidArgument( "{0}cache time for \'{1}\' must be a " \
+                "positive number. got \'{2}\'".format( sprefix, name, \
+                ttls[ name ] )) from None
+
+    policy = {}
+    for keyword in [ 'attempts', 'backoff', 'max-backoff', 'jitter',
+                     'deadline' ]:
+        value = settings[ 'retry-' + keyword ]
+        try:
+            policy[ keyword ] = float( value )
+            if policy[ keyword ] < 0:
+                raise ValueError()
+        except ValueError:
+            raise InvalidArgument( "{0}\'retry-{1}\' must be a positive " \
+                "number. got \'{2}\'".format( sprefix, keyword, value )) \
+                from None
+    policy[ 'attempts' ] = int( policy[ 'attempts' ] )
+
+    # numbers are HTTP statuses.  Anything else is an API status
+    policy[ 'statuses' ] = []
+    statuses = settings[ 'retry-statuses' ]
+    if isinstance( statuses, str ):
+        statuses = statuses.split( ',' )
+    for status in statuses:
+        status = str( status ).strip()
+        if status.isdigit():
+            status = int( status )
+        policy[ 'statuses' ].append( status )
+
+    ctx.api_url       = settings[ 'url' ]
+    ctx.transport     = settings[ 'transport' ]
+    ctx.transport_dir = settings[ 'transport-dir' ]
+    ctx.json_backend  = settings[ 'json-backend' ]
+    ctx.stats_file    = settings[ 'stats-file' ]
+    ctx.statsd        = settings[ 'statsd' ]
+    ctx.state_dir     = settings[ 'state-dir' ]
+    ctx.rate_limit    = rates.pop( 'rate-limit' )
+    ctx.rate_burst    = rates.pop( 'rate-burst', None )
+    ctx.method_rate_limits = rates
+    ctx.retry_policy  = policy
+    ctx.cache_stale   = ttls.pop( 'cache-stale' )
+    ctx.cache_ttls    = ttls
+
+    dprint( "{0}using API {1} with the \'{2}\' transport". \
+        format( sprefix, ctx.api_url, ctx.transport ))
+
+    return( None )
+
+
+def api_url():
+    """
+    get the URL of the voip.ms API endpoint
+
+    Arguments:
+        none
+    Returns:
+        URL
+    Context:
+        ctx.api_url
+    Exceptions:
+        none
+    """
+
+    ctx = context.current()
+
+    if ctx.api_url:
+        return( ctx.api_url )
+
+    return( API_URL )
+
+
+def send_attempt( url, timeout, method, if_changed=False ):
+    """
+    make a single attempt at sending a URL to the voip.ms API
+
+    Arguments:
+        1:  URL
+        2:  timeout in seconds
+        3:  API method
+        4:  optional flag.  If True, a successful response that is the
+            same as the last one to the same request isn't parsed, and
+            UNCHANGED is returned instead of the JSON-structure
+    Returns:
+        tuple of ( JSON-structure, HTTP-status, API-status, error ).
+        JSON-structure and API-status are None if the response could
+        not be decoded, in which case error is the exception.
+    Context:
+        ctx.rate_limit
+        ctx.rate_burst
+        ctx.method_rate_limits
+        ctx.state_dir
+        ctx.response_digests
+    Exceptions:
+        BadWebCall
+    """
+
+    ctx = context.current()
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    timings     = {}
+    http_status = None
+    status      = None
+    json_struct = None
+    body        = b''
+    error       = None
+
+    if ctx.rate_limit or ctx.method_rate_limits:
+        try:
+            waited = ratelimit.acquire( transport.request_field( url, \
+                'api_username' ), method, ctx.rate_limit, \
+                ctx.rate_burst, ctx.method_rate_limits, \
+                ctx.state_dir )
+        except ratelimit.RateLimitError as err:
+            raise BadWebCall( "{0}{1}".format( sprefix, err )) from None
+        if waited:
+            dprint( "{0}waited {1:.3f}s for rate limit".format( sprefix, waited ))
+            profiling.add_phase_time( 'throttle', waited )
+
+    start = time.perf_counter()
+    try:
+        http_status, body = transport.fetch( url, timeout, timings )
+        parse_start = time.perf_counter()
+        digest = None
+        if if_changed:
+            key = transport.request_key( url, with_secrets=True )
+            digest = hashlib.blake2b( body, digest_size=16 ).digest()
+        if digest != None and ctx.response_digests.get( key ) == digest:
+            # only successful responses are remembered
+            json_struct = UNCHANGED
+            status = 'success'
+        else:
+            json_struct = decode.loads( body )
+            status = str( json_struct[ 'status' ] )
+            if digest != None and status == 'success':
+                remember_digest( key, digest )
+        timings[ 'parse' ] = time.perf_counter() - parse_start
+    except Exception as err:
+        error = err
+        json_struct = None
+        if http_status != None and http_status != 200:
+            error = "HTTP status {0}".format( http_status )
+    timings[ 'total' ] = time.perf_counter() - start
+
+    profiling.add_phase_time( 'http', timings.get( 'request', 0.0 ) + \
+        timings.get( 'transfer', 0.0 ))
+    profiling.add_phase_time( 'parse', timings.get( 'parse', 0.0 ))
+
+    if error == None and status != 'success':
+        error = status
+
+    stats.record_call( method, timings, http_status, status, len( body ), error )
+
+    return( json_struct, http_status, status, error )
+
+
+def remember_digest( key, digest ):
+    """
+    remember the digest of the last response to a request.  Only the
+    most recent MAX_RESPONSE_DIGESTS requests are remembered
+
+    Arguments:
+        1:  request key.  See transport.request_key()
+        2:  digest of the body of the response
+    Returns:
+        None
+    Context:
+        ctx.response_digests
+    Exceptions:
+        none
+    """
+
+    digests = context.current().response_digests
+
+    digests.pop( key, None )        # so it becomes the most recent
+    digests[ key ] = digest
+    while len( digests ) > MAX_RESPONSE_DIGESTS:
+        del digests[ next( iter( digests )) ]
+
+    return( None )
+
+
+def send_request( url, timeout=None, retry_policy=None, dedup_key=None,
+                  use_cache=True, if_changed=False ):
     """
     send a URL to the voip.ms API
 
+    Responses of API methods with a cache TTL (see cache.py) are served
+    from the cache if they can be.  Successful calls that change
+    something invalidate the cached responses they would change.
+
+    Failed attempts are retried according to the retry policy (see
+    retry.py) if the API method is idempotent, or if a de-duplication
+    key is given.  With a de-duplication key, a call that already
+    succeeded with the same key is not sent again, and the response
+    saved from the earlier call is returned.
+
+    Polling loops can ask for only changed responses.  A response that
+    is byte for byte the same as the last one to the same request isn't
+    parsed, and UNCHANGED is returned, so the caller can skip work it
+    has already done for it.  The cache isn't used, since a poll wants
+    what the API has now.
+
     Arguments:
         1:  URL
-        2:  optional timeout in seconds
+        2:  optional timeout in seconds, for each attempt.  Default is
+            the timeout of the context
+        3:  optional dictionary of retry policy settings, over-riding
+            those from the config file
+        4:  optional de-duplication key
+        5:  optional flag.  If False, don't use a cached response, but
+            still cache the new one
+        6:  optional flag.  If True, return UNCHANGED if the response is
+            the same as the last one to the same request
     Returns:
-        JSON structure
-    Globals:
-        globals.progname
+        JSON structure, or UNCHANGED
+    Context:
+        ctx.progname
+        ctx.timeout
+        ctx.retry_policy
+        ctx.state_dir
+        ctx.cache_ttls
+        ctx.cache_stale
     Exceptions:
         BadWebCall
     """
 
+    ctx = context.current()
+
     sprefix = sys._getframe().f_code.co_name + "(): "
     eprefix = sprefix
 
-    progname = globals.progname
+    progname = ctx.progname
     if progname:
         eprefix = "{}: {}".format( progname, sprefix )
 
     if url == None or url == "":
-        err = "{}URL is undefined or empty string".format( prefix )
+        err = "{}URL is undefined or empty string".format( sprefix )
         raise TypeError( err )
 
-    dprint( "{0}URL = {1}".format( sprefix, url ))
-
-    try:
-        res = requests.get( url, timeout=timeout )
-        json_data = res.text
-        json_struct = json.loads( json_data )
-        status = str( json_struct[ 'status' ] )
-    except Exception as err:
-        raise BadWebCall( "{0}{1}".format( sprefix, err )) from None
+    if log.enabled( log.DEBUG ):
+        dprint( "{0}URL = {1}", sprefix, transport.redact_url( url ))
+
+    if timeout == None:
+        timeout = ctx.timeout
+
+    method = transport.request_method( url )
+    policy = retry.make_policy( ctx.retry_policy, retry_policy )
+
+    ttl = 0
+    if retry.is_idempotent( method ):
+        ttl = float( ctx.cache_ttls.get( method, 0 ))
+
+    if ttl > 0 and use_cache and not if_changed:
+        response, freshness = cache.lookup( url, ttl, ctx.cache_stale, \
+            ctx.state_dir )
+        if freshness == cache.STALE:
+            dprint( "{0}using stale cached response. refreshing it". \
+                format( sprefix ))
+            cache.refresh_in_background( url, lambda: send_request( url, \
+                timeout, retry_policy, use_cache=False ))
+        elif freshness == cache.FRESH:
+            dprint( "{0}using cached response".format( sprefix ))
+        if response != None:
+            return( response )
+
+    if dedup_key != None and ctx.state_dir:
+        try:
+            saved = retry.dedup_lookup( ctx.state_dir, dedup_key )
+        except OSError as err:
+            raise BadWebCall( "{0}{1}".format( sprefix, err )) from None
+        if saved != None:
+            dprint( "{0}already sent with key \'{1}\'. Not sending again". \
+                format( sprefix, dedup_key ))
+            return( saved )
+
+    max_attempts = 1
+    if retry.is_idempotent( method ) or dedup_key != None:
+        max_attempts = max( 1, int( policy[ 'attempts' ] ))
+
+    started = time.monotonic()
+    attempt = 1
+    while True:
+        attempt_timeout = timeout
+        left = retry.time_left( policy, started )
+        if left != None and attempt > 1:
+            attempt_timeout = max( 1, min( timeout, left ))
+
+        json_struct, http_status, status, error = \
+            send_attempt( url, attempt_timeout, method, if_changed )
+
+        if status == 'success':
+            break
+
+        if attempt >= max_attempts:
+            break
+
+        if not retry.is_retryable( policy, http_status, status, error ):
+            break
+
+        wait = retry.delay( policy, attempt + 1 )
+        left = retry.time_left( policy, started )
+        if left != None and wait >= left:
+            dprint( "{0}not retrying. deadline would be passed".format( sprefix ))
+            break
+
+        dprint( "{0}attempt {1} failed ({2}). retrying in {3:.2f}s". \
+            format( sprefix, attempt, error, wait ))
+        time.sleep( wait )
+        attempt = attempt + 1
+
+    if status == None:
+        raise BadWebCall( "{0}{1}".format( sprefix, error )) from None
 
     if status != 'success':
         raise BadWebCall( "{0}Failed status: {1}". \
@@ -178,9 +628,129 @@ def send_request( url, timeout=60 ):
 
     dprint( "{0}status = {1}".format( sprefix, status ))
 
+    if json_struct is UNCHANGED:
+        dprint( "{0}response is unchanged".format( sprefix ))
+        return( UNCHANGED )
+
+    if ttl > 0:
+        cache.store( url, json_struct, ctx.state_dir )
+    else:
+        changed = cache.methods_changed_by( method )
+        if changed:
+            num = cache.invalidate( changed, ctx.state_dir )
+            dprint( "{0}invalidated {1} cached responses of {2}". \
+                format( sprefix, num, ', '.join( changed )))
+
+    if dedup_key != None and ctx.state_dir:
+        try:
+            retry.dedup_record( ctx.state_dir, dedup_key, json_struct )
+        except OSError as err:
+            sys.stderr.write( "{0}could not save key \'{1}\': {2}\n". \
+                format( eprefix, dedup_key, err ))
+
     return( json_struct )
 
 
+def emit_stats():
+    """
+    print and/or emit the statistics gathered about API calls, depending
+    on the --stats option and the stats-file and statsd settings
+
+    Arguments:
+        none
+    Returns:
+        None
+    Context:
+        ctx.stats_flag
+        ctx.stats_file
+        ctx.statsd
+        ctx.progname
+    Exceptions:
+        none
+    """
+
+    ctx = context.current()
+
+    eprefix = ""
+    if ctx.progname:
+        eprefix = ctx.progname + ": "
+
+    if ctx.stats_flag:
+        stats.report()
+
+    if ctx.stats_file:
+        try:
+            stats.write_prometheus( ctx.stats_file )
+        except OSError as err:
+            sys.stderr.write( "{0}could not write stats: {1}\n". \
+                format( eprefix, err ))
+
+    if ctx.statsd:
+        try:
+            stats.send_statsd( ctx.statsd )
+        except ( ValueError, OSError ) as err:
+            sys.stderr.write( "{0}could not send stats: {1}\n". \
+                format( eprefix, err ))
+
+    return( None )
+
+
+def run_program( func, argv ):
+    """
+    run the main program of one of the commands and take care of
+    anything that has to happen when it is done, however it returns.
+    Each run gets a fresh context (see context.py), so programs run at
+    the same time in threads don't share their settings.
+
+    If the main program started profiling for --profile (see
+    profiling.py), it is stopped and reported on here.
+
+    Arguments:
+        1:  main function of the program, taking argv
+        2:  command-line arguments
+    Returns:
+        return value of the main function
+    Context:
+        a new one, current while the main function runs
+    Exceptions:
+        any raised by the main function
+    """
+
+    settings = {}
+    try:
+        level = os.environ.get( 'VOIP_MS_LOG_LEVEL' )
+        if level:
+            log.level_number( level )
+            settings[ 'log_level' ] = level.lower()
+        log_format = os.environ.get( 'VOIP_MS_LOG_FORMAT' )
+        if log_format:
+            if log_format not in log.FORMATS:
+                raise log.BadLogSetting( "unknown log format \'{0}\'. " \
+                    "Must be one of: {1}".format( log_format, \
+                    ', '.join( log.FORMATS )))
+            settings[ 'log_format' ] = log_format
+    except log.BadLogSetting as err:
+        sys.stderr.write( "{0}: {1}\n".format( argv[0], err ))
+        return(1)
+
+    with context.use( context.Context( **settings )) as ctx:
+        stats.reset()
+        profiling.reset_phases()
+
+        try:
+            ret = func( argv )
+        finally:
+            if ctx.profiler != None:
+                try:
+                    profiling.stop( ctx.profile_file )
+                except OSError as err:
+                    sys.stderr.write( "{0}: could not save profile: {1}\n". \
+                        format( argv[0], err ))
+            emit_stats()
+
+    return( ret )
+
+
 def convert_seconds( seconds ):
     """
     Convert seconds into a pretty string of hours, mins and seconds
@@ -246,12 +816,11 @@ def pretty_date( dayt ):
     my_name = sys._getframe().f_code.co_name
 
     try:
-        year, month, day = dayt.split("-")
-    except:
+        d = dates.parse_day( dayt )
+    except ValueError:
         raise InvalidDate( "{0:s}(): Bad date. input was \'{1:s}\'". \
-            format( my_name, dayt ))
+            format( my_name, dayt )) from None
 
-    d =  datetime.date( int(year), int(month), int(day) )
     return( d.strftime("%a %b %d, %Y") )
 
 
@@ -263,7 +832,7 @@ def seconds_since_epoch( dayt ):
     Arguments:
         date of format YYYY-MM-DD
     Returns:
-        string.  eg: 1517720400
+        integer.  eg: 1517720400
     Exceptions:
         InvalidDate
     """
@@ -271,14 +840,10 @@ def seconds_since_epoch( dayt ):
     my_name = sys._getframe().f_code.co_name
 
     try:
-        year, month, day = dayt.split("-")
-        d = datetime.datetime( int(year), int(month), int(day), 0, 0). \
-            strftime('%s')
-    except:
+        return( dates.day_start( dayt ))
+    except ( ValueError, OverflowError ):
         raise InvalidDate( "{}(): Bad date. input was \'{}\'". \
-            format( my_name, dayt ))
-
-    return( d )
+            format( my_name, dayt )) from None
 
 
 def should_be_empty( some_string, msg ):
@@ -29,14 +29,25 @@ import os
 import sys
 try:
     import time
-    import re
 
     from config_moxad import config
 
     from . import __version__
-    from . import globals
+    from . import context
+    from . import profiling
     from .constants import FROM_DATE_FLAG, TO_DATE_FLAG
     from .functions import *
+    from .transport import redact_url
+    from . import analytics
+    from .watch import rules_from_config, watch, BadRule, MIN_INTERVAL
+    from . import rollups
+    from . import dates
+    from . import log
+    from . import money
+    from . import archive
+    from .filters import compile_filter, split_list, BadFilter
+    from .sorting import parse_sort_fields, check_sort_fields, sort_key, \
+        sort_records, BadSortField, DEFAULT_MAX_RECORDS, MIN_MAX_RECORDS
 except ModuleNotFoundError as err:
     sys.stderr.write( "Error: missing module: %s\n" % err )
     sys.exit(1)
@@ -55,7 +66,7 @@ except ModuleNotFoundError as err:
 #   none
 
 def usage( values ):
-    print( "usage: {} [options]*".format( globals.progname ))
+    print( "usage: {} [options]*".format( context.current().progname ))
 
     config_file = values.get( 'config-file', '?' )
     padding     = values.get( 'padding', '?' )
@@ -69,20 +80,129 @@ def usage( values ):
     [-h|--help]            (help)
     [-p|--padding num]     (padding between output fields (default={})
     [-q|--quiet]           (quiet.  No headings and titles)
-    [-r|--reverse]         (reverse date order of CDR output)
+    [-r|--reverse]         (reverse order of CDR output)
     [-s|--sheldon]
     [-t|--to date]         (YYYY-MM-DD - TO date)
     [-w|--timeout  num]    (default={})
+    [-A|--analyze]         (top destinations, heatmap, durations, spikes)
     [-C|--cost]            (total up costs and duration of CDRs)
+    [-S|--summary]         (only --cost, from saved daily rollups)
     [-L|--last-month]      (want CDR records for LAST month)
     [-T|--this-month]      (want CDR records for THIS month)
-    [-V|--version]         (print version of this program)\
+    [-V|--version]         (print version of this program)
+    [-W|--watch]           (watch for new CDRs and send SMS alerts)
+    [--interval num]       (seconds between polls when --watch'ing)
+    [--archive]            (keep the CDRs fetched in the local archive)
+    [--query sql|report]   (query the archive.  Reports are below)
+    [--callerid num]       (only calls with caller ID containing num)
+    [--destination-prefix p]  (only calls to destinations starting with p)
+    [--disposition d]      (only calls of disposition d.  eg: answered)
+    [--min-cost num]       (only calls costing at least num)
+    [--min-seconds num]    (only calls lasting at least num seconds)
+    [--once]               (--watch, but only poll the once)
+    [--sort-by fields]     (sort CDR output by fields.  eg: account,date)
+    [--sort-buffer num]    (CDRs to sort in memory before using temp files)
+    [--top num]            (number of top destinations to --analyze)
+    [--profile]            (print a profile of where time and memory went)
+    [--profile-file file]  (--profile, and save cProfile data to file)
+    [--stats]              (print statistics about API calls)\
     """
 
     print( options.format( config_file, padding, timeout ))
+
+    print( "\n    reports for --query:" )
+    for name in archive.REPORTS:
+        print( "        {0:<15s}({1})".format( name,
+                                             archive.REPORTS[ name ][0] ))
     return(0)
 
 
+# print the total cost and duration of calls, and per account if there
+# is more than one
+#
+# Arguments:
+#   1:  rollup of the totals per account.  See rollups.sum_rollups()
+#   2:  account name asked for.  "" if none
+# Returns:
+#   0
+# Exceptions:
+#   none
+
+def print_costs( totals, account_name ):
+    total_cost     = 0
+    total_duration = 0
+    for account in totals:
+        total_cost = total_cost + totals[ account ][ 'cost' ]
+        total_duration = total_duration + totals[ account ][ 'seconds' ]
+
+    print( "" )
+    print( "Total cost is ${0}".format( money.format_dollars( total_cost )))
+    extra_info = ""
+    if total_duration > 60:
+        extra_info = " ({0:d} seconds)".format( total_duration )
+    print( "Total duration of calls is {0:s}{1:s}". \
+        format( convert_seconds( total_duration ), extra_info ))
+
+    total_accounts = len(list( totals ))
+    if account_name == "" and total_accounts != 1:
+        for account in totals:
+            print( "" )
+            msg = "Total cost of {0:d} calls for account \'{1:s}\'" + \
+                " is ${2}"
+            msg = msg.format( totals[ account ][ 'calls' ], account, \
+                money.format_dollars( totals[ account ][ 'cost' ] ))
+            print( msg )
+
+            extra_info = ""
+            if totals[ account ][ 'seconds' ] > 60:
+                extra_info = " ({0:d} seconds)". \
+                    format( totals[ account ][ 'seconds' ] )
+
+            msg = "Total duration of calls for account \'%s\' is %s%s" % \
+                ( account, convert_seconds( totals[ account ][ 'seconds' ] ), \
+                extra_info )
+            print( msg )
+
+    return(0)
+
+
+# add CDRs to the local archive
+#
+# Arguments:
+#   list of CDRs
+# Returns:
+#   number of CDRs stored
+# Exceptions:
+#   archive.BadArchive
+
+def archive_cdrs( cdrs ):
+    ctx = context.current()
+
+    conn = archive.open_archive( archive.archive_pathname( ctx.state_dir ))
+    try:
+        count = archive.store( conn, cdrs )
+    finally:
+        conn.close()
+
+    dprint( "{0} CDRs stored in the archive", count )
+    return( count )
+
+
+# hand over the records of a list one at a time, removing each from the
+# list, so a consumer like sort_records() holds the only reference to
+# the records it hasn't let go of yet
+#
+# Arguments:
+#   list of records.  Empty when done
+# Returns:
+#   iterator of the records, in order
+
+def drain( records ):
+    records.reverse()
+    while records:
+        yield records.pop()
+
+
 # main program
 #
 # Arguments:
@@ -93,15 +213,16 @@ def usage( values ):
 # Exceptions:
 #   none
 
-def main( argv=sys.argv ):
+def main_program( argv ):
+    ctx = context.current()
     config_file = None
 
     progname = argv[0]
     if progname == None or progname == "":
         progname = 'get-cdrs'
 
-    globals.progname = progname     # make available to other functions
-    globals.debug_flag = False      # used by functions.debug
+    ctx.progname = progname     # make available to other functions
+    ctx.debug_flag = False      # used by functions.debug
 
     # set some defaults
     # These may be over-written by config file values
@@ -123,6 +244,21 @@ def main( argv=sys.argv ):
     reverse_flag    = False
     last_month_flag = False
     this_month_flag = False
+    analyze_flag    = False
+    summary_flag    = False
+    top_n           = 10
+    sort_fields     = None
+    sort_buffer     = DEFAULT_MAX_RECORDS
+    watch_flag      = False
+    once_flag       = False
+    archive_flag    = False
+    query_sql       = None
+    interval        = None
+    min_cost        = None
+    min_seconds     = None
+    callerid        = None
+    destination_prefixes = []
+    dispositions    = []
 
     account_name    = ""
     from_date       = ""
@@ -147,13 +283,81 @@ def main( argv=sys.argv ):
             elif arg == '-t' or arg == '--to':
                 i = i + 1 ;     to_date = argv[i]
             elif arg == '-d' or arg == '--debug':
-                globals.debug_flag = True
+                ctx.debug_flag = True
+            elif arg == '--stats':
+                ctx.stats_flag = True
+            elif arg == '--profile':
+                profiling.start()
+            elif arg == '--profile-file':
+                i = i + 1 ;     ctx.profile_file = argv[i]
+                profiling.start()
             elif arg == '-L' or arg == '--last-month':
                 last_month_flag = True
             elif arg == '-T' or arg == '--this-month':
                 this_month_flag = True
+            elif arg == '-A' or arg == '--analyze':
+                analyze_flag = True
+            elif arg == '--top':
+                i = i + 1
+                try:
+                    top_n = want_a_positive_integer( argv[i], 'top' )
+                    if top_n > analytics.MAX_TOP_N:
+                        raise ValueError( "top can be at most {0}". \
+                            format( analytics.MAX_TOP_N ))
+                except ValueError as err:
+                    sys.stderr.write( "%s: %s\n" % ( progname, err ))
+                    return(1)
+            elif arg == '--sort-by':
+                i = i + 1
+                try:
+                    sort_fields = parse_sort_fields( argv[i] )
+                except BadSortField as err:
+                    sys.stderr.write( "%s: %s\n" % ( progname, err ))
+                    return(1)
+            elif arg == '--sort-buffer':
+                i = i + 1
+                try:
+                    sort_buffer = want_a_positive_integer( argv[i],
+                                                           'sort-buffer' )
+                    if sort_buffer < MIN_MAX_RECORDS:
+                        raise ValueError( "sort-buffer must be at least " \
+                            "{0}".format( MIN_MAX_RECORDS ))
+                except ValueError as err:
+                    sys.stderr.write( "%s: %s\n" % ( progname, err ))
+                    return(1)
+            elif arg == '-W' or arg == '--watch':
+                watch_flag = True
+            elif arg == '--once':
+                watch_flag = True
+                once_flag = True
+            elif arg == '--interval':
+                i = i + 1
+                try:
+                    interval = want_a_positive_integer( argv[i], 'interval' )
+                    if interval < MIN_INTERVAL:
+                        raise ValueError( "interval must be at least {0} " \
+                            "seconds".format( MIN_INTERVAL ))
+                except ValueError as err:
+                    sys.stderr.write( "%s: %s\n" % ( progname, err ))
+                    return(1)
+            elif arg == '--min-cost':
+                i = i + 1 ;     min_cost = argv[i]
+            elif arg == '--min-seconds':
+                i = i + 1 ;     min_seconds = argv[i]
+            elif arg == '--destination-prefix':
+                i = i + 1 ;     destination_prefixes.append( argv[i] )
+            elif arg == '--disposition':
+                i = i + 1 ;     dispositions.append( argv[i] )
+            elif arg == '--archive':
+                archive_flag = True
+            elif arg == '--query':
+                i = i + 1 ;     query_sql = argv[i]
+            elif arg == '--callerid':
+                i = i + 1 ;     callerid = argv[i]
             elif arg == '-C' or arg == '--cost':
                 cost_flag = True
+            elif arg == '-S' or arg == '--summary':
+                summary_flag = True
             elif arg == '-r' or arg == '--reverse':
                 reverse_flag = True
             elif arg == '-q' or arg == '--quiet':
@@ -180,15 +384,26 @@ def main( argv=sys.argv ):
         i = i+1
 
 
+    # the filters wanted, as a single test of each CDR
+
+    try:
+        keep = compile_filter( min_cost, min_seconds, \
+            split_list( destination_prefixes ), split_list( dispositions ), \
+            callerid )
+    except BadFilter as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
     if last_month_flag == True and this_month_flag == True:
         err = "{0}: Don't use both --last-month and --this-month together\n". \
             format( progname )  
         sys.stderr.write( err )
         return(1)
 
-    year  = time.localtime()[0]
-    month = time.localtime()[1]
-    day   = time.localtime()[2]
+    now   = time.localtime()
+    year  = now[0]
+    month = now[1]
+    day   = now[2]
 
     if last_month_flag or this_month_flag:
         try:
@@ -226,16 +441,15 @@ def main( argv=sys.argv ):
 
     # do some sanity checking on the dates
 
-    dates = {
+    given_dates = {
         "FROM":     from_date,
         "TO":       to_date
     }
 
-    dates_list = list( dates )
+    dates_list = list( given_dates )
     for d in dates_list:
-        var = dates[ d ]
-        m = re.match( "^\d{2,4}\-\d{1,2}\-\d{1,2}$", var )
-        if not m:
+        var = given_dates[ d ]
+        if not dates.is_valid_format( var ):
             err = "{0:s}: {1:s} date ({2:s}) has an invalid format\n". \
                 format( progname, d, var )
             sys.stderr.write( err )
@@ -258,6 +472,7 @@ def main( argv=sys.argv ):
 
     # find the config file we really want
 
+    profiling.phase_start( 'config' )
     config_file = find_config_file( config_file ) ;
     if not config_file:
         sys.stderr.write( "{0}: could not find a config file\n". \
@@ -267,7 +482,7 @@ def main( argv=sys.argv ):
 
     # collect our data from the config file
 
-    config.Config.set_debug( globals.debug_flag )
+    config.Config.set_debug( ctx.debug_flag )
 
     # no definitions file.  Our type info is all in our config file.
     try:
@@ -278,6 +493,14 @@ def main( argv=sys.argv ):
 
     dprint( "Config data read ok.  woohoo." )
 
+    # where and how we talk to the API
+
+    try:
+        setup_api( conf )
+    except InvalidArgument as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
     required_keywords = {
         'authentication':   [ 'user', 'pass' ],
         'cdrs':             [ 'order', 'title', 'cdrs-wanted' ],
@@ -295,9 +518,8 @@ def main( argv=sys.argv ):
         else:
             keywords = conf.get_keywords( section )
             for keyword in required_keywords[ section ]:
-                dmsg = "testing existance of keyword \'%s\' in section \'%s\'"
-                dmsg = dmsg % ( keyword, section )
-                dprint( dmsg )
+                dprint( "testing existance of keyword \'{0}\' in section " \
+                    "\'{1}\'", keyword, section )
                 if keyword not in keywords:
                     err = "%s: missing keyword \'%s\' in section \'cdrs\'" + \
                         " in %s\n"
@@ -351,6 +573,23 @@ def main( argv=sys.argv ):
         usage( u_values )
         return(0)
 
+    # answer a query from the local archive, without calling the API
+
+    if query_sql != None:
+        try:
+            columns, rows = archive.query(
+                archive.archive_pathname( ctx.state_dir ), query_sql )
+        except archive.BadArchive as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+            return(1)
+
+        lines = archive.report_lines( columns, rows, padding )
+        if quiet_flag:
+            lines = lines[ 2: ]         # no titles
+        for line in lines:
+            print( line )
+        return(0)
+
     # we know this stuff exists from the above sanity checks so we 
     # don't have to check
 
@@ -361,6 +600,14 @@ def main( argv=sys.argv ):
     titles   = conf.get_values( 'cdrs', 'title' ) ;
     wanted   = conf.get_values( 'cdrs', 'cdrs-wanted' ) ;
 
+    # the timezone is hours from UTC.  eg: -5
+    try:
+        dates.utc_offset_seconds( timezone )
+    except ( TypeError, ValueError ):
+        sys.stderr.write( "{0}: bad timezone: '{1}'. Must be hours from " \
+            "UTC\n".format( progname, timezone ))
+        return(1)
+
     keywords = conf.get_keywords( 'cdrs' )
     got_config_field_sizes_flag = False
     if "field-size" in keywords:
@@ -373,14 +620,15 @@ def main( argv=sys.argv ):
 
     for field in fields:
         if field not in titles:
-            dmsg = "Did not find title for \'%s\' in fields we want" % field
-            dprint( dmsg )
+            dprint( "Did not find title for \'{0}\' in fields we want", field )
             titles[ field ] = field.capitalize()
 
+    profiling.phase_end( 'config' )
+
     dprint( "FROM date = " + from_date )
     dprint( "TO   date = " + to_date )
-    dprint( "USER = \'{0:s}\' PASS = \'{1:s}\' TIMEZONE = {2:s}". \
-        format( userid, password, timezone ))
+    dprint( "USER = \'{0:s}\' PASS = \'*****\' TIMEZONE = {1:s}". \
+        format( userid, timezone ))
 
     # Build up which type of CDRs we want
 
@@ -401,13 +649,196 @@ def main( argv=sys.argv ):
     # put the URL all together
 
     # build the URL 
-    url = "https://voip.ms/api/v1/rest.php" + \
+    url = api_url() + \
             "?api_username={0:s}&api_password={1:s}&method={2:s}" \
             "&date_from={3:s}&date_to={4:s}&{5:s}&timezone={6:s}". \
                 format( userid, password, method, from_date, to_date, \
                 cdrs_wanted, timezone )
 
-    dprint( "URL = \'" + url + "\'" )
+    dprint( "URL = \'" + redact_url( url ) + "\'" )
+
+    # watch today's CDRs, alerting on any breaking the rules, until killed
+
+    if watch_flag:
+        try:
+            rules = rules_from_config( conf )
+        except BadRule as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+            return(1)
+        if interval != None:
+            rules[ 'interval' ] = interval
+
+        base_url = api_url() + "?api_username={0:s}&api_password={1:s}". \
+            format( userid, password )
+        cdr_url = lambda day: base_url + "&method={0:s}&date_from={1:s}" \
+            "&date_to={1:s}&{2:s}&timezone={3:s}". \
+            format( method, day, cdrs_wanted, timezone )
+
+        try:
+            watch( cdr_url, base_url, rules, timeout, timezone, once_flag )
+        except BadWebCall as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+            return(1)
+        except KeyboardInterrupt:
+            pass
+        return(0)
+
+    # rollups of days that are over are saved, keyed by what was asked for
+
+    rollup_key = rollups.query_key( userid, cdrs_wanted, timezone )
+    today = min( dates.today(), dates.today( timezone ))
+    days = dates.days_in_range( from_date, to_date )
+
+    # a cost summary only needs the CDRs of days without a saved rollup.
+    # Rollups have the totals of all the CDRs, so filters need every CDR.
+    # Without a state directory, nothing is saved
+
+    if summary_flag:
+        profiling.phase_start( 'aggregate' )
+        daily = {}
+        missing = []
+        for day in days:
+            rollup = None
+            if keep == None and ctx.state_dir:
+                rollup = rollups.load( ctx.state_dir, rollup_key, day )
+            if rollup == None:
+                missing.append( day )
+            else:
+                daily[ day ] = rollup
+        dprint( "{0:d} days of rollups saved. {1:d} days to fetch". \
+            format( len( daily ), len( missing )))
+
+        for first, last in rollups.missing_ranges( missing ):
+            range_url = api_url() + \
+                "?api_username={0:s}&api_password={1:s}&method={2:s}" \
+                "&date_from={3:s}&date_to={4:s}&{5:s}&timezone={6:s}". \
+                format( userid, password, method, first, last, \
+                cdrs_wanted, timezone )
+            try:
+                json_struct = send_request( range_url, timeout )
+                cdrs = json_struct.get( 'cdr', [] )
+            except BadWebCall as err:
+                if "no_cdr" not in str( err ):
+                    sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+                    return(1)
+                cdrs = []
+
+            if archive_flag:
+                try:
+                    archive_cdrs( cdrs )
+                except archive.BadArchive as err:
+                    sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+                    return(1)
+
+            fetched = rollups.build_rollups( cdrs )
+            range_days = dates.days_in_range( first, last )
+            if ctx.state_dir:
+                rollups.save_finished_days( ctx.state_dir, rollup_key, \
+                    range_days, fetched, today )
+            if keep != None:
+                fetched = rollups.build_rollups( filter( keep, cdrs ))
+            for day in range_days:
+                daily[ day ] = fetched.get( day, {} )
+
+        totals = rollups.sum_rollups( daily.values() )
+        profiling.phase_end( 'aggregate' )
+
+        if quiet_flag == False:
+            num_cdrs = sum( totals[ a ][ 'calls' ] for a in totals )
+            print( "{0:d} CDR records found from {1:s} to {2:s}". \
+                format( num_cdrs, pretty_date( from_date ), \
+                pretty_date( to_date )))
+        print_costs( totals, account_name )
+        return(0)
+
+    # an analysis is built per day and the days merged, fetching at most
+    # DAYS_PER_FETCH days of CDRs at a time, so only those are held.  The
+    # analyses of days that are over are saved and not fetched again,
+    # unless filters leave some CDRs out
+
+    if analyze_flag:
+        profiling.phase_start( 'aggregate' )
+        analysis_key = rollups.query_key( userid, cdrs_wanted, timezone,
+                                          top_n )
+        save_flag = keep == None and bool( ctx.state_dir )
+        analysis = analytics.new_analysis( top_n )
+        missing = []
+        for day in days:
+            saved = None
+            if save_flag:
+                saved = analytics.load_day( ctx.state_dir, analysis_key, day )
+            if saved == None:
+                missing.append( day )
+            else:
+                analytics.merge_analysis( analysis, saved )
+        dprint( "{0:d} days of analyses saved. {1:d} days to fetch". \
+            format( len( days ) - len( missing ), len( missing )))
+
+        for first, last in rollups.missing_ranges( missing,
+                                                   analytics.DAYS_PER_FETCH ):
+            range_url = api_url() + \
+                "?api_username={0:s}&api_password={1:s}&method={2:s}" \
+                "&date_from={3:s}&date_to={4:s}&{5:s}&timezone={6:s}". \
+                format( userid, password, method, first, last, \
+                cdrs_wanted, timezone )
+            try:
+                json_struct = send_request( range_url, timeout )
+                cdrs = json_struct.get( 'cdr', [] )
+            except BadWebCall as err:
+                if "no_cdr" not in str( err ):
+                    sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+                    return(1)
+                json_struct = None
+                cdrs = []
+
+            if archive_flag:
+                try:
+                    archive_cdrs( cdrs )
+                except archive.BadArchive as err:
+                    sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+                    return(1)
+
+            by_day = {}
+            for cdr in cdrs:
+                if keep != None and keep( cdr ) == False:
+                    continue
+                day = str( cdr.get( 'date', '' ))[ :10 ]
+                day_analysis = by_day.get( day )
+                if day_analysis == None:
+                    day_analysis = analytics.new_analysis( top_n )
+                    by_day[ day ] = day_analysis
+                analytics.add_cdr( day_analysis, cdr )
+
+            # let go of these CDRs before fetching the next days
+            json_struct = None
+            cdrs = None
+
+            if save_flag:
+                for day in dates.days_in_range( first, last ):
+                    if day < today:
+                        analytics.save_day( ctx.state_dir, analysis_key, day,
+                            by_day.get( day, analytics.new_analysis( top_n )))
+            for day_analysis in by_day.values():
+                analytics.merge_analysis( analysis, day_analysis )
+
+        results = analytics.finish( analysis )
+        profiling.phase_end( 'aggregate' )
+
+        if results[ 'num-cdrs' ] == 0:
+            print( "No CDR records were found from {0:s} to {1:s}". \
+                format( pretty_date( from_date ), pretty_date( to_date )))
+            return(0)
+
+        if quiet_flag == False:
+            print( "{0:d} CDR records found from {1:s} to {2:s}\n". \
+                format( results[ 'num-cdrs' ], pretty_date( from_date ), \
+                pretty_date( to_date )))
+
+        profiling.phase_start( 'render' )
+        sys.stdout.write( '\n'.join( analytics.report_lines( results )) +
+                          '\n' )
+        profiling.phase_end( 'render' )
+        return(0)
 
     try:
         json_struct = send_request( url, timeout )
@@ -440,14 +871,40 @@ def main( argv=sys.argv ):
 
     dprint( 'status = ' + status )
 
+    cdrs = json_struct.get( 'cdr', [] )
+    if archive_flag:
+        try:
+            archive_cdrs( cdrs )
+        except archive.BadArchive as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+            return(1)
+
+    # keep only the CDRs we want
+
+    if keep != None:
+        cdrs = [ cdr for cdr in cdrs if keep( cdr ) ]
+
+    # the costs are added up now, since a sort hands over the CDRs
+
+    totals = None
+    if cost_flag == True:
+        totals = rollups.sum_rollups( rollups.build_rollups( cdrs ).values() )
+
     # get number of CDRs returned
 
-    num_cdrs = len( json_struct[ 'cdr' ] )
+    num_cdrs = len( cdrs )
     dprint( "Number of CDRs found is " + str( num_cdrs ))
     if num_cdrs == 0:
         print( "No CDR records were found" )
         return(0)
 
+    if sort_fields != None:
+        try:
+            check_sort_fields( sort_fields, cdrs[0] )
+        except BadSortField as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+            return(1)
+
     if quiet_flag == False:
         print( "{0:d} CDR records found from {1:s} to {2:s}\n". \
             format( num_cdrs, pretty_date( from_date ), pretty_date( to_date )))
@@ -456,31 +913,28 @@ def main( argv=sys.argv ):
     # the config did not provide us with the size of output field.  So grab all
     # the data and cache it for later printing while we get the maximum lengths
 
+    profiling.phase_start( 'aggregate' )
+    # check for debugging once, not for every field of every CDR
+    debugging = log.enabled( log.DEBUG )
+
+    # a sort takes the CDRs themselves, so no copies are kept
+
     data_sizes = {}
     data = []
-    for i in range( 0, num_cdrs ):
-        cdr_keys = list( json_struct[ 'cdr' ][ i ] )
-        data.append( {} )
-        for cdr_key in cdr_keys:
-            value = json_struct[ 'cdr' ][ i ][ cdr_key ]
-            data[i][ cdr_key ] = value      # save the data
-
+    for cdr in cdrs:
+        if sort_fields == None:
+            data.append( dict( cdr ))       # save the data
+        for cdr_key, value in cdr.items():
             # get and save the maximum length
             # add padding spaces between fields
             data_len = len( value ) + padding   
-            if cdr_key not in data_sizes:
-                data_sizes[ cdr_key ] = data_len
-
-                dmsg = "\'%s\' initialized to size %d because of size of data"
-                dmsg = dmsg % ( cdr_key, data_len )
-                dprint( dmsg )
-
-            if data_len > data_sizes[ cdr_key ]:
+            size = data_sizes.get( cdr_key )
+            if size == None or data_len > size:
                 data_sizes[ cdr_key ] = data_len
-
-                dmsg = "\'%s\' given size %d because of size of data" % \
-                    ( cdr_key, data_len )
-                dprint( dmsg )
+                if debugging:
+                    dprint( "\'{0}\' {1} size {2} because of size of data",
+                        cdr_key, 'initialized to' if size == None else 'given',
+                        data_len )
 
     # now see if the titles being used exceed the max length of the data used.
     # If so, increase to accomodate the title length
@@ -490,8 +944,8 @@ def main( argv=sys.argv ):
         title_len = len( titles[ field ] ) + padding      
         if title_len > data_sizes[ field ]:
             data_sizes[ field ] = title_len
-            dprint( "\'{0:s}\' given size {1:d} because of size of title". \
-                format( field, title_len ))
+            dprint( "\'{0:s}\' given size {1:d} because of size of title",
+                field, title_len )
 
     # now see if the config file specified an exact size to use
     # which over-rides the lengths we just created as defaults
@@ -503,15 +957,16 @@ def main( argv=sys.argv ):
             # the padding
             if config_len > len( titles[ field ] ) + padding:
                 data_sizes[ field ] = config_len
-                dmsg = "\'%s\' given size %d because of size of config-file"
-                dmsg = dmsg % ( field, config_len )
+                dprint( "\'{0}\' given size {1} because of size of " \
+                    "config-file", field, config_len )
             else:
-                dmsg = "\'%s\' can't set size of %d from config-file" + \
-                       " because no room for title"
-                dmsg = dmsg % ( field, config_len )
-            dprint( dmsg )
+                dprint( "\'{0}\' can't set size of {1} from config-file " \
+                    "because no room for title", field, config_len )
+
+    profiling.phase_end( 'aggregate' )
 
     # now build the titles
+    profiling.phase_start( 'render' )
     full_title      = 'call#' ;
     full_dash_title = '-----' ;
 
@@ -533,15 +988,23 @@ def main( argv=sys.argv ):
 
     # now print the records
 
-    if reverse_flag == True:
-        data = list( reversed( data ))
+    # a sort spills to temporary files if there are more than sort_buffer
+    # CDRs.  The response is let go of and the CDRs are handed over one
+    # at a time, so the ones spilled are freed.  Without a sort,
+    # --reverse reverses in place rather than copying
+
+    if sort_fields != None:
+        del json_struct
+        data = sort_records( drain( cdrs ), sort_key( sort_fields ),
+                             reverse_flag, sort_buffer )
+    elif reverse_flag == True:
+        data.reverse()
 
-    cdr_keys = list( json_struct[ 'cdr' ][ 0 ] )    # just do it once
     count = 1
-    for i in range(0, num_cdrs ):
+    for record in data:
         cdr_record = "{0:-5d}".format( count )
         for field in fields:
-            f = data[i][ field ]
+            f = record[ field ]
             size = data_sizes[ field ]
 
             # See if we have to truncate the data.  This could happen if
@@ -558,58 +1021,22 @@ def main( argv=sys.argv ):
         print( cdr_record )
         count = count + 1
 
+    profiling.phase_end( 'render' )
+
     if cost_flag == True:
-        accounts_duration = {}
-        accounts_costs    = {}
-        accounts_calls    = {}
-        total_cost        = 0
-        total_duration    = 0
-
-        for i in range( 0, num_cdrs ):
-            if 'account' in data[i]:
-                account = data[i]['account']
-                if account not in accounts_calls:
-                    # initialize stuff
-                    accounts_calls[ account ]    = 1
-                    accounts_costs[ account ]    = float( data[i]['total'] )
-                    accounts_duration[ account ] = int( data[i]['seconds'] )
-                else:
-                    accounts_calls[ account ] = accounts_calls[ account ] + 1
-                    accounts_costs[ account ] = accounts_costs[ account ] + \
-                        float( data[i]['total'] )
-                    accounts_duration[ account ] = \
-                        accounts_duration[ account ] + int( data[i]['seconds'] )
-
-        for account in accounts_calls:
-            total_cost = total_cost + accounts_costs[ account ]
-            total_duration = total_duration + accounts_duration[ account ]
-
-        print( "" )
-        print( "Total cost is ${0:.2f}".format( total_cost ))
-        extra_info = ""
-        if total_duration > 60:
-            extra_info = " ({0:d} seconds)".format( total_duration )
-        print( "Total duration of calls is {0:s}{1:s}". \
-            format( convert_seconds( total_duration ), extra_info ))
-
-        total_accounts = len(list( accounts_calls ))
-        if account_name == "" and total_accounts != 1:
-            for account in accounts_calls:
-                print( "" )
-                msg = "Total cost of {0:d} calls for account \'{1:s}\'" + \
-                    " is ${2:.2f}"
-                msg = msg.format( accounts_calls[ account ], account, \
-                    accounts_costs[ account ] )
-                print( msg )
-
-                extra_info = ""
-                if accounts_duration[ account ] > 60:
-                    extra_info = " ({0:d} seconds)". \
-                        format( accounts_duration[ account ] )
-
-                msg = "Total duration of calls for account \'%s\' is %s%s" % \
-                    ( account, convert_seconds( accounts_duration[ account ] ), \
-                    extra_info )
-                print( msg )
+        print_costs( totals, account_name )
 
     return(0)
+
+
+# entry point of the program
+#
+# Arguments:
+#   command-line arguments
+# Returns:
+#   return value of main_program()
+# Exceptions:
+#   none
+
+def main( argv=sys.argv ):
+    return( run_program( main_program, argv ))
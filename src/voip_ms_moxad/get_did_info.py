@@ -28,11 +28,21 @@ import os
 import sys
 try:
     import json
+    import concurrent.futures
+    import contextvars
 
     from config_moxad import config
 
     from .functions import find_config_file, dprint, send_request, BadWebCall
-    from . import globals
+    from .functions import setup_api, api_url, InvalidArgument
+    from .functions import run_program
+    from .transport import redact_url
+    from .phone import canonical, BadNumber
+    from .inventory import build_inventory, query, lookup, account_of
+    from .inventory import parse_where, BadQuery
+    from .render import write_records, field_order, FORMATS, FORMAT_TEXT
+    from . import context
+    from . import profiling
     from . import __version__
 except ModuleNotFoundError as err:
     sys.stderr.write( "Error: missing module: %s\n" % err )
@@ -51,7 +61,7 @@ except ModuleNotFoundError as err:
 #   none
 
 def usage( values ):
-    print( "usage: {} [options]*".format( globals.progname ))
+    print( "usage: {} [options]*".format( context.current().progname ))
 
 
     config_file = values.get( 'config-file', '?' )
@@ -61,17 +71,120 @@ def usage( values ):
     [-a|--all]             (all info about DID(s))
     [-c|--config file]     (config-file. (default={})
     [-d|--debug]           (debugging output)
+    [-f|--format fmt]      (text, json, jsonl or csv. default=text)
     [-h|--help]            (help)
     [-l|--line phone-num]  (DID-number)
+    [-L|--lines-from file] (DID-numbers, one per line. '-' for stdin)
+    [-r|--refresh]         (don't use cached DID info)
     [-t|--timeout num]     (default={})
+    [-w|--where field=val] (only DIDs with field=val. Can be repeated)
     [-A|--account]         (print (sub)account name(s) instead of DID)
-    [-V|--version]         (print version of this program)\
+    [-V|--version]         (print version of this program)
+    [--profile]            (print a profile of where time and memory went)
+    [--profile-file file]  (--profile, and save cProfile data to file)
+    [--stats]              (print statistics about API calls)\
     """
 
     print( options.format( config_file, timeout ))
     return(0)
 
 
+# Lists of DIDs no bigger than this are looked up with concurrent
+# per-DID requests.  Anything bigger fetches the whole inventory once.
+
+MAX_CONCURRENT_LOOKUPS = 8
+
+
+# read a list of DIDs, one per line, ignoring blank lines and comments
+#
+# Arguments:
+#   pathname, or '-' for stdin
+# Returns:
+#   list of DIDs, digits only, in the order given
+# Exceptions:
+#   OSError
+#   InvalidArgument
+
+def read_dids( pathname ):
+    if pathname == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open( pathname ) as f:
+            lines = f.readlines()
+
+    dids = []
+    for line_num, line in enumerate( lines, 1 ):
+        line = line.split( '#', 1 )[0]
+        did = line.strip()
+        if did == "":
+            continue
+        try:
+            dids.append( canonical( did ))
+        except BadNumber:
+            raise InvalidArgument( "{0}: line {1}: DID is not numeric: {2}". \
+                format( pathname, line_num, did )) from None
+
+    return( dids )
+
+
+# look up a list of DIDs.  A small list is looked up with concurrent
+# per-DID requests.  Otherwise the whole inventory is fetched once and
+# every DID is answered from its index.
+#
+# Arguments:
+#   1:  URL for getDIDsInfo, without any DID
+#   2:  list of DIDs
+#   3:  timeout
+#   4:  flag to use cached responses
+# Returns:
+#   dictionary of DID -> info about the DID.  DIDs not found are missing
+# Exceptions:
+#   BadWebCall
+
+def lookup_dids( url, wanted, timeout, use_cache ):
+    found = {}
+    unique = list( dict.fromkeys( wanted ))
+
+    if len( unique ) > MAX_CONCURRENT_LOOKUPS:
+        dprint( "looking up {0} DIDs from the full inventory". \
+            format( len( unique )))
+        json_struct = send_request( url, timeout, use_cache=use_cache )
+        inv = build_inventory( json_struct.get( 'dids', [] ))
+        for did in unique:
+            did_info = lookup( inv, did )
+            if did_info != None:
+                found[ did ] = did_info
+        return( found )
+
+    dprint( "looking up {0} DIDs with separate requests".format( len( unique )))
+
+    def lookup_one( did ):
+        try:
+            json_struct = send_request( url + "&did={0}".format( did ), \
+                timeout, use_cache=use_cache )
+        except BadWebCall as err:
+            if "invalid_did" in str( err ):
+                return( None )
+            raise
+        for did_info in json_struct.get( 'dids', [] ):
+            if str( did_info.get( 'did' )) == did:
+                return( did_info )
+        return( None )
+
+    # each lookup runs in a copy of our context, so it has our settings
+
+    with concurrent.futures.ThreadPoolExecutor( \
+            max_workers=max( 1, len( unique ))) as pool:
+        futures = [ pool.submit( contextvars.copy_context().run, \
+                    lookup_one, did ) for did in unique ]
+        for did, future in zip( unique, futures ):
+            did_info = future.result()
+            if did_info != None:
+                found[ did ] = did_info
+
+    return( found )
+
+
 # main program
 #
 # Arguments:
@@ -82,19 +195,24 @@ def usage( values ):
 # Exceptions:
 #   none
 
-def main( argv=sys.argv ):
+def main_program( argv ):
+    ctx = context.current()
     progname = argv[0]
     if progname == None or progname == "":
         progname = 'get-did-info'
 
-    globals.progname = progname     # make available to other functions
-    globals.debug_flag = False      # used by functions.debug
+    ctx.progname = progname     # make available to other functions
+    ctx.debug_flag = False      # used by functions.debug
 
     # set some defaults
 
     all_info_flag = False
     account_flag  = False
     help_flag     = False
+    refresh_flag  = False
+    conditions    = []            # list of ( field, value ) from --where
+    lines_from    = None          # file of DIDs to look up
+    out_format    = FORMAT_TEXT
     method        = 'getDIDsInfo'
     config_file   = None
 
@@ -123,12 +241,36 @@ def main( argv=sys.argv ):
                 i = i + 1 ;     config_file = argv[i]
             elif arg == '-l' or arg == '--line':
                 i = i + 1 ;     values[ 'did' ] = argv[i]
+            elif arg == '-f' or arg == '--format':
+                i += 1 ;        out_format = argv[i]
+                if out_format not in FORMATS:
+                    sys.stderr.write( "{0}: format must be one of: {1}\n". \
+                        format( progname, ', '.join( FORMATS )))
+                    return(1)
+            elif arg == '-L' or arg == '--lines-from':
+                i += 1 ;        lines_from = argv[i]
+            elif arg == '-w' or arg == '--where':
+                i += 1
+                try:
+                    conditions.append( parse_where( argv[i] ))
+                except BadQuery as err:
+                    sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+                    return(1)
+            elif arg == '-r' or arg == '--refresh':
+                refresh_flag = True
             elif arg == '-A' or arg == '--account':
                 account_flag = True
             elif arg == '-t' or arg == '--timeout':
                 i += 1 ;        values[ 'timeout' ] = argv[i]
             elif arg == '-d' or arg == '--debug':
-                globals.debug_flag = True
+                ctx.debug_flag = True
+            elif arg == '--stats':
+                ctx.stats_flag = True
+            elif arg == '--profile':
+                profiling.start()
+            elif arg == '--profile-file':
+                i = i + 1 ;     ctx.profile_file = argv[i]
+                profiling.start()
             elif arg == '-a' or arg == '--all':
                 all_info_flag = True
             elif arg == '-h' or arg == '--help':
@@ -149,8 +291,14 @@ def main( argv=sys.argv ):
 
         i = i+1
 
+    if lines_from != None and 'did' in values:
+        err = "Don't use both --line and --lines-from"
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
     # find the config file we really want
 
+    profiling.phase_start( 'config' )
     config_file = find_config_file( config_file ) ;
     if not config_file:
         sys.stderr.write( "{0}: could not find a config file\n". \
@@ -158,7 +306,7 @@ def main( argv=sys.argv ):
         return(1) ;
     dprint( "using config file: " + config_file )
 
-    config.Config.set_debug( globals.debug_flag )
+    config.Config.set_debug( ctx.debug_flag )
 
     # no definitions file.  Our type info is all in our config file.
     try:
@@ -169,6 +317,14 @@ def main( argv=sys.argv ):
 
     dprint( "Config data read ok.  woohoo." )
 
+    # where and how we talk to the API
+
+    try:
+        setup_api( conf )
+    except InvalidArgument as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
     # make sure we have our mandatory sections
     num_errors = 0
     needed_sections = [ 'authentication' ]
@@ -200,10 +356,12 @@ def main( argv=sys.argv ):
     password = conf.get_values( 'authentication', 'pass' )
 
     dprint( "user\t= {0}".format( userid ))
-    dprint( "pass\t= {0}".format( password ))
+    dprint( "pass\t= *****" )
 
     # values from the config file over-ride any defaults
-    keywords = conf.get_keywords( 'info' )
+    keywords = []
+    if 'info' in conf.get_sections():
+        keywords = conf.get_keywords( 'info' )
     for keyword in keywords:
         type_ = conf.get_type( 'info', keyword )
         if type_ == 'scalar':
@@ -240,13 +398,22 @@ def main( argv=sys.argv ):
     # see if DID is given, and if so, format it correctly
 
     did = values[ 'did' ]
+    if lines_from != None:
+        did = None
+
+        try:
+            wanted = read_dids( lines_from )
+        except ( OSError, InvalidArgument ) as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+            return(1)
+        dprint( "read {0} DIDs from {1}".format( len( wanted ), lines_from ))
+
     if did:
         dprint( "DID number was given as a command-line option: {0}". \
             format( did ))
-        did = did.replace( '-', '' )        # remove dashes
-        did = did.replace( ' ', '' )        # remove spaces
-
-        if did.isdigit() == False:
+        try:
+            did = canonical( did )
+        except BadNumber:
             sys.stderr.write( "{0}: DID is not numeric: {1}\n". \
                 format( progname, str(did)))
             return(1)
@@ -256,80 +423,141 @@ def main( argv=sys.argv ):
     if did:
         dprint( "Final DID number being used is {0}".format( did ))
 
+    profiling.phase_end( 'config' )
+
     # build the URL 
-    url = "https://voip.ms/api/v1/rest.php" + \
+    url = api_url() + \
             "?api_username={0}&api_password={1}&method={2}". \
                 format( userid, password, method )
 
     if did:
         url = url + "&did={0}".format( did )
 
-    dprint( "URL = " + url )
+    dprint( "URL = " + redact_url( url ))
 
-    try:
-        json_struct = send_request( url, timeout )
-    except BadWebCall as err:
-        sys.stderr.write( "{0}: {1}\n".format( progname, str(err)))
+    num_missing = 0
+    if lines_from != None:
+        try:
+            found = lookup_dids( url, wanted, timeout, not refresh_flag )
+        except BadWebCall as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, str(err)))
+            return(1)
+
+        # answer in the order we were asked
+        json_struct = { 'dids': [] }
+        for w in wanted:
+            if w in found:
+                json_struct[ 'dids' ].append( found[ w ] )
+            else:
+                sys.stderr.write( "{0}: DID not found: {1}\n". \
+                    format( progname, w ))
+                num_missing += 1
+    else:
+        try:
+            json_struct = send_request( url, timeout, \
+                use_cache=not refresh_flag )
+        except BadWebCall as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, str(err)))
+            return(1)
+
+    if 'dids' not in json_struct:
+        sys.stderr.write( "{0}: missing key \'dids\' in return data\n". \
+            format( progname ))
         return(1)
 
+    # build our inventory of DIDs once, and pick out the ones we want
+
+    inv = build_inventory( json_struct[ 'dids' ] )
+    dids = query( inv, conditions )
+
     # get number of DIDs returned
 
-    num_dids = len( json_struct[ 'dids' ] )
+    num_dids = len( dids )
     dprint( "Number of DIDs found is " + str( num_dids ))
+    if num_dids == 0:
+        return( 1 if num_missing else 0 )
+
+    profiling.phase_start( 'render' )
+
+    if out_format != FORMAT_TEXT:
+        first = [ 'did' ]
+        records = dids
+        if account_flag:
+            first = [ 'account', 'did' ]
+            records = ( dict( d, account=account_of( d )) for d in dids )
+
+        if all_info_flag:
+            fields = field_order( dids, first )
+        else:
+            fields = first
+
+        write_records( records, fields, out_format )
+        profiling.phase_end( 'render' )
+        return( 1 if num_missing else 0 )
 
     # we want to figure out the maximum length of the keywords.
-    # and we only want to do it once, so only the first DID is used
+    # and we only want to do it once, so only the first DID is used.
+    # Build the start of each output line for each field once as well.
 
-    did_keys = list( json_struct[ 'dids' ][ 0 ] )
+    did_keys = sorted( dids[ 0 ] )
     max_key_len = len( max( did_keys, key=len ))
+    prefixes = []
+    for did_field in did_keys:
+        prefixes.append( ( did_field, "\t{0:{1}s}    ". \
+            format( did_field, max_key_len )))
 
-    # now get our data
-
-    if 'dids' not in json_struct:
-        sys.stderr.write( "{0}: missing key \'did\' in return data\n". \
-            format( progname ))
-        return(1)
+    # now print our data, gathering lines to write in chunks
 
-    i = 0
-    for d in json_struct[ 'dids' ]:
+    lines = []
+    for did_record in dids:
         try:
-            line = json_struct[ 'dids' ][ i ][ 'did' ]
+            line = did_record[ 'did' ]
         except ( KeyError ) as err:
             dprint( "Could not get DID (line) name: {0}. skipping.". \
                 format( err ))
             continue
 
-        try:
-            account = json_struct[ 'dids' ][ i ][ 'routing' ]
-        except ( KeyError ) as err:
-            dprint( "Could not get routing (account) name: {0}".format( err ))
-            dprint( "Setting account to \'unknown\'" ) 
-            account = 'unknown'
-
         if account_flag == True:
-            account = account.replace( 'account:', '' )
-            did_info = account + ':' + line
+            lines.append( account_of( did_record ) + ':' + line )
         else:
-            did_info = line
-
-        print( did_info )
+            lines.append( line )
 
         # now print the rest of the data
         if all_info_flag:
-            for did_field in sorted( did_keys):
-                try:
-                    v = str( json_struct[ 'dids' ][ i ][ did_field ] )
-                except ( KeyError ) as err:
+            for did_field, prefix in prefixes:
+                v = did_record.get( did_field )
+                if v == None:
                     dprint( "Could not get value for DID {0}". \
                         format( did_field))
                     dprint( "Setting DID to empty string" )
                     v = ""
+                lines.append( prefix + str( v ))
+
+            if num_dids > 1: lines.append( "" )
 
-                format_str = "\t{0:" + str( max_key_len ) + "s}    {1}"
-                print( format_str.format( did_field, v ))
+        if len( lines ) >= 4096:
+            sys.stdout.write( '\n'.join( lines ) + '\n' )
+            lines = []
 
-            if num_dids > 1: print( "" )
+    if lines:
+        sys.stdout.write( '\n'.join( lines ) + '\n' )
 
-        i = i + 1
+    profiling.phase_end( 'render' )
+
+    if num_missing:
+        return(1)
 
     return(0)
+
+
+# entry point of the program
+#
+# Arguments:
+#   command-line arguments
+# Returns:
+#   return value of main_program()
+# Exceptions:
+#   none
+
+def main( argv=sys.argv ):
+    return( run_program( main_program, argv ))
@@ -0,0 +1,581 @@
+"""
+get SMS messages sent and received by your voip.ms phone lines
+
+Sync the SMS messages of your voip.ms phone lines from the API into a
+local store, and print them from there
+
+Examples:
+    get-sms --help
+    get-sms                         - sync, and print the new messages
+    get-sms --line 416-555-1212     - only that line
+    get-sms --local --contact fred --since 2024-01-01
+    get-sms --resync --backfill-days 365
+
+Each sync only asks for the messages since the last one, from a
+watermark kept for each line.  The first sync of a line backfills
+--backfill-days days, fetching ranges of --shard-days days at the same
+time.  Messages are stored in sms.sqlite in the state directory, which
+sms-receiver also uses, and are queried from there without the API.
+"""
+
+# Copyright 2019 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import re
+
+try:
+    import datetime
+    import concurrent.futures
+    import contextvars
+
+    from config_moxad import config
+
+    from .functions import find_config_file, dprint, send_request, BadWebCall
+    from .functions import setup_api, api_url, InvalidArgument
+    from .functions import run_program, want_a_positive_integer
+    from .transport import redact_url
+    from .phone import canonical, BadNumber
+    from . import sms_store
+    from . import dates
+    from . import context
+    from . import profiling
+    from . import log
+    from . import __version__
+except ModuleNotFoundError as err:
+    sys.stderr.write( "Error: missing module: %s\n" % err )
+    sys.exit(1)
+
+# the watermark key when all the lines are synced together
+ALL_LINES = '*'
+
+# most messages asked for in one request.  A range of days with this
+# many is split and asked for again
+FETCH_LIMIT = 10000
+
+
+# print usage
+#
+# Arguments:
+#   a dictionary containing values for:
+#       'config-file'
+#       'timeout'
+#       'backfill-days'
+#       'shard-days'
+#       'workers'
+# Returns:
+#   0
+# Exceptions:
+#   none
+
+def usage( values ):
+    print( "usage: {} [options]*".format( context.current().progname ))
+
+    options = """\
+    [-c|--config file]     (config-file (default={})
+    [-d|--debug]           (debugging output)
+    [-h|--help]            (help)
+    [-l|--line phone]      (only your line phone.  Can be repeated)
+    [-t|--timeout num]     (default={})
+    [-L|--local]           (don't sync.  Only print messages stored)
+    [-q|--quiet]           (sync, but don't print messages)
+    [-n|--lines num]       (print the latest num messages)
+    [-b|--backfill-days num] (days the first sync gets (default={})
+    [-s|--shard-days num]  (days asked for in each request (default={})
+    [-w|--workers num]     (requests made at the same time (default={})
+    [--resync]             (forget the watermarks and backfill again)
+    [--contact phone]      (only messages to or from phone)
+    [--since date]         (YYYY-MM-DD - only messages from date on)
+    [--until date]         (YYYY-MM-DD - only messages up to date)
+    [--received]           (only messages received)
+    [--sent]               (only messages sent)
+    [--profile]            (print a profile of where time and memory went)
+    [--profile-file file]  (--profile, and save cProfile data to file)
+    [--stats]              (print statistics about API calls)
+    [-V|--version]         (print version of this program)\
+    """
+
+    print( options.format( values.get( 'config-file', '?' ),
+        values.get( 'timeout', '?' ), values.get( 'backfill-days', '?' ),
+        values.get( 'shard-days', '?' ), values.get( 'workers', '?' )))
+
+    return(0)
+
+
+# split a range of days into ranges of at most some number of days
+#
+# Arguments:
+#   1:  FROM date.  YYYY-MM-DD
+#   2:  TO date.  YYYY-MM-DD
+#   3:  most days in a range
+# Returns:
+#   list of tuples of ( first day, last day ), oldest first
+# Exceptions:
+#   ValueError
+
+def shard_days( from_date, to_date, size ):
+    days = dates.days_in_range( from_date, to_date )
+
+    return( [ ( days[ i ], days[ min( i + size, len( days )) - 1 ] )
+              for i in range( 0, len( days ), size ) ] )
+
+
+# convert a message from getSMS into a message of the store
+#
+# Arguments:
+#   dictionary of a message from getSMS
+# Returns:
+#   message dictionary.  See sms_store.py
+# Exceptions:
+#   none
+
+def store_message( sms ):
+    direction = sms_store.DIRECTION_SENT
+    if str( sms.get( 'type' )) == '1':
+        direction = sms_store.DIRECTION_RECEIVED
+
+    return( {
+        'id':           sms.get( 'id' ),
+        'date':         sms.get( 'date' ),
+        'did':          str( sms.get( 'did', '' )),
+        'contact':      str( sms.get( 'contact', '' )),
+        'direction':    direction,
+        'type':         'SMS',
+        'message':      sms.get( 'message', '' ),
+        'source':       'getSMS',
+    } )
+
+
+# get where a message is in the order messages are synced, to find the
+# latest for the watermark
+#
+# Arguments:
+#   1:  date.  YYYY-MM-DD HH:MM:SS
+#   2:  id
+# Returns:
+#   tuple that sorts in the order of messages
+
+def position( date, id_ ):
+    id_ = str( id_ or '' )
+    return( ( str( date or '' ), int( id_ ) if id_.isdigit() else -1 ))
+
+
+# get the messages of a range of days.  A range with as many messages
+# as were asked for is split in two and each half asked for again
+#
+# Arguments:
+#   1:  URL of getSMS, without the dates
+#   2:  first day.  YYYY-MM-DD
+#   3:  last day.  YYYY-MM-DD
+#   4:  timeout
+# Returns:
+#   list of messages from getSMS
+# Exceptions:
+#   BadWebCall
+
+def fetch_range( url, first, last, timeout ):
+    range_url = url + "&from={0}&to={1}&limit={2:d}". \
+        format( first, last, FETCH_LIMIT )
+    try:
+        json_struct = send_request( range_url, timeout )
+        messages = json_struct.get( 'sms', [] )
+    except BadWebCall as err:
+        if "no_sms" not in str( err ):
+            raise
+        messages = []
+
+    dprint( "{0} messages from {1} to {2}".format( len( messages ),
+                                                   first, last ))
+    if len( messages ) < FETCH_LIMIT:
+        return( messages )
+
+    days = dates.days_in_range( first, last )
+    if len( days ) == 1:
+        log.warning( "{0} has more than {1} messages. Some may be missing",
+                     first, FETCH_LIMIT )
+        return( messages )
+
+    middle = len( days ) // 2
+    return( fetch_range( url, first, days[ middle - 1 ], timeout ) +
+            fetch_range( url, days[ middle ], last, timeout ))
+
+
+# sync the messages of a line from the API into the store.  Only the
+# days since the last sync are asked for, and the ranges of days are
+# fetched at the same time
+#
+# Arguments:
+#   1:  sqlite3 connection from sms_store.open_store()
+#   2:  URL of getSMS for the line, without the dates
+#   3:  watermark key.  The DID, or ALL_LINES
+#   4:  day to start from if the line was never synced.  YYYY-MM-DD
+#   5:  today.  YYYY-MM-DD
+#   6:  dictionary of 'timeout', 'shard-days' and 'workers'
+# Returns:
+#   number of new messages stored
+# Exceptions:
+#   BadWebCall
+#   sms_store.BadStore
+
+def sync_line( conn, url, key, backfill_from, today, settings ):
+    watermark = sms_store.get_watermark( conn, key )
+    if watermark == None:
+        watermark = { 'date': None, 'id': None, 'synced_to': None }
+        from_date = backfill_from
+    else:
+        from_date = watermark[ 'synced_to' ] or backfill_from
+
+    shards = shard_days( from_date, today, settings[ 'shard-days' ] )
+    dprint( "syncing {0} from {1} to {2} in {3} ranges".format( key,
+        from_date, today, len( shards )))
+
+    # each range is fetched in a copy of our context, so it has our
+    # settings.  Messages are stored here, as each range comes back.
+    # Every message is stored, since ones already stored are ignored,
+    # and one showing up late with an older date would be missed if
+    # only those past the watermark were
+
+    num_stored = 0
+    latest = position( watermark[ 'date' ], watermark[ 'id' ] )
+    with concurrent.futures.ThreadPoolExecutor( \
+            max_workers=min( settings[ 'workers' ], len( shards ))) as pool:
+        futures = [ pool.submit( contextvars.copy_context().run, fetch_range,
+                    url, first, last, settings[ 'timeout' ] )
+                    for first, last in shards ]
+        for future in concurrent.futures.as_completed( futures ):
+            messages = []
+            for sms in future.result():
+                messages.append( store_message( sms ))
+                at = position( sms.get( 'date' ), sms.get( 'id' ))
+                if at > latest:
+                    latest = at
+                    watermark[ 'date' ] = sms.get( 'date' )
+                    watermark[ 'id' ] = str( sms.get( 'id' ))
+            num_stored = num_stored + sms_store.add_messages( conn, messages )
+
+    # only moved on once every range is stored, so a failed sync is
+    # done again from the same place
+
+    watermark[ 'synced_to' ] = today
+    sms_store.set_watermark( conn, key, watermark )
+
+    return( num_stored )
+
+
+# main program
+#
+# Arguments:
+#   command-line arguments
+# Returns:
+#   0:  ok
+#   1:  not ok
+# Exceptions:
+#   none
+
+def main_program( argv ):
+    ctx = context.current()
+    config_file = None
+
+    progname = argv[0]
+    if progname == None or progname == "":
+        progname = 'get-sms'
+
+    ctx.progname = progname     # make available to other functions
+    ctx.debug_flag = False      # used by functions.debug
+
+    # set some defaults
+    # These may be over-written by config file values
+
+    defaults = {
+        'timeout':          120,
+        'backfill-days':    90,
+        'shard-days':       7,
+        'workers':          4,
+    }
+
+    # values from the command-line will go into values.
+
+    values = {}
+
+    help_flag   = False
+    local_flag  = False
+    quiet_flag  = False
+    resync_flag = False
+    lines       = []        # lines wanted.  Numbers or aliases
+    contact     = None
+    query       = {}
+
+    # process options
+
+    num_args = len( argv )
+    i = 1
+    while i < num_args:
+        try:
+            arg = argv[i]
+
+            m = re.match( '^-', arg )
+            if not m:
+                sys.stderr.write( "{0}: unexpected argument: {1}\n". \
+                    format( progname, arg ))
+                return(1)
+
+            if arg == '-d' or arg == '--debug':
+                ctx.debug_flag = True
+            elif arg == '--stats':
+                ctx.stats_flag = True
+            elif arg == '--profile':
+                profiling.start()
+            elif arg == '--profile-file':
+                i = i + 1 ;     ctx.profile_file = argv[i]
+                profiling.start()
+            elif arg == '-h' or arg == '--help':
+                help_flag = True
+            elif arg == '-V' or arg == '--version':
+                print( "package version: {0}".format( __version__ ))
+                print( "config  version: {0}".format( config.__version__ ))
+                return(0)
+            elif arg == '-c' or arg == '--config':
+                i = i + 1 ;     config_file = argv[i]
+            elif arg == '-l' or arg == '--line':
+                i = i + 1 ;     lines.append( argv[i] )
+            elif arg == '-t' or arg == '--timeout':
+                i = i + 1 ;     values[ 'timeout' ] = argv[i]
+            elif arg == '-b' or arg == '--backfill-days':
+                i = i + 1 ;     values[ 'backfill-days' ] = argv[i]
+            elif arg == '-s' or arg == '--shard-days':
+                i = i + 1 ;     values[ 'shard-days' ] = argv[i]
+            elif arg == '-w' or arg == '--workers':
+                i = i + 1 ;     values[ 'workers' ] = argv[i]
+            elif arg == '-L' or arg == '--local':
+                local_flag = True
+            elif arg == '-q' or arg == '--quiet':
+                quiet_flag = True
+            elif arg == '--resync':
+                resync_flag = True
+            elif arg == '-n' or arg == '--lines':
+                i = i + 1
+                try:
+                    query[ 'limit' ] = want_a_positive_integer( argv[i],
+                                                                'lines' )
+                except ValueError as err:
+                    sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+                    return(1)
+            elif arg == '--contact':
+                i = i + 1 ;     contact = argv[i]
+            elif arg == '--since' or arg == '--until':
+                i = i + 1
+                if not dates.is_valid_format( argv[i] ):
+                    sys.stderr.write( "{0}: bad date for {1}: \'{2}\'. " \
+                        "Use YYYY-MM-DD\n".format( progname, arg, argv[i] ))
+                    return(1)
+                query[ arg[ 2: ]] = dates.parse_day( argv[i] ).isoformat()
+            elif arg == '--received':
+                query[ 'direction' ] = sms_store.DIRECTION_RECEIVED
+            elif arg == '--sent':
+                query[ 'direction' ] = sms_store.DIRECTION_SENT
+            else:
+                sys.stderr.write( "{0}: no such option: {1}\n". \
+                    format( progname, arg ))
+                return(1)
+
+            i = i + 1
+        except IndexError as err:
+            sys.stderr.write( "{0}: missing value for option {1}\n". \
+                format( progname, arg ))
+            return(1)
+
+    # find the config file we really want
+
+    profiling.phase_start( 'config' )
+    config_file = find_config_file( config_file ) ;
+    if not config_file:
+        sys.stderr.write( "{0}: could not find a config file\n". \
+            format( progname ))
+        return(1) ;
+    dprint( "using config file: " + config_file )
+
+    config.Config.set_debug( ctx.debug_flag )
+
+    # no definitions file.  Our type info is all in our config file.
+    try:
+        conf = config.Config( config_file, '', AcceptUndefinedKeywords=True )
+    except Exception as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    # where and how we talk to the API
+
+    try:
+        setup_api( conf )
+    except InvalidArgument as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    sections = conf.get_sections()
+
+    # values from the config file over-ride any defaults
+
+    if 'get-sms' in sections:
+        for keyword in conf.get_keywords( 'get-sms' ):
+            if conf.get_type( 'get-sms', keyword ) == 'scalar':
+                defaults[ keyword ] = conf.get_values( 'get-sms', keyword )
+                dprint( "Replacing/setting default for \'{0}\'", keyword )
+
+    for field in defaults:
+        if ( field not in values ) or ( values[ field ] == None ):
+            values[ field ] = defaults[ field ]
+
+    if help_flag:
+        usage( dict( values, **{ 'config-file': config_file } ))
+        return(0)
+
+    settings = {}
+    try:
+        for field in [ 'timeout', 'backfill-days', 'shard-days', 'workers' ]:
+            settings[ field ] = want_a_positive_integer( values[ field ],
+                                                         field )
+    except ValueError as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    # lines and contacts can be aliases from the 'sms' section
+
+    aliases = {}
+    if 'sms' in sections:
+        try:
+            aliases = conf.get_values( 'sms', 'aliases' )
+        except ValueError as err:
+            pass
+
+    try:
+        dids = [ canonical( aliases.get( l, l )) for l in lines ]
+        if contact != None:
+            query[ 'contact' ] = canonical( aliases.get( contact, contact ))
+    except BadNumber as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    if dids:
+        query[ 'did' ] = dids
+
+    try:
+        pathname = sms_store.store_pathname( ctx.state_dir )
+    except sms_store.BadStore as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    profiling.phase_end( 'config' )
+
+    # bring the store up to date
+
+    if local_flag == False:
+        keywords = []
+        if 'authentication' in sections:
+            keywords = conf.get_keywords( 'authentication' )
+        for keyword in [ 'user', 'pass' ]:
+            if keyword not in keywords:
+                sys.stderr.write( "{0}: missing keyword \'{1}\' in section " \
+                    "\'authentication\' in {2}\n".format( progname, keyword,
+                                                         config_file ))
+                return(1)
+
+        userid   = conf.get_values( 'authentication', 'user' )
+        password = conf.get_values( 'authentication', 'pass' )
+
+        # dates are asked for in our timezone, if we have one
+
+        timezone = None
+        if 'time' in sections and 'timezone' in conf.get_keywords( 'time' ):
+            timezone = conf.get_values( 'time', 'timezone' )
+
+        base_url = api_url() + \
+            "?api_username={0}&api_password={1}&method=getSMS". \
+                format( userid, password )
+        if timezone != None:
+            base_url = base_url + "&timezone={0}".format( timezone )
+        dprint( "BASE URL = " + redact_url( base_url ))
+
+        try:
+            today = dates.today( timezone )
+        except ValueError:
+            sys.stderr.write( "{0}: bad timezone: \'{1}\'\n". \
+                format( progname, timezone ))
+            return(1)
+        backfill_from = ( dates.parse_day( today ) - datetime.timedelta(
+            days=settings[ 'backfill-days' ] - 1 )).isoformat()
+
+        profiling.phase_start( 'fetch' )
+        try:
+            conn = sms_store.open_store( pathname )
+            try:
+                before = sms_store.last_rowid( conn )
+                num_stored = 0
+                for did in dids or [ None ]:
+                    key = ALL_LINES
+                    url = base_url
+                    if did != None:
+                        key = did
+                        url = url + "&did={0}".format( did )
+                    if resync_flag:
+                        sms_store.set_watermark( conn, key, None )
+                    num_stored = num_stored + sync_line( conn, url, key,
+                        backfill_from, today, settings )
+            finally:
+                conn.close()
+        except ( BadWebCall, sms_store.BadStore ) as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+            return(1)
+        profiling.phase_end( 'fetch' )
+
+        log.info( "{0} new messages", num_stored )
+
+        # with nothing asked for, print what is new
+
+        if not ( set( query ) - { 'did' } ):
+            query[ 'after' ] = before
+
+    if quiet_flag:
+        return(0)
+
+    # print from the store
+
+    profiling.phase_start( 'render' )
+    if local_flag and not ( set( query ) - { 'did' } ):
+        query[ 'limit' ] = 10
+    try:
+        conn = sms_store.open_store( pathname, read_only=True )
+        try:
+            for message in sms_store.find_messages( conn, **query ):
+                print( sms_store.format_message( message ))
+        finally:
+            conn.close()
+    except sms_store.BadStore as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+    profiling.phase_end( 'render' )
+
+    return(0)
+
+
+# entry point of the program
+#
+# Arguments:
+#   command-line arguments
+# Returns:
+#   return value of main_program()
+# Exceptions:
+#   none
+
+def main( argv=sys.argv ):
+    return( run_program( main_program, argv ))
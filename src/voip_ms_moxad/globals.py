@@ -1,2 +0,0 @@
-debug_flag = False
-progname   = None
@@ -0,0 +1,193 @@
+"""
+in-memory inventory of DIDs (phone lines)
+
+An inventory is built once from the 'dids' returned by the getDIDsInfo
+API method, with a hash index on the commonly searched fields, so
+questions like "which DIDs route to account X?" or "which DIDs go to
+voicemail Y?" are answered without walking every DID.
+
+  inv = build_inventory( json_struct[ 'dids' ] )
+  dids = query( inv, [ ( 'routing', 'account:1234_x' ) ] )
+  did = lookup( inv, '4165551212' )
+
+Besides the fields returned by the API, there is an 'account' field:
+the routing with any 'account:' prefix removed.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+
+INDEXED_FIELDS = [ 'did', 'routing', 'account', 'pop', 'billing_type',
+                   'voicemail' ]
+
+
+class BadQuery( Exception ): pass
+
+
+def account_of( did_info ):
+    """
+    get the (sub)account a DID routes to
+
+    Arguments:
+        dictionary of info about a DID
+    Returns:
+        account name.  eg: '1234_x'.  'unknown' if there is no routing
+    Exceptions:
+        none
+    """
+
+    routing = did_info.get( 'routing' )
+    if routing == None:
+        return( 'unknown' )
+
+    routing = str( routing )
+    if routing.startswith( 'account:' ):
+        return( routing[ 8: ] )
+
+    return( routing )
+
+
+def build_inventory( dids, fields=INDEXED_FIELDS ):
+    """
+    build an inventory of DIDs with an index on each of the given fields
+
+    Arguments:
+        1:  list of dictionaries of info about each DID
+        2:  optional list of fields to index
+    Returns:
+        inventory - a dictionary with:
+          'dids':     the list of DIDs
+          'indexes':  field -> value -> list of positions in 'dids'
+    Exceptions:
+        none
+    """
+
+    indexes = {}
+    for field in fields:
+        indexes[ field ] = {}
+
+    for position, did_info in enumerate( dids ):
+        for field in fields:
+            if field == 'account':
+                value = account_of( did_info )
+            elif field in did_info:
+                value = str( did_info[ field ] )
+            else:
+                continue
+            index = indexes[ field ]
+            if value in index:
+                index[ value ].append( position )
+            else:
+                index[ value ] = [ position ]
+
+    return( { 'dids': dids, 'indexes': indexes } )
+
+
+def parse_where( condition ):
+    """
+    parse a condition of the form field=value
+
+    Arguments:
+        condition.  eg: routing=account:1234_x
+    Returns:
+        tuple of ( field, value )
+    Exceptions:
+        BadQuery
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    field, sep, value = condition.partition( '=' )
+    field = field.strip()
+    if sep == "" or field == "":
+        raise BadQuery( "{0}condition must be field=value. got \'{1}\'". \
+            format( sprefix, condition ))
+
+    return( field, value.strip() )
+
+
+def query( inventory, conditions ):
+    """
+    get the DIDs matching all of a list of conditions.  Conditions on
+    indexed fields are answered from the index.  Any others are checked
+    against the DIDs the indexed conditions leave.
+
+    Arguments:
+        1:  inventory from build_inventory()
+        2:  list of ( field, value ) tuples
+    Returns:
+        list of dictionaries of info about each matching DID, in the
+        order given by the API
+    Exceptions:
+        none
+    """
+
+    dids    = inventory[ 'dids' ]
+    indexes = inventory[ 'indexes' ]
+
+    positions = None
+    others = []
+    for field, value in conditions:
+        if field not in indexes:
+            others.append( ( field, value ))
+            continue
+
+        found = indexes[ field ].get( value, [] )
+        if positions == None:
+            positions = set( found )
+        else:
+            positions = positions.intersection( found )
+
+        if len( positions ) == 0:
+            return( [] )
+
+    if positions == None:
+        candidates = dids
+    else:
+        candidates = [ dids[ p ] for p in sorted( positions ) ]
+
+    if len( others ) == 0:
+        return( candidates )
+
+    matches = []
+    for did_info in candidates:
+        for field, value in others:
+            if str( did_info.get( field, '' )) != value:
+                break
+        else:
+            matches.append( did_info )
+
+    return( matches )
+
+
+def lookup( inventory, did ):
+    """
+    get the info about a single DID
+
+    Arguments:
+        1:  inventory from build_inventory()
+        2:  DID (phone number, digits only)
+    Returns:
+        dictionary of info about the DID, or None if it isn't known
+    Exceptions:
+        none
+    """
+
+    positions = inventory[ 'indexes' ][ 'did' ].get( str( did ))
+    if not positions:
+        return( None )
+
+    return( inventory[ 'dids' ][ positions[0] ] )
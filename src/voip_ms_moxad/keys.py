@@ -0,0 +1,46 @@
+"""
+keys identifying records returned by the voip.ms API
+
+A CDR (Call Display Record) is identified by its 'uniqueid'.  CDRs
+without one are identified by the fields that tell two calls apart, so
+two calls made in the same second from the same account still get keys
+of their own.  The keys are used to tell which CDRs a watch has already
+seen (see watch.py) and as the primary key of the archive (see
+archive.py).
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# fields of a CDR making up its key when it has no 'uniqueid'
+CDR_KEY_FIELDS = [ 'date', 'account', 'callerid', 'destination',
+                   'seconds', 'disposition', 'total' ]
+
+
+def cdr_key( cdr ):
+    """
+    get a key identifying a CDR
+
+    Arguments:
+        CDR dictionary
+    Returns:
+        string
+    Exceptions:
+        none
+    """
+
+    if 'uniqueid' in cdr:
+        return( str( cdr[ 'uniqueid' ] ))
+
+    return( '|'.join( str( cdr.get( field )) for field in CDR_KEY_FIELDS ))
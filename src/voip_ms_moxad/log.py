@@ -0,0 +1,193 @@
+"""
+logging of debug and other messages
+
+Messages are given as a format string and its arguments, and are only
+formatted if their level is wanted, so debugging statements cost next
+to nothing when debugging is off:
+
+  log.debug( "{0} CDRs found for {1}", num_cdrs, account )
+
+Work done only to build a message (eg: redacting a URL) should be put
+behind a check of the level:
+
+  if log.enabled( log.DEBUG ):
+      log.debug( "URL = {0}", redact_url( url ))
+
+The level wanted is 'debug' if the program was given --debug, else
+the log_level of the context (default 'warning').  Messages are printed
+as text - debug and info to stdout, as they always were, and warning and
+error to stderr - or as one JSON object per line to stderr if the
+log_format of the context is 'json'.  Extra fields can be given to
+include in JSON output:
+
+  log.warning( "poll failed: {0}", err, method='getCDR' )
+
+The environment variables VOIP_MS_LOG_LEVEL and VOIP_MS_LOG_FORMAT set
+the level and format of the programs.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import time
+
+from . import context
+
+DEBUG   = 10
+INFO    = 20
+WARNING = 30
+ERROR   = 40
+
+LEVELS = {
+    'debug':    DEBUG,
+    'info':     INFO,
+    'warning':  WARNING,
+    'error':    ERROR,
+}
+LEVEL_NAMES = { n: name for name, n in LEVELS.items() }
+
+FORMAT_TEXT = 'text'
+FORMAT_JSON = 'json'
+FORMATS = [ FORMAT_TEXT, FORMAT_JSON ]
+
+
+class BadLogSetting( Exception ): pass
+
+
+def level_number( name ):
+    """
+    convert the name of a level into its number
+
+    Arguments:
+        name of a level.  eg: 'info'
+    Returns:
+        integer
+    Exceptions:
+        BadLogSetting
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        return( LEVELS[ str( name ).lower() ] )
+    except KeyError:
+        raise BadLogSetting( "{0}unknown log level \'{1}\'. Must be one " \
+            "of: {2}".format( sprefix, name, ', '.join( LEVELS ))) from None
+
+
+def enabled( level ):
+    """
+    check if messages of a level are wanted
+
+    Arguments:
+        level.  eg: log.DEBUG
+    Returns:
+        True or False
+    Context:
+        ctx.debug_flag
+        ctx.log_level
+    Exceptions:
+        none
+    """
+
+    ctx = context.current()
+    if ctx.debug_flag:
+        return( True )
+
+    return( level >= LEVELS.get( ctx.log_level, WARNING ))
+
+
+def log( level, fmt, *args, **fields ):
+    """
+    log a message, if its level is wanted
+
+    Arguments:
+        1:  level.  eg: log.INFO
+        2:  message, or a format string for str.format() if there are
+            arguments
+        3:  any arguments of the format string
+        4:  any extra fields for JSON output
+    Returns:
+        None
+    Context:
+        ctx.progname
+        ctx.log_format
+    Exceptions:
+        none
+    """
+
+    if not enabled( level ):
+        return( None )
+
+    if args:
+        message = fmt.format( *args )
+    else:
+        message = str( fmt )
+
+    ctx = context.current()
+    name = LEVEL_NAMES.get( level, str( level ))
+
+    if ctx.log_format == FORMAT_JSON:
+        record = { 'time': round( time.time(), 3 ), 'level': name }
+        if ctx.progname != None:
+            record[ 'program' ] = ctx.progname
+        record[ 'message' ] = message
+        record.update( fields )
+        sys.stderr.write( json.dumps( record, default=str ) + '\n' )
+        return( None )
+
+    prefix = name + ': '
+    if ctx.progname != None:
+        prefix = prefix + ctx.progname + ': '
+
+    if level <= INFO:
+        print( "{}{}".format( prefix, message ))
+    else:
+        sys.stderr.write( "{}{}\n".format( prefix, message ))
+
+    return( None )
+
+
+def debug( fmt, *args, **fields ):
+    """
+    log a debugging message.  See log()
+    """
+
+    return( log( DEBUG, fmt, *args, **fields ))
+
+
+def info( fmt, *args, **fields ):
+    """
+    log an informational message.  See log()
+    """
+
+    return( log( INFO, fmt, *args, **fields ))
+
+
+def warning( fmt, *args, **fields ):
+    """
+    log a warning.  See log()
+    """
+
+    return( log( WARNING, fmt, *args, **fields ))
+
+
+def error( fmt, *args, **fields ):
+    """
+    log an error.  See log()
+    """
+
+    return( log( ERROR, fmt, *args, **fields ))
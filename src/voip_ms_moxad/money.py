@@ -0,0 +1,159 @@
+"""
+exact arithmetic on amounts of money
+
+voip.ms gives costs as decimal strings with up to 8 places (eg: the
+'total' of a CDR is '0.01062500').  Adding them up as floats slowly
+drifts from the sum of the decimals over millions of CDRs, so they are
+parsed into integer micro-cents - millionths of a cent, 100,000,000 to
+the dollar - which add up exactly, and are only rounded to cents when
+printed:
+
+  total = sum( cdr_cost( cdr ) for cdr in cdrs )
+  print( "Total cost is ${0}".format( format_dollars( total )))
+
+Parsing is cached, since the same costs come up over and over.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import decimal
+import functools
+
+PLACES = 8                          # decimal places of a micro-cent
+UNITS_PER_DOLLAR = 10 ** PLACES     # micro-cents in a dollar
+
+CACHE_SIZE = 65536
+
+
+@functools.lru_cache( maxsize=CACHE_SIZE )
+def _parse_string( value ):
+    """
+    parse a decimal string into micro-cents.  See parse()
+    """
+
+    s = value.strip()
+    negative = s.startswith( '-' )
+    if negative or s.startswith( '+' ):
+        s = s[ 1: ]
+
+    whole, dot, fraction = s.partition( '.' )
+    if ( whole or fraction ) and whole.isascii() and fraction.isascii() \
+            and ( whole == "" or whole.isdigit() ) \
+            and ( fraction == "" or fraction.isdigit() ):
+        units = int( whole or '0' ) * UNITS_PER_DOLLAR
+        if fraction:
+            units += int( fraction[ :PLACES ].ljust( PLACES, '0' ))
+            if len( fraction ) > PLACES and fraction[ PLACES ] >= '5':
+                units += 1
+        if negative:
+            units = -units
+        return( units )
+
+    # anything else, like an exponent, is left to the decimal module
+
+    try:
+        d = decimal.Decimal( value.strip() )
+    except decimal.InvalidOperation:
+        d = None
+    if d == None or not d.is_finite():
+        raise ValueError( "not an amount of money: \'{0}\'".format( value ))
+
+    return( int( d.scaleb( PLACES ).quantize( 1, decimal.ROUND_HALF_UP )))
+
+
+def parse( value ):
+    """
+    convert an amount of money in dollars into micro-cents
+
+    Arguments:
+        amount.  A decimal string (eg: '0.01062500'), integer or float.
+        Places past the 8th are rounded
+    Returns:
+        integer
+    Exceptions:
+        ValueError
+    """
+
+    if isinstance( value, bool ):
+        raise ValueError( "not an amount of money: \'{0}\'".format( value ))
+    if isinstance( value, int ):
+        return( value * UNITS_PER_DOLLAR )
+    if isinstance( value, float ):
+        # the shortest string giving the float is the decimal meant
+        return( _parse_string( repr( value )))
+
+    return( _parse_string( str( value )))
+
+
+def cdr_cost( cdr ):
+    """
+    get the cost of a CDR in micro-cents
+
+    Arguments:
+        CDR dictionary, as returned by the getCDR API method
+    Returns:
+        integer.  0 if the 'total' field is missing or can't be parsed
+    Exceptions:
+        none
+    """
+
+    try:
+        return( parse( cdr.get( 'total', 0 )))
+    except ValueError:
+        return( 0 )
+
+
+def format_dollars( units, places=2 ):
+    """
+    format micro-cents as dollars, rounding half away from zero
+
+    Arguments:
+        1:  micro-cents
+        2:  optional number of decimal places.  Default is 2 (cents)
+    Returns:
+        string.  eg: '1.81'
+    Exceptions:
+        none
+    """
+
+    places = min( max( int( places ), 0 ), PLACES )
+    step = 10 ** ( PLACES - places )
+
+    negative = units < 0
+    rounded = ( abs( units ) + step // 2 ) // step
+    whole, fraction = divmod( rounded, 10 ** places )
+
+    result = str( whole )
+    if places:
+        result = result + '.' + str( fraction ).rjust( places, '0' )
+    if negative and rounded:
+        result = '-' + result
+
+    return( result )
+
+
+def to_dollars( units ):
+    """
+    convert micro-cents into dollars, for when a float will do
+
+    Arguments:
+        micro-cents
+    Returns:
+        float
+    Exceptions:
+        none
+    """
+
+    return( units / UNITS_PER_DOLLAR )
@@ -0,0 +1,144 @@
+"""
+normalization and validation of phone numbers
+
+Phone numbers are given by people and config files in many ways:
+416-555-1212, (416) 555 1212, 416.555.1212, +1 416 555 1212.  The
+voip.ms API wants North American (NANP) numbers as 10 digits, so
+canonical() strips the formatting, checks what's left is digits and
+drops the country code of 11-digit NANP numbers.
+
+Results are cached, since bulk jobs see the same numbers over and over.
+
+  did = canonical( '+1 (416) 555-1212' )     # '4165551212'
+  e164( did )                                # '+14165551212'
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import functools
+
+# formatting characters people put in phone numbers
+_FORMATTING = str.maketrans( '', '', ' -().\t' )
+
+_DIGITS = re.compile( r'[0-9]+' )
+
+NANP_COUNTRY_CODE = '1'
+INTERNATIONAL_PREFIX = '011'    # dialed from NANP before a country code
+
+CACHE_SIZE = 65536
+
+
+class BadNumber( Exception ): pass
+
+
+@functools.lru_cache( maxsize=CACHE_SIZE )
+def strip( number ):
+    """
+    remove the formatting characters (spaces, dashes, parentheses and
+    dots) and any leading '+' from a phone number
+
+    Arguments:
+        phone number
+    Returns:
+        string
+    Exceptions:
+        none
+    """
+
+    number = str( number ).translate( _FORMATTING )
+    if number.startswith( '+' ):
+        number = number[ 1: ]
+
+    return( number )
+
+
+def is_digits( number ):
+    """
+    check a phone number, already stripped, is only the digits 0 to 9
+
+    Arguments:
+        phone number
+    Returns:
+        True or False
+    Exceptions:
+        none
+    """
+
+    return( _DIGITS.fullmatch( number ) != None )
+
+
+@functools.lru_cache( maxsize=CACHE_SIZE )
+def canonical( number ):
+    """
+    get the canonical form of a phone number used with the voip.ms API:
+    digits only, with NANP numbers as 10 digits
+
+    Arguments:
+        phone number.  eg: '+1 (416) 555-1212'
+    Returns:
+        string of digits.  eg: '4165551212'
+    Exceptions:
+        BadNumber
+    """
+
+    digits = strip( number )
+    if not is_digits( digits ):
+        raise BadNumber( "phone number must be digits: \'{0}\'". \
+            format( number ))
+
+    if len( digits ) == 11 and digits.startswith( NANP_COUNTRY_CODE ):
+        digits = digits[ 1: ]
+
+    return( digits )
+
+
+def e164( number ):
+    """
+    get a phone number in E.164 format.  10-digit numbers are taken to
+    be NANP, and numbers starting with the international prefix 011 have
+    it replaced by a '+'
+
+    Arguments:
+        phone number
+    Returns:
+        string.  eg: '+14165551212'
+    Exceptions:
+        BadNumber
+    """
+
+    digits = canonical( number )
+    if len( digits ) == 10:
+        return( '+' + NANP_COUNTRY_CODE + digits )
+    if digits.startswith( INTERNATIONAL_PREFIX ):
+        return( '+' + digits[ len( INTERNATIONAL_PREFIX ): ] )
+
+    return( '+' + digits )
+
+
+def resolve( number, aliases ):
+    """
+    get the canonical form of a phone number or alias
+
+    Arguments:
+        1:  phone number, or a key of aliases
+        2:  dictionary of alias -> phone number
+    Returns:
+        string of digits
+    Exceptions:
+        BadNumber
+    """
+
+    return( canonical( aliases.get( number, number )))
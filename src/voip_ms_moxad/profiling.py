@@ -0,0 +1,218 @@
+"""
+profiling of the programs
+
+With the --profile option, the rest of the program runs under cProfile
+and tracemalloc, and run_program() then prints a short report of:
+
+  - the time spent in each phase of the program (config, http, parse,
+    aggregate, render)
+  - the functions where the most time was spent
+  - the places where the most memory was allocated
+
+With the --profile-file option, the raw cProfile data is also saved
+into a .prof file, which can be read by pstats, snakeviz, or turned
+into a flamegraph by tools such as flameprof.
+
+The phase timers are always kept since they are cheap, so they can be
+used by library users without the overhead of cProfile.  They are kept
+in the current context (see context.py), so each run of a program has
+its own.  cProfile and tracemalloc watch the whole process, so only one
+run at a time should be profiled.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import io
+import time
+import cProfile
+import pstats
+import tracemalloc
+
+from . import context
+
+NUM_FUNCTIONS   = 15    # number of hot functions to report
+NUM_ALLOCATIONS = 10    # number of allocation sites to report
+
+
+
+def reset_phases():
+    """
+    throw away any phase times gathered so far
+
+    Arguments:
+        none
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    ctx = context.current()
+    ctx.phases.clear()
+    ctx.phase_starts.clear()
+
+    return( None )
+
+
+def phase_start( name ):
+    """
+    start timing a phase of the program
+
+    Arguments:
+        name of the phase.  eg: config
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    context.current().phase_starts[ name ] = time.perf_counter()
+
+    return( None )
+
+
+def phase_end( name ):
+    """
+    stop timing a phase of the program started with phase_start().
+    A phase can be started and ended more than once and the times add up.
+
+    Arguments:
+        name of the phase
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    start = context.current().phase_starts.pop( name, None )
+    if start != None:
+        add_phase_time( name, time.perf_counter() - start )
+
+    return( None )
+
+
+def add_phase_time( name, seconds ):
+    """
+    add time to a phase, for when it was already measured elsewhere
+
+    Arguments:
+        1:  name of the phase
+        2:  seconds
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    phases = context.current().phases
+    phases[ name ] = phases.get( name, 0.0 ) + seconds
+
+    return( None )
+
+
+def get_phases():
+    """
+    get the times of the phases gathered so far
+
+    Arguments:
+        none
+    Returns:
+        dictionary of phase name -> seconds, in the order first seen,
+        of the current context
+    Exceptions:
+        none
+    """
+
+    return( context.current().phases )
+
+
+def start():
+    """
+    start profiling with cProfile and tracemalloc, if not already
+
+    Arguments:
+        none
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    ctx = context.current()
+    if ctx.profiler != None:
+        return( None )
+
+    tracemalloc.start()
+    ctx.profiler = cProfile.Profile()
+    ctx.profiler.enable()
+
+    return( None )
+
+
+def stop( pathname=None, out=sys.stderr ):
+    """
+    stop profiling, print a report, and optionally save the cProfile data
+
+    Arguments:
+        1:  optional pathname of a .prof file to save cProfile data to
+        2:  optional file to print the report to.  Default is stderr
+    Returns:
+        None
+    Exceptions:
+        OSError
+    """
+
+    ctx = context.current()
+    profiler = ctx.profiler
+    if profiler == None:
+        return( None )
+
+    profiler.disable()
+    snapshot = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    out.write( "profile: phases:\n" )
+    for name in ctx.phases:
+        out.write( "profile:   {0:<12s} {1:9.4f}s\n". \
+            format( name, ctx.phases[ name ] ))
+
+    # pstats only prints, so catch it and prefix each line
+    buf = io.StringIO()
+    ps = pstats.Stats( profiler, stream=buf )
+    ps.sort_stats( 'cumulative' ).print_stats( NUM_FUNCTIONS )
+    out.write( "profile: hot functions:\n" )
+    for line in buf.getvalue().splitlines():
+        if line.strip() == "":
+            continue
+        out.write( "profile:   {0}\n".format( line.strip() ))
+
+    out.write( "profile: peak memory {0:.1f} KiB. top allocations:\n". \
+        format( peak / 1024 ))
+    snapshot = snapshot.filter_traces( [
+        tracemalloc.Filter( False, tracemalloc.__file__ ),
+        tracemalloc.Filter( False, "<frozen importlib._bootstrap>" ),
+    ] )
+    for stat in snapshot.statistics( 'lineno' )[ :NUM_ALLOCATIONS ]:
+        out.write( "profile:   {0}\n".format( stat ))
+
+    if pathname:
+        profiler.dump_stats( pathname )
+        out.write( "profile: cProfile data saved to {0}\n".format( pathname ))
+
+    ctx.profiler = None
+
+    return( None )
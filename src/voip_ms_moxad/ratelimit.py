@@ -0,0 +1,266 @@
+"""
+client-side rate limiting of calls to the voip.ms API
+
+voip.ms throttles API usage.  To keep several programs running at the
+same time under the limit, send_request() takes a token from a token
+bucket before every call:
+
+  - a bucket per account (API user), shared by all API methods
+  - optionally, a bucket per account and API method
+
+The buckets are kept in a state file shared by all processes of the
+same user, and updated under an exclusive lock on a lock file, so the
+limit holds across processes as well as threads.  Without a state
+directory, the buckets are kept in the current context (see context.py)
+and shared only by the threads and copies using that context.
+
+Rates are in calls per second.  A rate of 0 means no limit.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+import json
+import time
+import threading
+
+from . import context
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None        # not POSIX.  Only limit within this process
+
+STATE_FILE = 'ratelimit.json'
+LOCK_FILE  = 'ratelimit.lock'
+
+_thread_lock = threading.Lock()
+
+
+class RateLimitError( Exception ): pass
+
+
+def bucket_names( account, method, method_rates ):
+    """
+    get the names of the buckets a call has to take a token from
+
+    Arguments:
+        1:  account (API user)
+        2:  API method
+        3:  dictionary of API method -> rate
+    Returns:
+        list of bucket names
+    Exceptions:
+        none
+    """
+
+    names = [ "{0}".format( account ) ]
+    if method in method_rates:
+        names.append( "{0}/{1}".format( account, method ))
+
+    return( names )
+
+
+def refill( bucket, rate, burst, now ):
+    """
+    add the tokens earned since a bucket was last updated
+
+    Arguments:
+        1:  bucket - dictionary with 'tokens' and 'time'
+        2:  rate in tokens per second
+        3:  maximum number of tokens
+        4:  current time
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    elapsed = now - bucket[ 'time' ]
+    if elapsed > 0:
+        bucket[ 'tokens' ] = min( burst, bucket[ 'tokens' ] + elapsed * rate )
+    bucket[ 'time' ] = now
+
+    return( None )
+
+
+def try_take( state, names, rates, burst, now ):
+    """
+    take a token from each of the buckets if they all have one
+
+    Arguments:
+        1:  dictionary of bucket name -> bucket
+        2:  list of bucket names
+        3:  dictionary of bucket name -> rate
+        4:  maximum number of tokens in a bucket
+        5:  current time
+    Returns:
+        0 if the tokens were taken.  Otherwise the seconds to wait
+        before there will be a token in every bucket
+    Exceptions:
+        none
+    """
+
+    wait = 0.0
+    for name in names:
+        rate = rates[ name ]
+        bucket = state.get( name )
+        if bucket == None:
+            bucket = { 'tokens': float( burst ), 'time': now }
+            state[ name ] = bucket
+        refill( bucket, rate, burst, now )
+        if bucket[ 'tokens' ] < 1.0:
+            wait = max( wait, ( 1.0 - bucket[ 'tokens' ] ) / rate )
+
+    if wait > 0:
+        return( wait )
+
+    for name in names:
+        state[ name ][ 'tokens' ] -= 1.0
+
+    return( 0 )
+
+
+def load_state( pathname ):
+    """
+    read the shared state file.  A missing or damaged file is an
+    empty state, so every bucket starts full.
+
+    Arguments:
+        pathname
+    Returns:
+        dictionary of bucket name -> bucket
+    Exceptions:
+        none
+    """
+
+    try:
+        with open( pathname ) as f:
+            state = json.load( f )
+        if isinstance( state, dict ):
+            return( state )
+    except ( OSError, ValueError ):
+        pass
+
+    return( {} )
+
+
+def save_state( pathname, state ):
+    """
+    write the shared state file.  Only called while holding the lock.
+
+    Arguments:
+        1:  pathname
+        2:  dictionary of bucket name -> bucket
+    Returns:
+        None
+    Exceptions:
+        OSError
+    """
+
+    tmp_pathname = "{0}.{1}.tmp".format( pathname, os.getpid() )
+    with open( tmp_pathname, 'w' ) as f:
+        json.dump( state, f )
+    os.replace( tmp_pathname, pathname )
+
+    return( None )
+
+
+def acquire( account, method, rate, burst=None, method_rates=None,
+             state_dir=None ):
+    """
+    wait until a call to an API method is allowed, and take the tokens
+    for it
+
+    Arguments:
+        1:  account (API user)
+        2:  API method.  eg: getCDR
+        3:  calls per second allowed for the account.  0 = no limit
+        4:  optional maximum burst of calls.  At least 1.  Default is
+            the rate, or 1 if the rate is less than 1
+        5:  optional dictionary of API method -> calls per second
+        6:  optional directory to keep the shared state in.  If None,
+            the limit only holds within this process
+    Returns:
+        seconds spent waiting
+    Exceptions:
+        RateLimitError
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if method_rates == None:
+        method_rates = {}
+
+    rates = {}
+    if rate:
+        rates[ "{0}".format( account ) ] = float( rate )
+    for m in method_rates:
+        if float( method_rates[ m ] ) > 0:
+            rates[ "{0}/{1}".format( account, m ) ] = float( method_rates[ m ] )
+
+    names = []
+    for name in bucket_names( account, method, method_rates ):
+        if name in rates:
+            names.append( name )
+
+    if len( names ) == 0:
+        return( 0.0 )
+
+    if burst == None:
+        burst = max( 1.0, float( rate or 1 ))
+    burst = float( burst )
+    if burst < 1:
+        raise RateLimitError( "{0}burst must be at least 1. got {1}". \
+            format( sprefix, burst ))
+
+    state_pathname = None
+    lock_pathname  = None
+    if state_dir:
+        try:
+            os.makedirs( state_dir, exist_ok=True )
+        except OSError as err:
+            raise RateLimitError( "{0}{1}".format( sprefix, err )) from None
+        state_pathname = os.path.join( state_dir, STATE_FILE )
+        lock_pathname  = os.path.join( state_dir, LOCK_FILE )
+
+    waited = 0.0
+    while True:
+        with _thread_lock:
+            if state_pathname == None or fcntl == None:
+                wait = try_take( context.current().rate_buckets, names,
+                                 rates, burst, time.time() )
+            else:
+                try:
+                    with open( lock_pathname, 'a' ) as lock:
+                        fcntl.flock( lock, fcntl.LOCK_EX )
+                        try:
+                            state = load_state( state_pathname )
+                            wait = try_take( state, names, rates, burst,
+                                             time.time() )
+                            if wait == 0:
+                                save_state( state_pathname, state )
+                        finally:
+                            fcntl.flock( lock, fcntl.LOCK_UN )
+                except OSError as err:
+                    raise RateLimitError( "{0}{1}".format( sprefix, err )) \
+                        from None
+
+        if wait == 0:
+            return( waited )
+
+        time.sleep( wait )
+        waited = waited + wait
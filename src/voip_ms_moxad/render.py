@@ -0,0 +1,195 @@
+"""
+writing of records in machine-readable formats
+
+Records are dictionaries.  The order of the fields is worked out once
+by the caller (see field_order()) and every record is written with it.
+Output is gathered into chunks and written with a single write() per
+chunk rather than a print() per line.
+
+  json    a single JSON array of objects
+  jsonl   one JSON object per line
+  csv     a heading line of field names, then one line per record
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import io
+import csv
+import json
+
+FORMAT_TEXT  = 'text'
+FORMAT_JSON  = 'json'
+FORMAT_JSONL = 'jsonl'
+FORMAT_CSV   = 'csv'
+
+FORMATS = [ FORMAT_TEXT, FORMAT_JSON, FORMAT_JSONL, FORMAT_CSV ]
+
+CHUNK_SIZE = 1000       # records per write()
+
+
+class BadFormat( Exception ): pass
+
+
+def field_order( records, first=None ):
+    """
+    get the sorted list of every field used by a list of records
+
+    Arguments:
+        1:  list of dictionaries
+        2:  optional list of fields to put first, in the order given
+    Returns:
+        list of fields
+    Exceptions:
+        none
+    """
+
+    fields = set()
+    for record in records:
+        fields.update( record )
+
+    if first == None:
+        first = []
+
+    rest = sorted( fields.difference( first ))
+    return( list( first ) + rest )
+
+
+def write_records( records, fields, fmt, out=None ):
+    """
+    write records in a machine-readable format
+
+    Arguments:
+        1:  list (or any iterable) of dictionaries
+        2:  list of fields to write, in order
+        3:  format - one of json, jsonl or csv
+        4:  optional file to write to.  Default is stdout
+    Returns:
+        number of records written
+    Exceptions:
+        BadFormat
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if out == None:
+        out = sys.stdout
+
+    if fmt == FORMAT_JSON:
+        return( write_json( records, fields, out ))
+    if fmt == FORMAT_JSONL:
+        return( write_jsonl( records, fields, out ))
+    if fmt == FORMAT_CSV:
+        return( write_csv( records, fields, out ))
+
+    raise BadFormat( "{0}unknown format \'{1}\'. Must be one of: {2}". \
+        format( sprefix, fmt, ', '.join( FORMATS[1:] )))
+
+
+def write_jsonl( records, fields, out ):
+    """
+    write records as one JSON object per line
+
+    Arguments:
+        1:  iterable of dictionaries
+        2:  list of fields
+        3:  file to write to
+    Returns:
+        number of records written
+    Exceptions:
+        none
+    """
+
+    dumps = json.JSONEncoder( ensure_ascii=False ).encode
+    chunk = []
+    count = 0
+    for record in records:
+        chunk.append( dumps( { f: record.get( f, "" ) for f in fields } ))
+        count = count + 1
+        if len( chunk ) >= CHUNK_SIZE:
+            out.write( '\n'.join( chunk ) + '\n' )
+            chunk = []
+
+    if chunk:
+        out.write( '\n'.join( chunk ) + '\n' )
+
+    return( count )
+
+
+def write_json( records, fields, out ):
+    """
+    write records as a single JSON array
+
+    Arguments:
+        1:  iterable of dictionaries
+        2:  list of fields
+        3:  file to write to
+    Returns:
+        number of records written
+    Exceptions:
+        none
+    """
+
+    dumps = json.JSONEncoder( ensure_ascii=False ).encode
+    chunk = []
+    count = 0
+    out.write( '[' )
+    for record in records:
+        obj = dumps( { f: record.get( f, "" ) for f in fields } )
+        if count:
+            obj = ',\n' + obj
+        else:
+            obj = '\n' + obj
+        chunk.append( obj )
+        count = count + 1
+        if len( chunk ) >= CHUNK_SIZE:
+            out.write( ''.join( chunk ))
+            chunk = []
+
+    out.write( ''.join( chunk ) + '\n]\n' )
+
+    return( count )
+
+
+def write_csv( records, fields, out ):
+    """
+    write records as CSV with a heading line
+
+    Arguments:
+        1:  iterable of dictionaries
+        2:  list of fields
+        3:  file to write to
+    Returns:
+        number of records written
+    Exceptions:
+        none
+    """
+
+    buf = io.StringIO()
+    writer = csv.writer( buf, lineterminator='\n' )
+    writer.writerow( fields )
+
+    count = 0
+    for record in records:
+        writer.writerow( [ record.get( f, "" ) for f in fields ] )
+        count = count + 1
+        if count % CHUNK_SIZE == 0:
+            out.write( buf.getvalue() )
+            buf.seek( 0 )
+            buf.truncate()
+
+    out.write( buf.getvalue() )
+
+    return( count )
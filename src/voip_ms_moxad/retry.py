@@ -0,0 +1,287 @@
+"""
+retrying of failed calls to the voip.ms API
+
+A retry policy is a dictionary:
+
+  attempts      maximum number of attempts.  1 = no retries
+  backoff       seconds to wait before the first retry.  Doubled for
+                every retry after that
+  max-backoff   longest wait between attempts
+  jitter        fraction (0 to 1) of each wait that is randomized, so
+                programs that failed together don't retry together
+  statuses      HTTP status codes (numbers) and API statuses (strings)
+                that are worth retrying.  Timeouts and connection
+                errors are always worth retrying
+  deadline      give up once this many seconds have gone by since the
+                first attempt.  0 = no deadline
+
+Only idempotent API methods (the get* methods) are retried on their
+own.  Anything else, like sendSMS, is only retried if the caller gives
+a de-duplication key.  The key is saved in a ledger in the state
+directory once the call succeeds, and a later call with the same key
+is not sent again, so re-running a failed bulk job can't send the
+same message twice.  Only the status and id of the response are kept,
+and keys are forgotten after DEDUP_TTL seconds.
+
+The key only guards against running the same call again locally.  A
+call that timed out, or whose response was lost, is retried even if
+voip.ms got it, since its key was never saved.  So a sendSMS retried
+that way can still be delivered twice.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import random
+import sqlite3
+
+DEFAULT_POLICY = {
+    'attempts':     3,
+    'backoff':      0.5,
+    'max-backoff':  30.0,
+    'jitter':       0.5,
+    'statuses':     [ 429, 500, 502, 503, 504 ],
+    'deadline':     120.0,
+}
+
+LEDGER_FILE = 'dedup-keys.sqlite'
+DEDUP_TTL   = 30 * 24 * 3600    # seconds a de-duplication key is kept
+
+LEDGER_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS sent (
+        key         TEXT PRIMARY KEY,
+        time        INTEGER NOT NULL,
+        status      TEXT,
+        id_field    TEXT,
+        id          TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS sent_time ON sent ( time )",
+]
+
+
+def make_policy( base=None, overrides=None ):
+    """
+    build a retry policy
+
+    Arguments:
+        1:  optional policy to start from.  Default is DEFAULT_POLICY
+        2:  optional dictionary of settings to over-ride
+    Returns:
+        policy dictionary
+    Exceptions:
+        none
+    """
+
+    policy = dict( DEFAULT_POLICY )
+    if base != None:
+        policy.update( base )
+    if overrides != None:
+        policy.update( overrides )
+
+    return( policy )
+
+
+def is_idempotent( method ):
+    """
+    can an API method be safely sent more than once?
+
+    Arguments:
+        API method.  eg: getCDR
+    Returns:
+        True or False
+    Exceptions:
+        none
+    """
+
+    if method == None:
+        return( False )
+
+    return( method.startswith( 'get' ))
+
+
+def is_retryable( policy, http_status=None, api_status=None,
+                  exception=None ):
+    """
+    is a failed attempt worth retrying?
+
+    Arguments:
+        1:  retry policy
+        2:  optional HTTP status code
+        3:  optional status returned by the API
+        4:  optional exception raised by the attempt
+    Returns:
+        True or False
+    Exceptions:
+        none
+    """
+
+    statuses = policy.get( 'statuses', [] )
+
+    if http_status != None and http_status != 200:
+        return( http_status in statuses or str( http_status ) in statuses )
+
+    if api_status != None:
+        return( api_status in statuses )
+
+    # no response at all - a timeout or a connection failure
+    if exception != None:
+        return( True )
+
+    return( False )
+
+
+def delay( policy, attempt ):
+    """
+    get the seconds to wait before an attempt
+
+    Arguments:
+        1:  retry policy
+        2:  number of the attempt about to be made.  2 = first retry
+    Returns:
+        seconds
+    Exceptions:
+        none
+    """
+
+    wait = float( policy[ 'backoff' ] ) * ( 2 ** ( attempt - 2 ))
+    wait = min( wait, float( policy[ 'max-backoff' ] ))
+
+    jitter = float( policy[ 'jitter' ] )
+    if jitter > 0:
+        wait = wait * ( 1 - jitter ) + random.uniform( 0, wait * jitter )
+
+    return( wait )
+
+
+def time_left( policy, started ):
+    """
+    get the seconds left before the deadline of a policy
+
+    Arguments:
+        1:  retry policy
+        2:  time.monotonic() of the first attempt
+    Returns:
+        seconds.  None if there is no deadline
+    Exceptions:
+        none
+    """
+
+    deadline = float( policy.get( 'deadline' ) or 0 )
+    if deadline <= 0:
+        return( None )
+
+    return( deadline - ( time.monotonic() - started ))
+
+
+def _with_ledger( state_dir, func ):
+    """
+    call a function with the de-duplication ledger, in a transaction.
+    The ledger is indexed by key, so a lookup or a save costs the same
+    no matter how many keys it has
+
+    Arguments:
+        1:  state directory
+        2:  function taking a sqlite3 connection to the ledger
+    Returns:
+        result of the function
+    Exceptions:
+        OSError
+    """
+
+    os.makedirs( state_dir, exist_ok=True )
+    pathname = os.path.join( state_dir, LEDGER_FILE )
+
+    try:
+        conn = sqlite3.connect( pathname, timeout=30 )
+        try:
+            with conn:
+                for statement in LEDGER_SCHEMA:
+                    conn.execute( statement )
+                result = func( conn )
+        finally:
+            conn.close()
+    except sqlite3.Error as err:
+        raise OSError( "de-duplication ledger \'{0}\': {1}". \
+            format( pathname, err )) from None
+
+    return( result )
+
+
+def dedup_lookup( state_dir, key ):
+    """
+    see if a call with a de-duplication key already succeeded
+
+    Arguments:
+        1:  state directory
+        2:  de-duplication key
+    Returns:
+        the status and id of the response saved for the key, as a
+        response from the API.  eg: { 'status': 'success', 'sms': '23434' }
+        None if the key isn't saved, or was forgotten
+    Exceptions:
+        OSError
+    """
+
+    def lookup( conn ):
+        row = conn.execute( "SELECT status, id_field, id FROM sent " \
+            "WHERE key = ? AND time >= ?",
+            ( key, int( time.time() ) - DEDUP_TTL )).fetchone()
+        if row == None:
+            return( None )
+        status, id_field, id_ = row
+        response = { 'status': status }
+        if id_field != None:
+            response[ id_field ] = id_
+        return( response )
+
+    return( _with_ledger( state_dir, lookup ))
+
+
+def dedup_record( state_dir, key, response ):
+    """
+    save that a call with a de-duplication key succeeded, and forget the
+    keys older than DEDUP_TTL
+
+    Arguments:
+        1:  state directory
+        2:  de-duplication key
+        3:  response from the API.  Only its status and the first other
+            field that is a string or number (the id) are saved
+    Returns:
+        None
+    Exceptions:
+        OSError
+    """
+
+    status = None
+    id_field = None
+    id_ = None
+    if isinstance( response, dict ):
+        status = response.get( 'status' )
+        for field, value in response.items():
+            if field != 'status' and isinstance( value, ( str, int )):
+                id_field = field
+                id_ = str( value )
+                break
+
+    def save( conn ):
+        now = int( time.time() )
+        conn.execute( "DELETE FROM sent WHERE time < ?", ( now - DEDUP_TTL, ))
+        conn.execute( "INSERT OR REPLACE INTO sent VALUES ( ?, ?, ?, ?, ? )",
+                      ( key, now, status, id_field, id_ ))
+        return( None )
+
+    return( _with_ledger( state_dir, save ))
@@ -0,0 +1,281 @@
+"""
+daily rollups of CDRs (Call Display Records)
+
+A rollup is the totals of a day's CDRs per account: the number of calls,
+seconds, cost and the number of calls of each disposition.  CDRs of
+days that are over never change, so their rollups are saved in the
+state directory once, when the day's CDRs are fetched, and cost reports
+over long ranges add up rollups instead of fetching and adding up every
+CDR.  Only the days without a saved rollup are fetched from the API.
+
+Rollups are saved in:
+
+  <state-dir>/rollups/<query-key>/<YYYY-MM-DD>.json
+
+where the query key is a hash of everything besides the dates that
+changes which CDRs the API returns - the user, the dispositions wanted,
+the account and the timezone.
+
+  rollup = {
+      '1234_x': { 'calls': 3, 'seconds': 212, 'cost': 3400000,
+                  'dispositions': { 'ANSWERED': 2, 'NO ANSWER': 1 } },
+      ...
+  }
+
+Costs are in integer micro-cents (see money.py), so they add up exactly.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import hashlib
+
+from .dates import parse_day
+from . import money
+
+ROLLUP_DIR = 'rollups'
+
+
+class BadRollup( Exception ): pass
+
+
+def query_key( *parts ):
+    """
+    get the key of a CDR query, from everything besides the dates that
+    changes which CDRs are returned
+
+    Arguments:
+        strings.  eg: user, dispositions wanted, account, timezone
+    Returns:
+        string
+    Exceptions:
+        none
+    """
+
+    text = '|'.join( str( p ) for p in parts )
+    return( hashlib.sha1( text.encode( 'utf-8' )).hexdigest()[ :16 ] )
+
+
+def rollup_pathname( state_dir, key, day ):
+    """
+    get the pathname a rollup is saved in
+
+    Arguments:
+        1:  state directory
+        2:  query key
+        3:  day.  YYYY-MM-DD
+    Returns:
+        pathname
+    Exceptions:
+        BadRollup
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if not state_dir:
+        raise BadRollup( "{0}no state directory to keep rollups in". \
+            format( sprefix ))
+
+    return( os.path.join( state_dir, ROLLUP_DIR, key, day + '.json' ))
+
+
+def build_rollups( cdrs ):
+    """
+    roll up CDRs per day and account
+
+    Arguments:
+        iterable of CDR dictionaries, as returned by the getCDR API method
+    Returns:
+        dictionary of YYYY-MM-DD -> rollup
+    Exceptions:
+        none.  Fields that are missing or can't be parsed count as 0
+    """
+
+    rollups = {}
+    for cdr in cdrs:
+        day = str( cdr.get( 'date', '' ))[ :10 ]
+        rollup = rollups.get( day )
+        if rollup == None:
+            rollup = {}
+            rollups[ day ] = rollup
+
+        account = cdr.get( 'account', 'unknown' )
+        totals = rollup.get( account )
+        if totals == None:
+            totals = { 'calls': 0, 'seconds': 0, 'cost': 0,
+                       'dispositions': {} }
+            rollup[ account ] = totals
+
+        try:
+            seconds = int( cdr.get( 'seconds', 0 ))
+        except ValueError:
+            seconds = 0
+
+        totals[ 'calls' ] += 1
+        totals[ 'seconds' ] += seconds
+        totals[ 'cost' ] += money.cdr_cost( cdr )
+
+        disposition = cdr.get( 'disposition', 'unknown' )
+        dispositions = totals[ 'dispositions' ]
+        dispositions[ disposition ] = dispositions.get( disposition, 0 ) + 1
+
+    return( rollups )
+
+
+def load( state_dir, key, day ):
+    """
+    get a saved rollup
+
+    Arguments:
+        1:  state directory
+        2:  query key
+        3:  day.  YYYY-MM-DD
+    Returns:
+        rollup, or None if there isn't one saved
+    Exceptions:
+        BadRollup
+    """
+
+    try:
+        with open( rollup_pathname( state_dir, key, day )) as f:
+            rollup = json.load( f )
+        # rollups saved before costs were in micro-cents have dollars
+        for totals in rollup.values():
+            if isinstance( totals[ 'cost' ], float ):
+                totals[ 'cost' ] = money.parse( round( totals[ 'cost' ],
+                                                       money.PLACES ))
+    except ( OSError, ValueError, KeyError, TypeError, AttributeError ):
+        return( None )
+
+    return( rollup )
+
+
+def save( state_dir, key, day, rollup ):
+    """
+    save a rollup.  Only days that are over should be saved
+
+    Arguments:
+        1:  state directory
+        2:  query key
+        3:  day.  YYYY-MM-DD
+        4:  rollup.  Empty if the day had no CDRs
+    Returns:
+        None
+    Exceptions:
+        BadRollup.  A failure to write is ignored
+    """
+
+    pathname = rollup_pathname( state_dir, key, day )
+    try:
+        os.makedirs( os.path.dirname( pathname ), exist_ok=True )
+        tmp_pathname = "{0}.{1}.tmp".format( pathname, os.getpid() )
+        with open( tmp_pathname, 'w' ) as f:
+            json.dump( rollup, f )
+        os.replace( tmp_pathname, pathname )
+    except OSError:
+        pass
+
+    return( None )
+
+
+def save_finished_days( state_dir, key, days, rollups, today ):
+    """
+    save the rollups of the days that are over
+
+    Arguments:
+        1:  state directory
+        2:  query key
+        3:  list of days whose CDRs were fetched.  YYYY-MM-DD
+        4:  dictionary of YYYY-MM-DD -> rollup, from build_rollups()
+        5:  today.  YYYY-MM-DD.  Today and later are not saved
+    Returns:
+        number of rollups saved.  Rollups already saved are left alone
+    Exceptions:
+        BadRollup
+    """
+
+    count = 0
+    for day in days:
+        if day >= today:
+            continue
+        if os.path.exists( rollup_pathname( state_dir, key, day )):
+            continue
+        save( state_dir, key, day, rollups.get( day, {} ))
+        count = count + 1
+
+    return( count )
+
+
+def missing_ranges( days, max_days=None ):
+    """
+    group days into ranges of consecutive days, so each range can be
+    fetched with a single API call
+
+    Arguments:
+        1:  sorted list of days.  YYYY-MM-DD
+        2:  optional most days in a range.  Default is no limit
+    Returns:
+        list of ( first day, last day )
+    Exceptions:
+        none
+    """
+
+    ranges = []
+    previous = None
+    num_days = 0
+    for day in days:
+        date = parse_day( day ).toordinal()
+        if previous != None and date == previous + 1 and \
+                ( max_days == None or num_days < max_days ):
+            ranges[-1] = ( ranges[-1][0], day )
+            num_days = num_days + 1
+        else:
+            ranges.append( ( day, day ))
+            num_days = 1
+        previous = date
+
+    return( ranges )
+
+
+def sum_rollups( rollups ):
+    """
+    add up rollups
+
+    Arguments:
+        iterable of rollups
+    Returns:
+        a rollup of the totals per account
+    Exceptions:
+        none
+    """
+
+    totals = {}
+    for rollup in rollups:
+        for account, t in rollup.items():
+            mine = totals.get( account )
+            if mine == None:
+                mine = { 'calls': 0, 'seconds': 0, 'cost': 0,
+                         'dispositions': {} }
+                totals[ account ] = mine
+            mine[ 'calls' ] += t[ 'calls' ]
+            mine[ 'seconds' ] += t[ 'seconds' ]
+            mine[ 'cost' ] += t[ 'cost' ]
+            for disposition, n in t[ 'dispositions' ].items():
+                mine[ 'dispositions' ][ disposition ] = \
+                    mine[ 'dispositions' ].get( disposition, 0 ) + n
+
+    return( totals )
@@ -46,7 +46,12 @@ try:
     from config_moxad import config
 
     from .functions import find_config_file, dprint, send_request, BadWebCall
-    from . import globals
+    from .functions import setup_api, api_url, InvalidArgument
+    from .functions import run_program
+    from .transport import redact_url
+    from .phone import canonical, BadNumber
+    from . import context
+    from . import profiling
     from . import __version__
 except ModuleNotFoundError as err:
     sys.stderr.write( "Error: missing module: %s\n" % err )
@@ -64,8 +69,9 @@ except ModuleNotFoundError as err:
 #   0
 
 def usage( values ):
+    ctx = context.current()
     print( "usage: {} [option]* -r recipient message-to-send". \
-        format( globals.progname ))
+        format( ctx.progname ))
 
     config_file = values.get( 'config-file', '?' )
     did_number  = values.get( 'did-number', '?' )
@@ -76,10 +82,14 @@ def usage( values ):
     [-d|--debug]         (debugging output)
     [-n|--no-send]       (don't send the message, but show URL to send)
     [-h|--help]          (help)
+    [-k|--dedup-key key] (retry on failure, and never send twice with key)
     [-l|--line phone]    (sender DID-phone-number. default={})
     [-s|--show-aliases]  (show any aliases set in config file)
     [-t|--timeout num]   (default={})
     [-V|--version]       (print version)
+    [--profile]          (print a profile of where time and memory went)
+    [--profile-file f]   (--profile, and save cProfile data to file f)
+    [--stats]            (print statistics about API calls)
     -r|--recipient phone-number\
     """
 
@@ -96,15 +106,16 @@ def usage( values ):
 #   0:  ok
 #   1:  not ok
 
-def main( argv=sys.argv ):
+def main_program( argv ):
+    ctx = context.current()
     config_file = None
 
     progname = argv[0]
     if progname == None or progname == "":
         progname = 'blacklist'
 
-    globals.progname = progname     # make available to other functions
-    globals.debug_flag = False      # used by functions.debug
+    ctx.progname = progname     # make available to other functions
+    ctx.debug_flag = False      # used by functions.debug
 
     # set some defaults
     # These may be over-written by config file values
@@ -125,6 +136,7 @@ def main( argv=sys.argv ):
     show_aliases_flag = False     # show any aliases set
     recipient         = ""        # phone number to send message to
     message           = ""        # the message to send.
+    dedup_key         = None      # key to safely retry sending with
 
     # process options
 
@@ -144,7 +156,14 @@ def main( argv=sys.argv ):
                 continue
 
             if arg == '-d' or arg == '--debug':
-                globals.debug_flag = True
+                ctx.debug_flag = True
+            elif arg == '--stats':
+                ctx.stats_flag = True
+            elif arg == '--profile':
+                profiling.start()
+            elif arg == '--profile-file':
+                i = i + 1 ;     ctx.profile_file = argv[i]
+                profiling.start()
             elif arg == '-n' or arg == '--no-send':
                 dont_send_flag = True
             elif arg == '-V' or arg == '--version':
@@ -153,6 +172,8 @@ def main( argv=sys.argv ):
                 return(0)
             elif arg == '-c' or arg == '--config':
                 i += 1 ;    config_file = argv[i] 
+            elif arg == '-k' or arg == '--dedup-key':
+                i += 1 ;    dedup_key = argv[i]
             elif arg == '-r' or arg == '--recipient':
                 i += 1 ;    recipient = argv[i] 
             elif arg == '-l' or arg == '--line':
@@ -176,6 +197,7 @@ def main( argv=sys.argv ):
 
     # find the config file we really want
 
+    profiling.phase_start( 'config' )
     config_file = find_config_file( config_file ) ;
     if not config_file:
         sys.stderr.write( "{0}: could not find a config file\n". \
@@ -183,7 +205,7 @@ def main( argv=sys.argv ):
         return(1) ;
     dprint( "using config file: " + config_file )
 
-    config.Config.set_debug( globals.debug_flag )
+    config.Config.set_debug( ctx.debug_flag )
 
     # no definitions file.  Our type info is all in our config file.
     try:
@@ -194,6 +216,14 @@ def main( argv=sys.argv ):
 
     dprint( "Config data read OK.  double-plus woohoo." )
 
+    # where and how we talk to the API
+
+    try:
+        setup_api( conf )
+    except InvalidArgument as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
     # make sure we have our mandatory sections
     needed_sections = [ 'authentication', 'sms' ]
     sections = conf.get_sections()
@@ -226,7 +256,7 @@ def main( argv=sys.argv ):
     password = conf.get_values( 'authentication', 'pass' )
 
     dprint( "user = {0:s}".format( userid ))
-    dprint( "pass = {0:s}".format( password ))
+    dprint( "pass = *****" )
 
     # values from the config file over-ride any defaults
     keywords = conf.get_keywords( 'sms' )
@@ -344,21 +374,19 @@ def main( argv=sys.argv ):
             format( recipient ))
 
 
-    # now remove any spaces and dashes from the phone numbers
+    # now remove any formatting from the phone numbers
 
-    recipient = recipient.replace( '-', '' )        # remove dashes
-    recipient = recipient.replace( ' ', '' )        # remove dashes
-    m = re.match( "^\d+$", recipient )
-    if not m:
+    try:
+        recipient = canonical( recipient )
+    except BadNumber:
         err = "recipient phone number must be digits: \'{0:s}\'.". \
             format( recipient )
         sys.stderr.write( "{0:s}: {1:s}\n".format( progname, err ))
         return(1)
 
-    did = did.replace( '-', '' )        # remove dashes
-    did = did.replace( ' ', '' )        # remove dashes
-    m = re.match( "^\d+$", did )
-    if not m:
+    try:
+        did = canonical( did )
+    except BadNumber:
         err = "DID phone number must be digits: \'{0:s}\'.". \
             format( did )
         sys.stderr.write( "{0:s}: {1:s}\n".format( progname, err ))
@@ -366,12 +394,14 @@ def main( argv=sys.argv ):
 
     # we now have all the info we need to send the message
 
+    profiling.phase_end( 'config' )
+
     # build the base URL
 
-    base_url = "https://voip.ms/api/v1/rest.php" + \
+    base_url = api_url() + \
             "?api_username={0:s}&api_password={1:s}". \
                 format( userid, password )
-    dprint( "BASE URL = " + base_url )
+    dprint( "BASE URL = " + redact_url( base_url ))
 
     # escape the message
     message = urllib.parse.quote( message )
@@ -388,7 +418,7 @@ def main( argv=sys.argv ):
     # send the request
 
     try:
-         json_struct = send_request( url, timeout )
+         json_struct = send_request( url, timeout, dedup_key=dedup_key )
     except BadWebCall as err:
         sys.stderr.write( "{0:s}: {1:s}\n".format( progname, str(err)))
         return(1)
@@ -396,3 +426,16 @@ def main( argv=sys.argv ):
     # if we appeared to make the call ok, then we're done
 
     return 0
+
+
+# entry point of the program
+#
+# Arguments:
+#   command-line arguments
+# Returns:
+#   return value of main_program()
+# Exceptions:
+#   none
+
+def main( argv=sys.argv ):
+    return( run_program( main_program, argv ))
@@ -0,0 +1,448 @@
+"""
+approximate counting of distinct values and of quantiles
+
+Sketches use a fixed, small amount of memory no matter how many values
+are added, and two sketches of the same kind and settings can be merged
+into one as if all the values had been added to a single sketch.  So
+reports over years of CDRs can be built from per-day or per-shard
+sketches without holding the CDRs.
+
+  HyperLogLog   the number of distinct values (eg: callers).  With the
+                default precision of 12, 4096 one-byte registers are
+                used and the error is about 1.6%
+
+  DDSketch      quantiles (eg: the 95th percentile call duration).  Any
+                quantile is within the relative accuracy (default 1%)
+                of the true value
+
+Sketches are dictionaries.  hll_dump()/ddsketch_dump() turn them into
+something that can be saved as JSON, and hll_load()/ddsketch_load()
+turn that back into a sketch.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import math
+import base64
+import hashlib
+
+HLL_PRECISION = 12          # 2^12 registers
+DDSKETCH_ACCURACY = 0.01    # relative accuracy of quantiles
+DDSKETCH_MAX_BINS = 2048    # lowest bins are collapsed past this
+
+
+class BadSketch( Exception ): pass
+
+
+def hash64( value ):
+    """
+    get a 64-bit hash of a value
+
+    Arguments:
+        value.  Converted to a string if it isn't one
+    Returns:
+        integer
+    Exceptions:
+        none
+    """
+
+    digest = hashlib.blake2b( str( value ).encode( 'utf-8' ),
+                              digest_size=8 ).digest()
+    return( int.from_bytes( digest, 'big' ))
+
+
+def new_hll( precision=HLL_PRECISION ):
+    """
+    create an empty HyperLogLog sketch
+
+    Arguments:
+        optional precision - number of bits of the hash used to pick a
+        register.  4 to 16
+    Returns:
+        sketch
+    Exceptions:
+        BadSketch
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if precision < 4 or precision > 16:
+        raise BadSketch( "{0}precision must be from 4 to 16: {1}". \
+            format( sprefix, precision ))
+
+    return( { 'precision': precision,
+              'registers': bytearray( 1 << precision ) } )
+
+
+def hll_add( sketch, value ):
+    """
+    add a value to a HyperLogLog sketch
+
+    Arguments:
+        1:  sketch
+        2:  value
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    precision = sketch[ 'precision' ]
+    h = hash64( value )
+    register = h >> ( 64 - precision )
+    rest_bits = 64 - precision
+    rest = h & (( 1 << rest_bits ) - 1 )
+
+    # position of the leftmost 1 bit in what's left of the hash
+    rank = rest_bits - rest.bit_length() + 1
+
+    registers = sketch[ 'registers' ]
+    if rank > registers[ register ]:
+        registers[ register ] = rank
+
+    return( None )
+
+
+def hll_count( sketch ):
+    """
+    estimate the number of distinct values added to a HyperLogLog sketch
+
+    Arguments:
+        sketch
+    Returns:
+        integer
+    Exceptions:
+        none
+    """
+
+    registers = sketch[ 'registers' ]
+    m = len( registers )
+    if m == 16:
+        alpha = 0.673
+    elif m == 32:
+        alpha = 0.697
+    elif m == 64:
+        alpha = 0.709
+    else:
+        alpha = 0.7213 / ( 1 + 1.079 / m )
+
+    total = 0.0
+    zeros = 0
+    for r in registers:
+        total += 2.0 ** -r
+        if r == 0:
+            zeros = zeros + 1
+
+    estimate = alpha * m * m / total
+
+    # linear counting is better for small numbers of values
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log( m / zeros )
+
+    return( int( round( estimate )))
+
+
+def hll_merge( sketch, other ):
+    """
+    merge a HyperLogLog sketch into another
+
+    Arguments:
+        1:  sketch to merge into
+        2:  sketch to merge from.  Not changed
+    Returns:
+        None
+    Exceptions:
+        BadSketch
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if sketch[ 'precision' ] != other[ 'precision' ]:
+        raise BadSketch( "{0}can't merge sketches of precision {1} and {2}". \
+            format( sprefix, sketch[ 'precision' ], other[ 'precision' ] ))
+
+    registers = sketch[ 'registers' ]
+    for i, r in enumerate( other[ 'registers' ] ):
+        if r > registers[i]:
+            registers[i] = r
+
+    return( None )
+
+
+def hll_dump( sketch ):
+    """
+    get a HyperLogLog sketch in a form that can be saved as JSON
+
+    Arguments:
+        sketch
+    Returns:
+        dictionary
+    Exceptions:
+        none
+    """
+
+    return( { 'type': 'hll', 'precision': sketch[ 'precision' ],
+              'registers': base64.b64encode( sketch[ 'registers' ] ). \
+                  decode( 'ascii' ) } )
+
+
+def hll_load( saved ):
+    """
+    get a HyperLogLog sketch back from hll_dump()
+
+    Arguments:
+        dictionary from hll_dump()
+    Returns:
+        sketch
+    Exceptions:
+        BadSketch
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        if saved[ 'type' ] != 'hll':
+            raise ValueError( "not a HyperLogLog sketch" )
+        sketch = new_hll( saved[ 'precision' ] )
+        registers = base64.b64decode( saved[ 'registers' ] )
+        if len( registers ) != len( sketch[ 'registers' ] ):
+            raise ValueError( "wrong number of registers" )
+    except ( KeyError, TypeError, ValueError ) as err:
+        raise BadSketch( "{0}bad saved sketch: {1}".format( sprefix, err )) \
+            from None
+
+    sketch[ 'registers' ] = bytearray( registers )
+    return( sketch )
+
+
+def new_ddsketch( accuracy=DDSKETCH_ACCURACY, max_bins=DDSKETCH_MAX_BINS ):
+    """
+    create an empty DDSketch for quantiles of values that are 0 or more
+
+    Arguments:
+        1:  optional relative accuracy.  eg: 0.01 for 1%
+        2:  optional maximum number of bins
+    Returns:
+        sketch
+    Exceptions:
+        BadSketch
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if accuracy <= 0 or accuracy >= 1:
+        raise BadSketch( "{0}accuracy must be between 0 and 1: {1}". \
+            format( sprefix, accuracy ))
+
+    gamma = ( 1 + accuracy ) / ( 1 - accuracy )
+    return( {
+        'accuracy':     accuracy,
+        'max-bins':     max_bins,
+        'log-gamma':    math.log( gamma ),
+        'bins':         {},     # index -> count
+        'zeros':        0,      # count of values of 0 (or less)
+        'count':        0,
+        'sum':          0.0,
+        'min':          None,
+        'max':          None,
+    } )
+
+
+def ddsketch_add( sketch, value, count=1 ):
+    """
+    add a value to a DDSketch
+
+    Arguments:
+        1:  sketch
+        2:  value
+        3:  optional number of times to add it
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    if value <= 0:
+        sketch[ 'zeros' ] += count
+    else:
+        index = int( math.ceil( math.log( value ) / sketch[ 'log-gamma' ] ))
+        bins = sketch[ 'bins' ]
+        bins[ index ] = bins.get( index, 0 ) + count
+        if len( bins ) > sketch[ 'max-bins' ]:
+            ddsketch_collapse( sketch )
+
+    sketch[ 'count' ] += count
+    sketch[ 'sum' ] += value * count
+    if sketch[ 'min' ] == None or value < sketch[ 'min' ]:
+        sketch[ 'min' ] = value
+    if sketch[ 'max' ] == None or value > sketch[ 'max' ]:
+        sketch[ 'max' ] = value
+
+    return( None )
+
+
+def ddsketch_collapse( sketch ):
+    """
+    collapse the lowest bins of a DDSketch into one, so there are no more
+    than the maximum number of bins.  Only the accuracy of the lowest
+    quantiles is lost
+
+    Arguments:
+        sketch
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    bins = sketch[ 'bins' ]
+    excess = len( bins ) - sketch[ 'max-bins' ]
+    if excess <= 0:
+        return( None )
+
+    indexes = sorted( bins )
+    into = indexes[ excess ]
+    for index in indexes[ :excess ]:
+        bins[ into ] += bins.pop( index )
+
+    return( None )
+
+
+def ddsketch_quantile( sketch, fraction ):
+    """
+    estimate a quantile of the values added to a DDSketch
+
+    Arguments:
+        1:  sketch
+        2:  fraction.  eg: 0.95
+    Returns:
+        value.  None if the sketch is empty
+    Exceptions:
+        none
+    """
+
+    if sketch[ 'count' ] == 0:
+        return( None )
+
+    if fraction <= 0:
+        return( sketch[ 'min' ] )
+    if fraction >= 1:
+        return( sketch[ 'max' ] )
+
+    rank = fraction * ( sketch[ 'count' ] - 1 )
+    seen = sketch[ 'zeros' ]
+    if seen > rank:
+        return( 0 )
+
+    gamma = math.exp( sketch[ 'log-gamma' ] )
+    bins = sketch[ 'bins' ]
+    for index in sorted( bins ):
+        seen = seen + bins[ index ]
+        if seen > rank:
+            # middle of the bin, so within the accuracy either way
+            value = 2 * gamma ** index / ( gamma + 1 )
+            return( min( max( value, sketch[ 'min' ] ), sketch[ 'max' ] ))
+
+    return( sketch[ 'max' ] )
+
+
+def ddsketch_merge( sketch, other ):
+    """
+    merge a DDSketch into another
+
+    Arguments:
+        1:  sketch to merge into
+        2:  sketch to merge from.  Not changed
+    Returns:
+        None
+    Exceptions:
+        BadSketch
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if sketch[ 'accuracy' ] != other[ 'accuracy' ]:
+        raise BadSketch( "{0}can't merge sketches of accuracy {1} and {2}". \
+            format( sprefix, sketch[ 'accuracy' ], other[ 'accuracy' ] ))
+
+    if other[ 'count' ] == 0:
+        return( None )
+
+    bins = sketch[ 'bins' ]
+    for index, count in other[ 'bins' ].items():
+        bins[ index ] = bins.get( index, 0 ) + count
+    ddsketch_collapse( sketch )
+
+    sketch[ 'zeros' ] += other[ 'zeros' ]
+    sketch[ 'count' ] += other[ 'count' ]
+    sketch[ 'sum' ] += other[ 'sum' ]
+    if sketch[ 'min' ] == None or other[ 'min' ] < sketch[ 'min' ]:
+        sketch[ 'min' ] = other[ 'min' ]
+    if sketch[ 'max' ] == None or other[ 'max' ] > sketch[ 'max' ]:
+        sketch[ 'max' ] = other[ 'max' ]
+
+    return( None )
+
+
+def ddsketch_dump( sketch ):
+    """
+    get a DDSketch in a form that can be saved as JSON
+
+    Arguments:
+        sketch
+    Returns:
+        dictionary
+    Exceptions:
+        none
+    """
+
+    saved = { 'type': 'ddsketch' }
+    for key in [ 'accuracy', 'max-bins', 'zeros', 'count', 'sum', 'min',
+                 'max' ]:
+        saved[ key ] = sketch[ key ]
+
+    # JSON keys are strings, so save the bins as pairs
+    saved[ 'bins' ] = sorted( sketch[ 'bins' ].items() )
+
+    return( saved )
+
+
+def ddsketch_load( saved ):
+    """
+    get a DDSketch back from ddsketch_dump()
+
+    Arguments:
+        dictionary from ddsketch_dump()
+    Returns:
+        sketch
+    Exceptions:
+        BadSketch
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        if saved[ 'type' ] != 'ddsketch':
+            raise ValueError( "not a DDSketch" )
+        sketch = new_ddsketch( saved[ 'accuracy' ], saved[ 'max-bins' ] )
+        for key in [ 'zeros', 'count', 'sum', 'min', 'max' ]:
+            sketch[ key ] = saved[ key ]
+        sketch[ 'bins' ] = { int( i ): int( n ) for i, n in saved[ 'bins' ] }
+    except ( KeyError, TypeError, ValueError ) as err:
+        raise BadSketch( "{0}bad saved sketch: {1}".format( sprefix, err )) \
+            from None
+
+    return( sketch )
@@ -0,0 +1,382 @@
+"""
+receive SMS messages sent to your voip.ms phone lines
+
+Run a local web server for the SMS URL callback of voip.ms, storing
+the messages received, and print the messages stored.
+
+Examples:
+    sms-receiver --help
+    sms-receiver --listen 0.0.0.0:8088 --token secret
+    sms-receiver --tail --follow
+    sms-receiver --query --did 416-555-1212 --since 2024-01-01
+
+Set the SMS URL callback of a DID in the voip.ms portal to something
+like:
+
+  http://your-host:8088/sms?token=secret&id={ID}&date={TIMESTAMP}&from={FROM}&to={TO}&message={MESSAGE}&media={MEDIA}
+
+Messages are stored in sms.sqlite in the state directory, which
+get-sms also uses.
+"""
+
+# Copyright 2019 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import re
+
+try:
+    import time
+    import signal
+    import asyncio
+
+    from config_moxad import config
+
+    from .functions import find_config_file, dprint, setup_api
+    from .functions import InvalidArgument, run_program
+    from .functions import want_a_positive_integer
+    from .phone import canonical, BadNumber
+    from .webhook import new_receiver, serve
+    from .webhook import DEFAULT_PATH, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL
+    from .webhook import DEFAULT_REQUEST_TIMEOUT
+    from . import sms_store
+    from . import dates
+    from . import context
+    from . import log
+    from . import __version__
+except ModuleNotFoundError as err:
+    sys.stderr.write( "Error: missing module: %s\n" % err )
+    sys.exit(1)
+
+DEFAULT_LISTEN = '127.0.0.1:8088'
+
+
+# print usage
+#
+# Arguments:
+#   a dictionary containing values for:
+#       'config-file'
+#       'listen'
+#       'path'
+#       'batch-size'
+#       'flush-interval'
+#       'request-timeout'
+# Returns:
+#   0
+
+def usage( values ):
+    print( "usage: {} [options]*".format( context.current().progname ))
+
+    options = """\
+    [-c|--config file]     (config-file (default={})
+    [-d|--debug]           (debugging output)
+    [-h|--help]            (help)
+    [-l|--listen host:port]  (address to receive on (default={})
+    [-p|--path path]       (path of the callback URL (default={})
+    [-k|--token str]       (secret the callback URL has to give as token=)
+    [-b|--batch-size num]  (most messages stored at once (default={})
+    [-i|--flush-interval s]  (seconds to wait for more to store (default={})
+    [-w|--request-timeout s] (seconds to send a request in (default={})
+    [-t|--tail]            (print the latest messages stored)
+    [-f|--follow]          (--tail, and keep printing new messages)
+    [-n|--lines num]       (number of messages --tail prints (default=10))
+    [-q|--query]           (print the messages stored matching below)
+    [--did num]            (only messages to or from your line num)
+    [--contact num]        (only messages to or from the number num)
+    [--since date]         (YYYY-MM-DD - only messages from date on)
+    [--until date]         (YYYY-MM-DD - only messages up to date)
+    [-V|--version]         (print version of this program)\
+    """
+
+    print( options.format( values.get( 'config-file', '?' ),
+        values.get( 'listen', '?' ), values.get( 'path', '?' ),
+        values.get( 'batch-size', '?' ), values.get( 'flush-interval', '?' ),
+        values.get( 'request-timeout', '?' )))
+
+    return(0)
+
+
+# print messages from the store, and with follow, keep printing the new
+# ones until interrupted
+#
+# Arguments:
+#   1:  pathname of the store
+#   2:  dictionary of arguments to sms_store.find_messages()
+#   3:  True to keep printing new messages
+# Returns:
+#   0
+# Exceptions:
+#   sms_store.BadStore
+
+def print_messages( pathname, query, follow ):
+    conn = sms_store.open_store( pathname, read_only=True )
+    try:
+        last = 0
+        for message in sms_store.find_messages( conn, **query ):
+            print( sms_store.format_message( message ))
+            last = max( last, message[ 'rowid' ] )
+
+        if follow:
+            last = max( last, sms_store.last_rowid( conn ))
+            query = dict( query, limit=None )
+            while True:
+                time.sleep( 1 )
+                for message in sms_store.find_messages( conn, after=last,
+                                                        **query ):
+                    print( sms_store.format_message( message ), flush=True )
+                    last = max( last, message[ 'rowid' ] )
+    finally:
+        conn.close()
+
+    return(0)
+
+
+# main program
+#
+# Arguments:
+#   command-line arguments
+# Returns:
+#   0:  ok
+#   1:  not ok
+# Exceptions:
+#   none
+
+def main_program( argv ):
+    ctx = context.current()
+    config_file = None
+
+    progname = argv[0]
+    if progname == None or progname == "":
+        progname = 'sms-receiver'
+
+    ctx.progname = progname     # make available to other functions
+    ctx.debug_flag = False      # used by functions.debug
+
+    # set some defaults
+    # These may be over-written by config file values
+
+    defaults = {
+        'listen':           DEFAULT_LISTEN,
+        'path':             DEFAULT_PATH,
+        'token':            None,
+        'batch-size':       DEFAULT_BATCH_SIZE,
+        'flush-interval':   DEFAULT_FLUSH_INTERVAL,
+        'request-timeout':  DEFAULT_REQUEST_TIMEOUT,
+    }
+
+    # values from the command-line will go into values.
+
+    values = {}
+
+    help_flag   = False
+    tail_flag   = False
+    follow_flag = False
+    query_flag  = False
+    lines       = 10
+    query       = {}
+
+    # process options
+
+    num_args = len( argv )
+    i = 1
+    while i < num_args:
+        try:
+            arg = argv[i]
+
+            m = re.match( '^-', arg )
+            if not m:
+                sys.stderr.write( "{0}: unexpected argument: {1}\n". \
+                    format( progname, arg ))
+                return(1)
+
+            if arg == '-d' or arg == '--debug':
+                ctx.debug_flag = True
+            elif arg == '-h' or arg == '--help':
+                help_flag = True
+            elif arg == '-V' or arg == '--version':
+                print( "package version: {0}".format( __version__ ))
+                print( "config  version: {0}".format( config.__version__ ))
+                return(0)
+            elif arg == '-c' or arg == '--config':
+                i = i + 1 ;     config_file = argv[i]
+            elif arg == '-l' or arg == '--listen':
+                i = i + 1 ;     values[ 'listen' ] = argv[i]
+            elif arg == '-p' or arg == '--path':
+                i = i + 1 ;     values[ 'path' ] = argv[i]
+            elif arg == '-k' or arg == '--token':
+                i = i + 1 ;     values[ 'token' ] = argv[i]
+            elif arg == '-b' or arg == '--batch-size':
+                i = i + 1 ;     values[ 'batch-size' ] = argv[i]
+            elif arg == '-i' or arg == '--flush-interval':
+                i = i + 1 ;     values[ 'flush-interval' ] = argv[i]
+            elif arg == '-w' or arg == '--request-timeout':
+                i = i + 1 ;     values[ 'request-timeout' ] = argv[i]
+            elif arg == '-t' or arg == '--tail':
+                tail_flag = True
+            elif arg == '-f' or arg == '--follow':
+                tail_flag = True
+                follow_flag = True
+            elif arg == '-n' or arg == '--lines':
+                i = i + 1
+                try:
+                    lines = want_a_positive_integer( argv[i], 'lines' )
+                except ValueError as err:
+                    sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+                    return(1)
+            elif arg == '-q' or arg == '--query':
+                query_flag = True
+            elif arg == '--did' or arg == '--contact':
+                i = i + 1
+                try:
+                    query[ arg[ 2: ]] = canonical( argv[i] )
+                except BadNumber as err:
+                    sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+                    return(1)
+            elif arg == '--since' or arg == '--until':
+                i = i + 1
+                if not dates.is_valid_format( argv[i] ):
+                    sys.stderr.write( "{0}: bad date for {1}: \'{2}\'. " \
+                        "Use YYYY-MM-DD\n".format( progname, arg, argv[i] ))
+                    return(1)
+                query[ arg[ 2: ]] = dates.parse_day( argv[i] ).isoformat()
+            else:
+                sys.stderr.write( "{0}: no such option: {1}\n". \
+                    format( progname, arg ))
+                return(1)
+
+            i = i + 1
+        except IndexError as err:
+            sys.stderr.write( "{0}: missing value for option {1}\n". \
+                format( progname, arg ))
+            return(1)
+
+    # find the config file we really want
+
+    config_file = find_config_file( config_file ) ;
+    if not config_file:
+        sys.stderr.write( "{0}: could not find a config file\n". \
+            format( progname ))
+        return(1) ;
+    dprint( "using config file: " + config_file )
+
+    config.Config.set_debug( ctx.debug_flag )
+
+    # no definitions file.  Our type info is all in our config file.
+    try:
+        conf = config.Config( config_file, '', AcceptUndefinedKeywords=True )
+    except Exception as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    # where the state directory is
+
+    try:
+        setup_api( conf )
+    except InvalidArgument as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    # values from the config file over-ride any defaults
+
+    if 'sms-receiver' in conf.get_sections():
+        for keyword in conf.get_keywords( 'sms-receiver' ):
+            if conf.get_type( 'sms-receiver', keyword ) == 'scalar':
+                val = conf.get_values( 'sms-receiver', keyword )
+                defaults[ keyword ] = val
+                dprint( "Replacing/setting default for \'{0}\'", keyword )
+
+    for field in defaults:
+        if ( field not in values ) or ( values[ field ] == None ):
+            values[ field ] = defaults[ field ]
+
+    if help_flag:
+        usage( dict( values, **{ 'config-file': config_file } ))
+        return(0)
+
+    try:
+        batch_size = want_a_positive_integer( values[ 'batch-size' ],
+                                              'batch-size' )
+        flush_interval = float( values[ 'flush-interval' ] )
+        if flush_interval < 0:
+            raise ValueError( "flush-interval must be a positive number" )
+        request_timeout = float( values[ 'request-timeout' ] )
+        if request_timeout <= 0:
+            raise ValueError( "request-timeout must be a positive number" )
+    except ValueError as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    host, colon, port = str( values[ 'listen' ] ).rpartition( ':' )
+    if colon == "" or not port.isdigit():
+        sys.stderr.write( "{0}: listen must be host:port: \'{1}\'\n". \
+            format( progname, values[ 'listen' ] ))
+        return(1)
+
+    try:
+        pathname = sms_store.store_pathname( ctx.state_dir )
+    except sms_store.BadStore as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+
+    # print what we have already received
+
+    if tail_flag or query_flag:
+        if tail_flag:
+            query[ 'limit' ] = lines
+        try:
+            return( print_messages( pathname, query, follow_flag ))
+        except sms_store.BadStore as err:
+            sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+            return(1)
+        except KeyboardInterrupt:
+            return(0)
+
+    # receive messages until killed
+
+    if values[ 'token' ] == None:
+        log.warning( "no token.  Anyone who can reach {0} can add messages",
+                     values[ 'listen' ] )
+
+    receiver = new_receiver( pathname, values[ 'token' ], values[ 'path' ],
+                             batch_size, flush_interval, request_timeout )
+
+    # stop cleanly when killed by a service manager, like with a ^C
+    signal.signal( signal.SIGTERM, signal.default_int_handler )
+    try:
+        asyncio.run( serve( receiver, host or None, int( port )))
+    except ( OSError, sms_store.BadStore ) as err:
+        sys.stderr.write( "{0}: {1}\n".format( progname, err ))
+        return(1)
+    except KeyboardInterrupt:
+        pass
+
+    counts = receiver[ 'counts' ]
+    log.info( "received {0} messages, stored {1}, {2} duplicates, {3} " \
+        "rejected", counts[ 'received' ], counts[ 'stored' ],
+        counts[ 'duplicates' ], counts[ 'rejected' ] )
+
+    return(0)
+
+
+# entry point of the program
+#
+# Arguments:
+#   command-line arguments
+# Returns:
+#   return value of main_program()
+# Exceptions:
+#   none
+
+def main( argv=sys.argv ):
+    return( run_program( main_program, argv ))
@@ -0,0 +1,411 @@
+"""
+a local store of SMS messages in SQLite
+
+Messages received by sms-receiver, and synced from the API by get-sms,
+are kept in:
+
+  <state-dir>/sms.sqlite
+
+in a table 'messages', indexed by DID, contact and date, so they can be
+queried locally:
+
+  conn = open_store( store_pathname( state_dir ))
+  add_messages( conn, [ message ] )
+  for message in find_messages( conn, did='4165551212', limit=10 ):
+      print( format_message( message ))
+
+A message is a dictionary of:
+
+  'id':         the voip.ms id of the message
+  'date':       YYYY-MM-DD HH:MM:SS
+  'did':        your phone line
+  'contact':    the phone number of the other end
+  'direction':  'received' or 'sent'
+  'type':       'SMS' or 'MMS'
+  'message':    the text of the message
+  'media':      list of URLs of any media
+  'source':     where it came from.  'webhook' or 'getSMS'
+
+The store is in WAL mode, so it can be read while it is written.  A
+message already stored, with the same id, isn't stored again.
+
+The table 'sync' has the watermark of each DID synced from the API by
+get-sms: the date and id of the latest message fetched, and the day it
+was synced up to, so the next sync only asks for what came after.
+"""
+
+# Copyright 2019 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import urllib.parse
+
+STORE_FILE = 'sms.sqlite'
+
+DIRECTION_RECEIVED = 'received'
+DIRECTION_SENT     = 'sent'
+
+COLUMNS = [ 'id', 'date', 'did', 'contact', 'direction', 'type', 'message',
+            'media', 'source' ]
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS messages (
+        id          TEXT PRIMARY KEY,
+        date        TEXT,
+        did         TEXT,
+        contact     TEXT,
+        direction   TEXT,
+        type        TEXT,
+        message     TEXT,
+        media       TEXT,
+        source      TEXT,
+        stored      REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS messages_did ON messages ( did, date )",
+    "CREATE INDEX IF NOT EXISTS messages_contact ON messages ( contact, date )",
+    "CREATE INDEX IF NOT EXISTS messages_date ON messages ( date )",
+    """CREATE TABLE IF NOT EXISTS sync (
+        did         TEXT PRIMARY KEY,
+        date        TEXT,
+        id          TEXT,
+        synced_to   TEXT,
+        synced      REAL
+    )""",
+]
+
+
+class BadStore( Exception ): pass
+
+
+def store_pathname( state_dir ):
+    """
+    get the pathname of the store
+
+    Arguments:
+        state directory
+    Returns:
+        pathname
+    Exceptions:
+        BadStore
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if not state_dir:
+        raise BadStore( "{0}no state directory to keep messages in". \
+            format( sprefix ))
+
+    return( os.path.join( state_dir, STORE_FILE ))
+
+
+def open_store( pathname, read_only=False ):
+    """
+    open the store, creating it if need be.  The connection can be used
+    by a thread other than the one opening it, but only one at a time
+
+    Arguments:
+        1:  pathname of the store
+        2:  optional True to open it only for reading.  It has to exist
+    Returns:
+        sqlite3 connection
+    Exceptions:
+        BadStore
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        if read_only:
+            if not os.path.exists( pathname ):
+                raise BadStore( "{0}no messages stored in \'{1}\'". \
+                    format( sprefix, pathname ))
+            uri = "file:{0}?mode=ro".format( urllib.parse.quote( pathname ))
+            conn = sqlite3.connect( uri, uri=True, check_same_thread=False )
+        else:
+            os.makedirs( os.path.dirname( pathname ) or '.', exist_ok=True )
+            conn = sqlite3.connect( pathname, timeout=30,
+                                    check_same_thread=False )
+            conn.execute( "PRAGMA journal_mode=WAL" )
+            # every commit is synced to disk before it returns, so a
+            # message stored survives a power loss.  The receiver stores a
+            # batch of messages per commit, so it is one sync per batch
+            conn.execute( "PRAGMA synchronous=FULL" )
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute( statement )
+    except ( OSError, sqlite3.Error ) as err:
+        raise BadStore( "{0}can't open \'{1}\': {2}". \
+            format( sprefix, pathname, err )) from None
+
+    conn.row_factory = sqlite3.Row
+    return( conn )
+
+
+def message_id( message ):
+    """
+    get the id of a message, making one up from its contents if it
+    doesn't have one
+
+    Arguments:
+        message dictionary
+    Returns:
+        string
+    Exceptions:
+        none
+    """
+
+    if message.get( 'id' ):
+        return( str( message[ 'id' ] ))
+
+    key = "|".join( str( message.get( f, '' ))
+                    for f in [ 'date', 'did', 'contact', 'direction',
+                               'message' ] )
+    return( 'local-' + hashlib.sha1( key.encode( 'utf-8' )).hexdigest() )
+
+
+def add_messages( conn, messages ):
+    """
+    store messages, in a single transaction
+
+    Arguments:
+        1:  sqlite3 connection from open_store()
+        2:  iterable of message dictionaries
+    Returns:
+        number of messages stored.  Messages already stored aren't
+        counted
+    Exceptions:
+        BadStore
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    now = time.time()
+    rows = []
+    for message in messages:
+        rows.append( ( message_id( message ), message.get( 'date' ),
+            message.get( 'did' ), message.get( 'contact' ),
+            message.get( 'direction', DIRECTION_RECEIVED ),
+            message.get( 'type', 'SMS' ), message.get( 'message', '' ),
+            json.dumps( message.get( 'media', [] )),
+            message.get( 'source' ), now ))
+
+    try:
+        before = conn.total_changes
+        with conn:
+            conn.executemany( "INSERT OR IGNORE INTO messages ( {0}, stored ) " \
+                "VALUES ( {1} )".format( ', '.join( COLUMNS ),
+                ', '.join( [ '?' ] * ( len( COLUMNS ) + 1 ))), rows )
+    except sqlite3.Error as err:
+        raise BadStore( "{0}can't store messages: {1}". \
+            format( sprefix, err )) from None
+
+    return( conn.total_changes - before )
+
+
+def _message( row ):
+    """
+    convert a row of the messages table into a message dictionary
+    """
+
+    message = { c: row[ c ] for c in COLUMNS }
+    try:
+        message[ 'media' ] = json.loads( message[ 'media' ] or '[]' )
+    except ValueError:
+        message[ 'media' ] = []
+    message[ 'rowid' ] = row[ 'rowid' ]
+
+    return( message )
+
+
+def find_messages( conn, did=None, contact=None, since=None, until=None,
+                   direction=None, after=None, limit=None ):
+    """
+    find stored messages
+
+    Arguments:
+        1:  sqlite3 connection from open_store()
+        2:  optional DID, or list of DIDs
+        3:  optional phone number of the other end
+        4:  optional earliest date.  YYYY-MM-DD[ HH:MM:SS]
+        5:  optional latest date.  A date without a time includes the
+            whole day
+        6:  optional direction.  'received' or 'sent'
+        7:  optional rowid.  Only messages stored after it are found
+        8:  optional maximum number of messages.  The latest are found
+    Returns:
+        list of message dictionaries, oldest first.  Each has the
+        'rowid' it was stored with
+    Exceptions:
+        BadStore
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    where = []
+    args = []
+    if isinstance( did, ( list, tuple )):
+        where.append( "did IN ( {0} )". \
+            format( ', '.join( [ '?' ] * len( did ))))
+        args.extend( did )
+        did = None
+    for column, value in [ ( 'did', did ), ( 'contact', contact ),
+                           ( 'direction', direction ) ]:
+        if value != None:
+            where.append( "{0} = ?".format( column ))
+            args.append( value )
+    if since != None:
+        where.append( "date >= ?" )
+        args.append( since )
+    if until != None:
+        if len( until ) == 10:
+            until = until + " 23:59:59"
+        where.append( "date <= ?" )
+        args.append( until )
+    if after != None:
+        where.append( "rowid > ?" )
+        args.append( after )
+
+    sql = "SELECT rowid, * FROM messages"
+    if where:
+        sql = sql + " WHERE " + " AND ".join( where )
+
+    # the latest, put back in order
+    if limit != None:
+        sql = "SELECT * FROM ( {0} ORDER BY date DESC, rowid DESC " \
+            "LIMIT {1:d} )".format( sql, int( limit ))
+    sql = sql + " ORDER BY date, rowid"
+
+    try:
+        rows = conn.execute( sql, args ).fetchall()
+    except sqlite3.Error as err:
+        raise BadStore( "{0}query failed: {1}".format( sprefix, err )) \
+            from None
+
+    return( [ _message( row ) for row in rows ] )
+
+
+def last_rowid( conn ):
+    """
+    get the rowid of the last message stored
+
+    Arguments:
+        sqlite3 connection from open_store()
+    Returns:
+        integer.  0 if there are no messages
+    Exceptions:
+        BadStore
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        row = conn.execute( "SELECT max( rowid ) FROM messages" ).fetchone()
+    except sqlite3.Error as err:
+        raise BadStore( "{0}query failed: {1}".format( sprefix, err )) \
+            from None
+
+    return( row[0] or 0 )
+
+
+def get_watermark( conn, did ):
+    """
+    get the watermark of a DID synced from the API
+
+    Arguments:
+        1:  sqlite3 connection from open_store()
+        2:  DID, or the key used when syncing all of them
+    Returns:
+        dictionary of 'date' and 'id' of the latest message fetched, and
+        'synced_to', the last day synced.  YYYY-MM-DD.  None if the DID
+        has never been synced
+    Exceptions:
+        BadStore
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        row = conn.execute( "SELECT date, id, synced_to FROM sync " \
+            "WHERE did = ?", ( did, )).fetchone()
+    except sqlite3.Error as err:
+        raise BadStore( "{0}query failed: {1}".format( sprefix, err )) \
+            from None
+
+    if row == None:
+        return( None )
+
+    return( { 'date': row[ 'date' ], 'id': row[ 'id' ],
+              'synced_to': row[ 'synced_to' ] } )
+
+
+def set_watermark( conn, did, watermark ):
+    """
+    save the watermark of a DID synced from the API.  None forgets it, so
+    the next sync starts over
+
+    Arguments:
+        1:  sqlite3 connection from open_store()
+        2:  DID, or the key used when syncing all of them
+        3:  dictionary like get_watermark() returns, or None
+    Returns:
+        None
+    Exceptions:
+        BadStore
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        with conn:
+            if watermark == None:
+                conn.execute( "DELETE FROM sync WHERE did = ?", ( did, ))
+            else:
+                conn.execute( "INSERT OR REPLACE INTO sync ( did, date, id, " \
+                    "synced_to, synced ) VALUES ( ?, ?, ?, ?, ? )",
+                    ( did, watermark.get( 'date' ), watermark.get( 'id' ),
+                      watermark.get( 'synced_to' ), time.time() ))
+    except sqlite3.Error as err:
+        raise BadStore( "{0}can't save the watermark: {1}". \
+            format( sprefix, err )) from None
+
+    return( None )
+
+
+def format_message( message ):
+    """
+    format a message for printing
+
+    Arguments:
+        message dictionary
+    Returns:
+        string.  eg: '2024-01-02 12:00:00  4165551212 <- 5195551212  hi'
+    Exceptions:
+        none
+    """
+
+    arrow = '<-'
+    if message.get( 'direction' ) == DIRECTION_SENT:
+        arrow = '->'
+
+    text = str( message.get( 'message' ) or '' ).replace( '\n', ' ' )
+    for url in message.get( 'media' ) or []:
+        text = ( text + ' [' + str( url ) + ']' ).strip()
+
+    return( "{0}  {1} {2} {3}  {4}".format( message.get( 'date' ),
+        message.get( 'did' ), arrow, message.get( 'contact' ), text ))
@@ -0,0 +1,248 @@
+"""
+sorting of CDRs (Call Display Records) by their fields
+
+Small sets of CDRs are sorted in memory.  Once more than a given number
+of CDRs have been read, each buffer-full is sorted and spilled to a
+temporary file, and the files are merged as they are read back, so
+sorting millions of CDRs needs memory for only one buffer-full, as
+long as the caller doesn't keep its own references to the CDRs.  At
+most MAX_MERGE_FILES files are merged at once.  Once there are that
+many, they are merged into one file before sorting goes on:
+
+  key = sort_key( parse_sort_fields( 'account,date' ))
+  for cdr in sort_records( cdrs, key, max_records=100000 ):
+      ...
+
+Fields holding numbers are compared as numbers, the rest as strings.
+Sorts are stable, so CDRs with the same key stay in the order given.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import heapq
+import tempfile
+
+# fields of a CDR compared as numbers
+NUMERIC_FIELDS = frozenset([ 'seconds', 'rate', 'total' ])
+
+# CDRs sorted in memory before spilling to temporary files
+DEFAULT_MAX_RECORDS = 250000
+MIN_MAX_RECORDS     = 1000
+
+# most temporary files open at once while merging
+MAX_MERGE_FILES = 32
+
+
+class BadSortField( Exception ): pass
+
+
+def parse_sort_fields( spec ):
+    """
+    parse a comma-separated list of fields to sort by
+
+    Arguments:
+        fields.  eg: 'account,date'
+    Returns:
+        list of fields
+    Exceptions:
+        BadSortField
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    fields = [ f.strip() for f in spec.split( ',' ) if f.strip() != "" ]
+    if len( fields ) == 0:
+        raise BadSortField( "{0}no fields to sort by".format( sprefix ))
+
+    return( fields )
+
+
+def check_sort_fields( fields, record ):
+    """
+    check the fields to sort by are fields of the records
+
+    Arguments:
+        1:  list of fields
+        2:  a record.  eg: a CDR
+    Returns:
+        None
+    Exceptions:
+        BadSortField
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    for field in fields:
+        if field not in record:
+            raise BadSortField( "{0}unknown field \'{1}\'. Must be one of: " \
+                "{2}".format( sprefix, field, ', '.join( sorted( record ))))
+
+    return( None )
+
+
+def _number( value ):
+    """
+    convert the value of a numeric field for comparing.  Anything that
+    isn't a number sorts first
+    """
+
+    try:
+        return( float( value ))
+    except ( TypeError, ValueError ):
+        return( float( '-inf' ))
+
+
+def sort_key( fields ):
+    """
+    get a key function for sorting records by fields
+
+    Arguments:
+        list of fields
+    Returns:
+        function taking a record, returning its key
+    Exceptions:
+        none
+    """
+
+    getters = []
+    for field in fields:
+        if field in NUMERIC_FIELDS:
+            getters.append( lambda r, f=field: _number( r.get( f )))
+        else:
+            getters.append( lambda r, f=field: str( r.get( f, '' )))
+
+    if len( getters ) == 1:
+        return( getters[0] )
+
+    getters = tuple( getters )
+    return( lambda r: tuple( g( r ) for g in getters ))
+
+
+def _spill( records, tmp_dir ):
+    """
+    write sorted records to a temporary file, one JSON object per line
+
+    Arguments:
+        1:  sorted records
+        2:  directory for the file.  None for the default
+    Returns:
+        open file, positioned at the start
+    """
+
+    f = tempfile.TemporaryFile( mode='w+', encoding='utf-8', dir=tmp_dir )
+    for record in records:
+        f.write( json.dumps( record ))
+        f.write( '\n' )
+    f.seek( 0 )
+
+    return( f )
+
+
+def _read_spill( f ):
+    """
+    read back the records of a temporary file written by _spill()
+    """
+
+    for line in f:
+        yield json.loads( line )
+
+
+def _merge_spills( spills, key, reverse, tmp_dir, final=False ):
+    """
+    merge the newest temporary files written by _spill(), so there are
+    never more than MAX_MERGE_FILES to merge at once.  Files are merged
+    MAX_MERGE_FILES at a time once there are that many of the same
+    level, so each record is written again only a few times.  Only
+    consecutive files are merged, which keeps the sort stable
+
+    Arguments:
+        1:  list of [ level, open file ], in the order their records
+            were read.  Changed in place
+        2:  key function
+        3:  True if sorted in descending order
+        4:  directory for the files.  None for the default
+        5:  optional True to merge until there are fewer than
+            MAX_MERGE_FILES, whatever their levels
+    Returns:
+        None
+    """
+
+    while len( spills ) >= MAX_MERGE_FILES:
+        tail = spills[ -MAX_MERGE_FILES: ]
+        if not final and tail[0][0] != tail[-1][0]:
+            break
+
+        try:
+            streams = [ _read_spill( f ) for level, f in tail ]
+            merged = _spill( heapq.merge( *streams, key=key,
+                                          reverse=reverse ), tmp_dir )
+        finally:
+            for level, f in tail:
+                f.close()
+        del spills[ -MAX_MERGE_FILES: ]
+        spills.append( [ tail[-1][0] + 1, merged ] )
+
+    return( None )
+
+
+def sort_records( records, key, reverse=False,
+                  max_records=DEFAULT_MAX_RECORDS, tmp_dir=None ):
+    """
+    sort records, in memory if there are at most max_records of them,
+    else with an external merge sort using temporary files
+
+    Arguments:
+        1:  iterable of records.  The records have to be JSON
+            serializable if there are more than max_records of them
+        2:  key function.  See sort_key()
+        3:  optional True to sort in descending order
+        4:  optional maximum number of records to sort in memory.  At
+            least MIN_MAX_RECORDS are
+        5:  optional directory for temporary files
+    Returns:
+        iterator of the records in sorted order
+    Exceptions:
+        OSError
+    """
+
+    max_records = max( max_records, MIN_MAX_RECORDS )
+
+    buffer = []
+    spills = []
+    try:
+        for record in records:
+            buffer.append( record )
+            if len( buffer ) >= max_records:
+                buffer.sort( key=key, reverse=reverse )
+                spills.append( [ 0, _spill( buffer, tmp_dir ) ] )
+                buffer = []
+                _merge_spills( spills, key, reverse, tmp_dir )
+
+        buffer.sort( key=key, reverse=reverse )
+        if len( spills ) == 0:
+            yield from buffer
+            return
+
+        # the records still in memory are merged with the spilled ones
+
+        _merge_spills( spills, key, reverse, tmp_dir, final=True )
+        streams = [ _read_spill( f ) for level, f in spills ]
+        streams.append( iter( buffer ))
+        yield from heapq.merge( *streams, key=key, reverse=reverse )
+    finally:
+        for level, f in spills:
+            f.close()
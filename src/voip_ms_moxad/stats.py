@@ -0,0 +1,387 @@
+"""
+statistics about calls made to the voip.ms API
+
+send_request() records every API call here: a count per API method,
+the HTTP and API status codes returned, the size of the responses and
+a latency histogram for each phase of the call:
+
+  request     DNS lookup, connect, TLS and waiting for the response
+              headers.  Only the first call of a program pays for the
+              DNS lookup, connect and TLS since the connection is kept
+              alive.
+  transfer    reading the body of the response
+  parse       decoding the JSON
+  total       all of the above
+
+The statistics are kept in the current context (see context.py), so
+each run of a program has its own.  They can be printed with report(),
+written to a Prometheus textfile with write_prometheus() or sent to a
+StatsD daemon with send_statsd().
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+import socket
+import threading
+
+from . import context
+
+PHASES = [ 'request', 'transfer', 'parse', 'total' ]
+
+# upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = [ 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+            10.0, 30.0, 60.0 ]
+
+_lock = threading.Lock()
+
+
+def reset():
+    """
+    throw away any statistics gathered so far
+
+    Arguments:
+        none
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    with _lock:
+        context.current().metrics.clear()
+
+    return( None )
+
+
+def new_histogram():
+    """
+    create an empty latency histogram
+
+    Arguments:
+        none
+    Returns:
+        dictionary with 'buckets' (counts per bucket in BUCKETS plus
+        one for anything larger), 'count' and 'sum'
+    Exceptions:
+        none
+    """
+
+    return( { 'buckets': [ 0 ] * ( len( BUCKETS ) + 1 ), 'count': 0,
+              'sum': 0.0 } )
+
+
+def observe( histogram, seconds ):
+    """
+    add a latency to a histogram
+
+    Arguments:
+        1:  histogram from new_histogram()
+        2:  seconds
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    i = 0
+    for bound in BUCKETS:
+        if seconds <= bound:
+            break
+        i = i + 1
+
+    histogram[ 'buckets' ][i] += 1
+    histogram[ 'count' ] += 1
+    histogram[ 'sum' ] += seconds
+
+    return( None )
+
+
+def record_call( method, timings, http_status=None, api_status=None,
+                 num_bytes=0, error=None ):
+    """
+    record an API call
+
+    Arguments:
+        1:  API method. eg: getCDR
+        2:  dictionary of seconds taken by each phase in PHASES
+        3:  optional HTTP status code
+        4:  optional status returned by the API.  eg: success
+        5:  optional size of the response in bytes
+        6:  optional exception if the call failed
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    if method == None or method == "":
+        method = 'unknown'
+
+    metrics = context.current().metrics
+    with _lock:
+        if method not in metrics:
+            m = {
+                'calls':        0,
+                'errors':       0,
+                'bytes':        0,
+                'http-status':  {},
+                'api-status':   {},
+                'phases':       {},
+            }
+            for phase in PHASES:
+                m[ 'phases' ][ phase ] = new_histogram()
+            metrics[ method ] = m
+
+        m = metrics[ method ]
+        m[ 'calls' ] += 1
+        m[ 'bytes' ] += num_bytes
+        if error != None:
+            m[ 'errors' ] += 1
+
+        if http_status != None:
+            code = str( http_status )
+            m[ 'http-status' ][ code ] = m[ 'http-status' ].get( code, 0 ) + 1
+
+        if api_status != None:
+            m[ 'api-status' ][ api_status ] = \
+                m[ 'api-status' ].get( api_status, 0 ) + 1
+
+        for phase in timings:
+            if phase in m[ 'phases' ]:
+                observe( m[ 'phases' ][ phase ], timings[ phase ] )
+
+    return( None )
+
+
+def get_metrics():
+    """
+    get the statistics gathered so far
+
+    Arguments:
+        none
+    Returns:
+        dictionary keyed by API method, of the current context
+    Exceptions:
+        none
+    """
+
+    return( context.current().metrics )
+
+
+def percentile( histogram, fraction ):
+    """
+    estimate a percentile from a histogram.  The upper bound of the
+    bucket the percentile falls into is returned.
+
+    Arguments:
+        1:  histogram
+        2:  fraction.  eg: 0.95
+    Returns:
+        seconds, or None if the histogram is empty
+    Exceptions:
+        none
+    """
+
+    if histogram[ 'count' ] == 0:
+        return( None )
+
+    wanted = fraction * histogram[ 'count' ]
+    seen = 0
+    for i in range( 0, len( BUCKETS )):
+        seen = seen + histogram[ 'buckets' ][i]
+        if seen >= wanted:
+            return( BUCKETS[i] )
+
+    return( float( 'inf' ))
+
+
+def report( out=sys.stderr ):
+    """
+    print a human-readable report of the statistics
+
+    Arguments:
+        optional file to print to.  Default is stderr
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    metrics = context.current().metrics
+    if len( metrics ) == 0:
+        out.write( "stats: no API calls were made\n" )
+        return( None )
+
+    for method in sorted( metrics ):
+        m = metrics[ method ]
+        out.write( "stats: {0}: {1} calls, {2} errors, {3} bytes\n". \
+            format( method, m[ 'calls' ], m[ 'errors' ], m[ 'bytes' ] ))
+
+        codes = [ "{0}={1}".format( k, v ) for k, v in
+                  sorted( m[ 'http-status' ].items() ) ]
+        codes = codes + [ "{0}={1}".format( k, v ) for k, v in
+                          sorted( m[ 'api-status' ].items() ) ]
+        if codes:
+            out.write( "stats: {0}:   status: {1}\n". \
+                format( method, ' '.join( codes )))
+
+        for phase in PHASES:
+            h = m[ 'phases' ][ phase ]
+            if h[ 'count' ] == 0:
+                continue
+            avg = h[ 'sum' ] / h[ 'count' ]
+            p95 = percentile( h, 0.95 )
+            out.write( "stats: {0}:   {1:<8s} avg {2:.3f}s  " \
+                "total {3:.3f}s  p95 <= {4}s\n". \
+                format( method, phase, avg, h[ 'sum' ], p95 ))
+
+    return( None )
+
+
+def prometheus_lines( prefix='voip_ms_api' ):
+    """
+    get the statistics in the Prometheus text exposition format
+
+    Arguments:
+        optional prefix for the metric names
+    Returns:
+        list of lines
+    Exceptions:
+        none
+    """
+
+    metrics = context.current().metrics
+    lines = []
+    lines.append( "# TYPE {0}_calls_total counter".format( prefix ))
+    lines.append( "# TYPE {0}_errors_total counter".format( prefix ))
+    lines.append( "# TYPE {0}_response_bytes_total counter".format( prefix ))
+    lines.append( "# TYPE {0}_http_status_total counter".format( prefix ))
+    lines.append( "# TYPE {0}_api_status_total counter".format( prefix ))
+    lines.append( "# TYPE {0}_seconds histogram".format( prefix ))
+
+    for method in sorted( metrics ):
+        m = metrics[ method ]
+        label = 'method="{0}"'.format( method )
+
+        lines.append( "{0}_calls_total{{{1}}} {2}". \
+            format( prefix, label, m[ 'calls' ] ))
+        lines.append( "{0}_errors_total{{{1}}} {2}". \
+            format( prefix, label, m[ 'errors' ] ))
+        lines.append( "{0}_response_bytes_total{{{1}}} {2}". \
+            format( prefix, label, m[ 'bytes' ] ))
+
+        for code in sorted( m[ 'http-status' ] ):
+            lines.append( "{0}_http_status_total{{{1},code=\"{2}\"}} {3}". \
+                format( prefix, label, code, m[ 'http-status' ][ code ] ))
+        for status in sorted( m[ 'api-status' ] ):
+            lines.append( "{0}_api_status_total{{{1},status=\"{2}\"}} {3}". \
+                format( prefix, label, status, m[ 'api-status' ][ status ] ))
+
+        for phase in PHASES:
+            h = m[ 'phases' ][ phase ]
+            labels = "{0},phase=\"{1}\"".format( label, phase )
+            cumulative = 0
+            for i in range( 0, len( BUCKETS )):
+                cumulative = cumulative + h[ 'buckets' ][i]
+                lines.append( "{0}_seconds_bucket{{{1},le=\"{2}\"}} {3}". \
+                    format( prefix, labels, BUCKETS[i], cumulative ))
+            lines.append( "{0}_seconds_bucket{{{1},le=\"+Inf\"}} {2}". \
+                format( prefix, labels, h[ 'count' ] ))
+            lines.append( "{0}_seconds_sum{{{1}}} {2:.6f}". \
+                format( prefix, labels, h[ 'sum' ] ))
+            lines.append( "{0}_seconds_count{{{1}}} {2}". \
+                format( prefix, labels, h[ 'count' ] ))
+
+    return( lines )
+
+
+def write_prometheus( pathname ):
+    """
+    write the statistics to a Prometheus textfile, such as one read by
+    the node_exporter textfile collector.  The file is replaced atomically.
+
+    Arguments:
+        pathname
+    Returns:
+        None
+    Exceptions:
+        OSError
+    """
+
+    tmp_pathname = "{0}.{1}.tmp".format( pathname, os.getpid() )
+    with open( tmp_pathname, 'w' ) as f:
+        f.write( '\n'.join( prometheus_lines() ) + '\n' )
+    os.replace( tmp_pathname, pathname )
+
+    return( None )
+
+
+def send_statsd( address, prefix='voip_ms.api' ):
+    """
+    send the statistics to a StatsD daemon over UDP
+
+    Arguments:
+        1:  host:port
+        2:  optional prefix for the metric names
+    Returns:
+        None
+    Exceptions:
+        ValueError
+        OSError
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        host, port = address.rsplit( ':', 1 )
+        port = int( port )
+    except ValueError:
+        raise ValueError( "{0}StatsD address must be host:port. got \'{1}\'". \
+            format( sprefix, address )) from None
+
+    metrics = context.current().metrics
+    lines = []
+    for method in sorted( metrics ):
+        m = metrics[ method ]
+        name = "{0}.{1}".format( prefix, method )
+        lines.append( "{0}.calls:{1}|c".format( name, m[ 'calls' ] ))
+        lines.append( "{0}.errors:{1}|c".format( name, m[ 'errors' ] ))
+        lines.append( "{0}.bytes:{1}|c".format( name, m[ 'bytes' ] ))
+        for code in m[ 'http-status' ]:
+            lines.append( "{0}.http_status.{1}:{2}|c". \
+                format( name, code, m[ 'http-status' ][ code ] ))
+        for phase in PHASES:
+            h = m[ 'phases' ][ phase ]
+            if h[ 'count' ]:
+                lines.append( "{0}.{1}:{2:.3f}|ms". \
+                    format( name, phase, 1000 * h[ 'sum' ] / h[ 'count' ] ))
+
+    sock = socket.socket( socket.AF_INET, socket.SOCK_DGRAM )
+    try:
+        # keep each datagram well under a typical MTU
+        packet = ""
+        for line in lines:
+            if len( packet ) + len( line ) > 1000:
+                sock.sendto( packet.encode( 'utf-8' ), ( host, port ))
+                packet = ""
+            packet = packet + line + '\n'
+        if packet:
+            sock.sendto( packet.encode( 'utf-8' ), ( host, port ))
+    finally:
+        sock.close()
+
+    return( None )
@@ -0,0 +1,346 @@
+"""
+transport layer used by send_request() to talk to the voip.ms API
+
+The transport is selected by functions.setup_api() from the config
+file or environment:
+
+  http      talk to the API over a kept-alive HTTP session
+  record    talk to the API and save every response into a directory
+  replay    serve previously recorded responses from a directory,
+            without any network access
+
+Recorded responses are keyed by the fields of the request URL with the
+password removed, so a recording made against one endpoint or with one
+password can be replayed against another.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+import time
+import hashlib
+import urllib.parse
+
+from . import context
+from .constants import TRANSPORT_HTTP, TRANSPORT_RECORD, TRANSPORT_REPLAY
+
+_progname = context.current().progname
+if _progname == None:
+    _progname = ''
+else:
+    _progname = _progname + ': '
+
+# This module should already be installed
+try:
+    import requests
+except Exception as err:
+    sys.stderr.write( "{0}{1}\n".format( _progname, err ))
+    sys.stderr.write( "{0}use 'pip install' to install missing module\n". \
+        format( _progname ))
+    sys.exit(1)
+
+
+class TransportError( Exception ): pass
+
+# query fields that never go into a recording key or a printed URL
+SECRET_FIELDS = [ 'api_password' ]
+
+def get_session():
+    """
+    get the HTTP session of the current context, shared by its requests,
+    so the connection to the API is kept alive between calls
+
+    Arguments:
+        none
+    Returns:
+        requests.Session
+    Context:
+        ctx.session
+    Exceptions:
+        none
+    """
+
+    ctx = context.current()
+    if ctx.session == None:
+        ctx.session = requests.Session()
+
+    return( ctx.session )
+
+
+def redact_url( url ):
+    """
+    replace any password in a URL so it can be safely printed
+
+    Arguments:
+        URL
+    Returns:
+        URL with the value of any secret fields replaced with '*****'
+    Exceptions:
+        none
+    """
+
+    parts = urllib.parse.urlsplit( url )
+    if parts.query == "":
+        return( url )
+
+    fields = []
+    for field in parts.query.split( '&' ):
+        name = field.split( '=', 1 )[0]
+        if name in SECRET_FIELDS:
+            field = name + '=*****'
+        fields.append( field )
+
+    return( urllib.parse.urlunsplit( parts._replace( query='&'.join( fields ))))
+
+
+def request_field( url, name ):
+    """
+    get the value of a field in the query of a request
+
+    Arguments:
+        1:  URL
+        2:  name of the field.  eg: method
+    Returns:
+        value, or None if there isn't one
+    Exceptions:
+        none
+    """
+
+    prefix = name + '='
+    query = urllib.parse.urlsplit( url ).query
+    for field in query.split( '&' ):
+        if field.startswith( prefix ):
+            return( urllib.parse.unquote( field[ len( prefix ): ] ))
+
+    return( None )
+
+
+def request_method( url ):
+    """
+    get the API method of a request
+
+    Arguments:
+        URL
+    Returns:
+        method.  eg: getCDR.   None if there isn't one
+    Exceptions:
+        none
+    """
+
+    return( request_field( url, 'method' ))
+
+
+def request_key( url, with_secrets=False ):
+    """
+    get a key identifying a request, independent of the endpoint and
+    the order of the fields in the URL.  The password is left out, so
+    recordings can be replayed with any password, unless asked for.
+    Then a hash of it is put in, so configs with the same user and
+    different passwords get keys of their own
+
+    Arguments:
+        1:  URL
+        2:  optional True to key on a hash of the secret fields too
+    Returns:
+        hex string
+    Exceptions:
+        none
+    """
+
+    parts = urllib.parse.urlsplit( url )
+    fields = []
+    for field in parts.query.split( '&' ):
+        name, _, value = field.partition( '=' )
+        if name not in SECRET_FIELDS:
+            fields.append( field )
+        elif with_secrets:
+            digest = hashlib.sha256( value.encode( 'utf-8' )).hexdigest()
+            fields.append( "{0}={1}".format( name, digest ))
+    fields.sort()
+
+    key = '&'.join( fields )
+    return( hashlib.sha1( key.encode( 'utf-8' )).hexdigest() )
+
+
+def recording_pathname( url ):
+    """
+    get the pathname a response for a URL is recorded into
+
+    Arguments:
+        URL
+    Returns:
+        pathname
+    Context:
+        ctx.transport_dir
+    Exceptions:
+        TransportError
+    """
+
+    ctx = context.current()
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if ctx.transport_dir == None or ctx.transport_dir == "":
+        raise TransportError( "{0}no directory given for the \'{1}\' " \
+            "transport".format( sprefix, ctx.transport ))
+
+    return( os.path.join( ctx.transport_dir, request_key( url ) + '.json' ))
+
+
+def http_fetch( url, timeout, timings=None ):
+    """
+    send a URL to the API over the shared HTTP session
+
+    Arguments:
+        1:  URL
+        2:  timeout in seconds
+        3:  optional dictionary to save the seconds taken by the
+            'request' and 'transfer' phases into
+    Returns:
+        tuple of ( HTTP-status-code, body as bytes )
+    Exceptions:
+        any exception raised by requests
+    """
+
+    start = time.perf_counter()
+    res = get_session().get( url, timeout=timeout, stream=True )
+    headers_done = time.perf_counter()
+    body = res.content
+    end = time.perf_counter()
+
+    if timings != None:
+        timings[ 'request' ]  = headers_done - start
+        timings[ 'transfer' ] = end - headers_done
+
+    return( res.status_code, body )
+
+
+def record( url, status, body ):
+    """
+    save a response so it can later be served by the replay transport.
+    Only successful HTTP responses are saved.
+
+    Arguments:
+        1:  URL
+        2:  HTTP status code
+        3:  body as bytes
+    Returns:
+        pathname written, or None if nothing was saved
+    Context:
+        ctx.transport_dir
+    Exceptions:
+        TransportError
+    """
+
+    ctx = context.current()
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if status != 200:
+        return( None )
+
+    pathname = recording_pathname( url )
+    try:
+        os.makedirs( ctx.transport_dir, exist_ok=True )
+
+        # write to a temporary file first so a replay running at the
+        # same time never sees a partial response
+        tmp_pathname = "{0}.{1}.tmp".format( pathname, os.getpid() )
+        with open( tmp_pathname, 'wb' ) as f:
+            f.write( body )
+        os.replace( tmp_pathname, pathname )
+
+        # keep a human-readable index of what was recorded
+        index = os.path.join( ctx.transport_dir, 'index.txt' )
+        with open( index, 'a' ) as f:
+            f.write( "{0} {1}\n".format( os.path.basename( pathname ), \
+                redact_url( url )))
+    except OSError as err:
+        raise TransportError( "{0}{1}".format( sprefix, err )) from None
+
+    return( pathname )
+
+
+def replay( url, timings=None ):
+    """
+    serve a previously recorded response
+
+    Arguments:
+        1:  URL
+        2:  optional dictionary to save the seconds taken by the
+            'request' and 'transfer' phases into
+    Returns:
+        tuple of ( HTTP-status-code, body as bytes )
+    Exceptions:
+        TransportError
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    start = time.perf_counter()
+    pathname = recording_pathname( url )
+    try:
+        with open( pathname, 'rb' ) as f:
+            body = f.read()
+    except FileNotFoundError:
+        raise TransportError( "{0}no recorded response for {1}". \
+            format( sprefix, redact_url( url ))) from None
+    except OSError as err:
+        raise TransportError( "{0}{1}".format( sprefix, err )) from None
+
+    if timings != None:
+        timings[ 'request' ]  = 0.0
+        timings[ 'transfer' ] = time.perf_counter() - start
+
+    return( 200, body )
+
+
+def fetch( url, timeout=60, timings=None ):
+    """
+    send a URL to the API using the transport set in ctx.transport
+
+    Arguments:
+        1:  URL
+        2:  optional timeout in seconds
+        3:  optional dictionary to save the seconds taken by the
+            'request' and 'transfer' phases into
+    Returns:
+        tuple of ( HTTP-status-code, body as bytes )
+    Context:
+        ctx.transport
+    Exceptions:
+        TransportError
+        any exception raised by requests
+    """
+
+    ctx = context.current()
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    transport = ctx.transport
+    if transport == None or transport == TRANSPORT_HTTP:
+        return( http_fetch( url, timeout, timings ))
+
+    if transport == TRANSPORT_REPLAY:
+        return( replay( url, timings ))
+
+    if transport == TRANSPORT_RECORD:
+        status, body = http_fetch( url, timeout, timings )
+        record( url, status, body )
+        return( status, body )
+
+    raise TransportError( "{0}unknown transport: \'{1}\'". \
+        format( sprefix, transport ))
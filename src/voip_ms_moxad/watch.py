@@ -0,0 +1,307 @@
+"""
+watch CDRs as they come in and send SMS alerts about suspicious calls
+
+The getCDR API method is polled for today's CDRs.  Each CDR not seen
+before is run through the rules, and a SMS message is sent for any
+rule it breaks.  The rules come from the 'alerts' section of the
+config file:
+
+  alerts:
+      recipient   = 555-123-4567    # or an alias from the 'sms' section
+      did         = 555-765-4321    # line to send from. default sms did
+      interval    = 60              # seconds between polls. at least 5
+      max-cost    = 1.00            # alert on any call costing more
+      max-calls-per-minute = 5      # alert on more calls in a minute
+                                    # from any one account
+      international-prefixes (array) = 011
+
+Every CDR of the day is checked, including those found by the first
+poll, so calls made while the watch wasn't running are still alerted
+on.  Alerts are sent with a de-duplication key, so with a state
+directory a restarted watch never sends the same alert twice.
+"""
+
+# Copyright 2018 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import time
+import urllib.parse
+
+from .functions import dprint, send_request, BadWebCall
+from .constants import UNCHANGED
+from . import log
+from .dates import today
+from .phone import resolve, BadNumber
+from .keys import cdr_key
+from . import money
+
+MAX_SMS_LENGTH = 160
+
+# fewest seconds between polls, so getCDR isn't called in a tight loop
+MIN_INTERVAL = 5
+
+
+class BadRule( Exception ): pass
+
+
+def rules_from_config( conf ):
+    """
+    get the alert rules from the 'alerts' section of the config file
+
+    Arguments:
+        config object
+    Returns:
+        dictionary of rules
+    Exceptions:
+        BadRule
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    if 'alerts' not in conf.get_sections():
+        raise BadRule( "{0}no \'alerts\' section in config file". \
+            format( sprefix ))
+
+    rules = {
+        'recipient':                None,
+        'did':                      None,
+        'interval':                 60,
+        'max-cost':                 None,
+        'max-calls-per-minute':     None,
+        'international-prefixes':   [],
+    }
+
+    keywords = conf.get_keywords( 'alerts' )
+    for keyword in rules:
+        if keyword in keywords:
+            rules[ keyword ] = conf.get_values( 'alerts', keyword )
+
+    # default to the line we send SMS messages from
+    aliases = {}
+    if 'sms' in conf.get_sections():
+        sms_keywords = conf.get_keywords( 'sms' )
+        if rules[ 'did' ] == None and 'did' in sms_keywords:
+            rules[ 'did' ] = conf.get_values( 'sms', 'did' )
+        if 'aliases' in sms_keywords:
+            aliases = conf.get_values( 'sms', 'aliases' )
+
+    for keyword in [ 'recipient', 'did' ]:
+        number = rules[ keyword ]
+        if number == None:
+            raise BadRule( "{0}no \'{1}\' given in \'alerts\' section". \
+                format( sprefix, keyword ))
+        try:
+            rules[ keyword ] = resolve( number, aliases )
+        except BadNumber:
+            raise BadRule( "{0}\'{1}\' must be a phone number: \'{2}\'". \
+                format( sprefix, keyword, number )) from None
+
+    for keyword in [ 'interval', 'max-cost', 'max-calls-per-minute' ]:
+        if rules[ keyword ] == None:
+            continue
+        try:
+            if keyword == 'max-cost':
+                # micro-cents.  See money.py
+                rules[ keyword ] = money.parse( rules[ keyword ] )
+            elif keyword == 'max-calls-per-minute':
+                # a whole number of calls, at least 1
+                if not str( rules[ keyword ] ).strip().isdigit() or \
+                        int( rules[ keyword ] ) < 1:
+                    raise ValueError()
+                rules[ keyword ] = int( rules[ keyword ] )
+            else:
+                rules[ keyword ] = float( rules[ keyword ] )
+            if rules[ keyword ] < 0:
+                raise ValueError()
+        except ValueError:
+            raise BadRule( "{0}\'{1}\' must be a positive number: \'{2}\'". \
+                format( sprefix, keyword, rules[ keyword ] )) from None
+
+    if rules[ 'interval' ] < MIN_INTERVAL:
+        raise BadRule( "{0}\'interval\' must be at least {1} seconds: " \
+            "\'{2}\'".format( sprefix, MIN_INTERVAL, rules[ 'interval' ] ))
+
+    prefixes = rules[ 'international-prefixes' ]
+    if isinstance( prefixes, str ):
+        prefixes = [ prefixes ]
+    rules[ 'international-prefixes' ] = tuple( str( p ) for p in prefixes )
+
+    return( rules )
+
+
+def new_state():
+    """
+    create the state kept between polls
+
+    Arguments:
+        none
+    Returns:
+        dictionary
+    Exceptions:
+        none
+    """
+
+    return( {
+        'day':      None,       # day being watched.  YYYY-MM-DD
+        'seen':     set(),      # keys of CDRs already seen today
+        'minutes':  {},         # ( account, YYYY-MM-DD HH:MM ) -> calls
+    } )
+
+
+def check_cdr( rules, state, cdr ):
+    """
+    run a new CDR through the rules
+
+    Arguments:
+        1:  rules from rules_from_config()
+        2:  state from new_state()
+        3:  CDR dictionary
+    Returns:
+        list of tuples of ( rule-name, alert message )
+    Exceptions:
+        none
+    """
+
+    alerts = []
+    account = cdr.get( 'account', 'unknown' )
+    destination = str( cdr.get( 'destination', '' ))
+    date = str( cdr.get( 'date', '' ))
+
+    if rules[ 'max-cost' ] != None:
+        cost = money.cdr_cost( cdr )
+        if cost > rules[ 'max-cost' ]:
+            alerts.append( ( 'max-cost', "call from {0} to {1} at {2} cost " \
+                "${3}".format( account, destination, date,
+                               money.format_dollars( cost ))))
+
+    prefixes = rules[ 'international-prefixes' ]
+    if prefixes and destination.startswith( prefixes ):
+        alerts.append( ( 'international', "international call from {0} " \
+            "to {1} at {2}".format( account, destination, date )))
+
+    if rules[ 'max-calls-per-minute' ] != None:
+        minute = ( account, date[ :16 ] )
+        calls = state[ 'minutes' ].get( minute, 0 ) + 1
+        state[ 'minutes' ][ minute ] = calls
+
+        # only alert the once, when the limit is first passed
+        if calls == rules[ 'max-calls-per-minute' ] + 1:
+            alerts.append( ( 'calls-per-minute', "{0} calls from {1} in the " \
+                "minute of {2}".format( calls, account, date[ :16 ] )))
+
+    return( alerts )
+
+
+def poll( cdr_url, rules, state, day, timeout, send_alert ):
+    """
+    poll for CDRs and send alerts for any new ones breaking a rule
+
+    Arguments:
+        1:  function returning the getCDR URL for a day
+        2:  rules from rules_from_config()
+        3:  state from new_state()
+        4:  day to poll.  YYYY-MM-DD
+        5:  timeout of the API call
+        6:  function to send an alert, taking the rule name, message and
+            CDR key
+    Returns:
+        tuple of ( new CDRs, alerts sent )
+    Exceptions:
+        BadWebCall
+    """
+
+    if state[ 'day' ] != day:
+        dprint( "watching CDRs for {0}".format( day ))
+        state[ 'day' ] = day
+        state[ 'seen' ] = set()
+        state[ 'minutes' ] = {}
+
+    # most polls get back the same CDRs as the last one.  Those have all
+    # been seen, so they aren't parsed or checked again
+    try:
+        json_struct = send_request( cdr_url( day ), timeout, if_changed=True )
+        if json_struct is UNCHANGED:
+            cdrs = []
+        else:
+            cdrs = json_struct.get( 'cdr', [] )
+    except BadWebCall as err:
+        if "no_cdr" not in str( err ):
+            raise
+        cdrs = []
+
+    num_new = 0
+    num_alerts = 0
+    for cdr in cdrs:
+        key = cdr_key( cdr )
+        if key in state[ 'seen' ]:
+            continue
+        state[ 'seen' ].add( key )
+        num_new = num_new + 1
+
+        for rule, message in check_cdr( rules, state, cdr ):
+            send_alert( rule, message, key )
+            num_alerts = num_alerts + 1
+
+    return( num_new, num_alerts )
+
+
+def watch( cdr_url, sms_url, rules, timeout=60, utc_offset=0, once=False ):
+    """
+    poll for CDRs forever, or once, sending alerts
+
+    Arguments:
+        1:  function returning the getCDR URL for a day
+        2:  base URL of the API with authentication, for sending SMS
+        3:  rules from rules_from_config()
+        4:  optional timeout of API calls
+        5:  optional hours from UTC of the timezone CDRs are in
+        6:  optional flag to poll only once
+    Returns:
+        None
+    Exceptions:
+        BadWebCall
+    """
+
+    state = new_state()
+
+    def send_alert( rule, message, key ):
+        message = message[ :MAX_SMS_LENGTH ]
+        log.info( "alert: {0}", message, rule=rule, cdr=key )
+        url = sms_url + "&method=sendSMS&did={0}&dst={1}&message={2}". \
+            format( rules[ 'did' ], rules[ 'recipient' ], \
+            urllib.parse.quote( message ))
+        try:
+            send_request( url, timeout, dedup_key="alert:{0}:{1}". \
+                format( rule, key ))
+        except BadWebCall as err:
+            # keep watching.  The next alert may get through
+            log.error( "could not send alert: {0}", err, rule=rule,
+                       cdr=key )
+
+    while True:
+        day = today( utc_offset )
+        try:
+            num_new, num_alerts = poll( cdr_url, rules, state, day, timeout,
+                                        send_alert )
+            dprint( "{0} new CDRs. {1} alerts sent", num_new, num_alerts )
+        except BadWebCall as err:
+            if once:
+                raise
+            log.warning( "poll failed: {0}", err, day=day )
+
+        if once:
+            return( None )
+
+        time.sleep( rules[ 'interval' ] )
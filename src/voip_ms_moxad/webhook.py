@@ -0,0 +1,582 @@
+"""
+an asynchronous receiver of the SMS callbacks of voip.ms
+
+voip.ms can call a URL for each SMS or MMS a DID receives.  The URL is
+set up in the voip.ms portal, with placeholders it fills in.  eg:
+
+  https://host:8088/sms?token=secret&id={ID}&date={TIMESTAMP}&from={FROM}&to={TO}&message={MESSAGE}&media={MEDIA}
+
+The fields can also be POSTed as a form, or as the JSON of a voip.ms
+webhook, with the message in data.payload.  Each message is checked,
+and the messages arriving while a batch is being stored are stored
+together in the next transaction (see sms_store.py), so thousands a
+minute can be kept up with.  The callback is answered 'ok' only once
+its message is stored.
+
+  receiver = new_receiver( pathname, token='secret' )
+  asyncio.run( serve( receiver, '127.0.0.1', 8088 ))
+"""
+
+# Copyright 2019 RJ White
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import sys
+import json
+import time
+import hmac
+import asyncio
+import urllib.parse
+import concurrent.futures
+
+from . import log
+from . import sms_store
+from .phone import canonical, BadNumber
+
+MAX_BODY           = 65536      # bytes in the body of a request
+MAX_HEADERS        = 100
+MAX_MESSAGE_LENGTH = 2048       # characters of text in a message
+
+DEFAULT_PATH           = '/sms'
+DEFAULT_BATCH_SIZE     = 500
+DEFAULT_FLUSH_INTERVAL = 0.0    # seconds
+DEFAULT_REQUEST_TIMEOUT = 30.0  # seconds
+
+# YYYY-MM-DD HH:MM[:SS], with a space or T between the date and time
+_DATE_RE = re.compile( r'^(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2})(:\d{2})?' )
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class BadMessage( Exception ): pass
+class BadRequest( Exception ): pass
+
+
+def _first( value ):
+    """
+    get the first of the values of a field of a form
+    """
+
+    if isinstance( value, list ):
+        if len( value ) == 0:
+            return( None )
+        value = value[0]
+
+    return( value )
+
+
+def _phone_number( value ):
+    """
+    get a phone number from the JSON of a webhook, which can be a
+    string, or a dictionary with a 'phone_number', or a list of them
+    """
+
+    if isinstance( value, list ):
+        value = value[0] if value else None
+    if isinstance( value, dict ):
+        value = value.get( 'phone_number' )
+
+    return( value )
+
+
+def fields_from_json( body ):
+    """
+    get the fields of a message from the JSON of a voip.ms webhook
+
+    Arguments:
+        JSON.  The message is the data.payload object, or the object
+        itself if there isn't one
+    Returns:
+        dictionary of id, date, from, to, message, media and type
+    Exceptions:
+        BadMessage
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        doc = json.loads( body )
+    except ValueError as err:
+        raise BadMessage( "{0}bad JSON: {1}".format( sprefix, err )) from None
+    if not isinstance( doc, dict ):
+        raise BadMessage( "{0}JSON isn't an object".format( sprefix ))
+
+    payload = doc
+    data = doc.get( 'data' )
+    if isinstance( data, dict ):
+        payload = data.get( 'payload', data )
+    if not isinstance( payload, dict ):
+        raise BadMessage( "{0}JSON has no message".format( sprefix ))
+
+    media = []
+    for m in payload.get( 'media' ) or []:
+        if isinstance( m, dict ):
+            m = m.get( 'url' )
+        if m:
+            media.append( m )
+
+    return( {
+        'id':       payload.get( 'id' ),
+        'date':     payload.get( 'received_at' ) or payload.get( 'date' ),
+        'from':     _phone_number( payload.get( 'from' )),
+        'to':       _phone_number( payload.get( 'to' )),
+        'message':  payload.get( 'text', payload.get( 'message' )),
+        'media':    media,
+        'type':     payload.get( 'type' ),
+    } )
+
+
+def parse_message( fields ):
+    """
+    check the fields of a received message and make a message of them,
+    as kept by sms_store.py
+
+    Arguments:
+        dictionary of the fields: id, date, from, to, message, and
+        optionally media (a list, or a comma-separated string of URLs)
+        and type
+    Returns:
+        message dictionary
+    Exceptions:
+        BadMessage
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    numbers = {}
+    for field in [ 'from', 'to' ]:
+        value = _first( fields.get( field ))
+        if not value:
+            raise BadMessage( "{0}missing \'{1}\'".format( sprefix, field ))
+        try:
+            numbers[ field ] = canonical( value )
+        except BadNumber:
+            raise BadMessage( "{0}\'{1}\' must be a phone number: \'{2}\'". \
+                format( sprefix, field, value )) from None
+
+    text = _first( fields.get( 'message' ))
+    if text == None:
+        text = ''
+    text = str( text )
+    if len( text ) > MAX_MESSAGE_LENGTH:
+        raise BadMessage( "{0}message is longer than {1} characters". \
+            format( sprefix, MAX_MESSAGE_LENGTH ))
+
+    media = fields.get( 'media' ) or []
+    if isinstance( media, str ):
+        media = [ m.strip() for m in media.split( ',' ) if m.strip() ]
+    elif len( media ) == 1 and ',' in str( media[0] ):
+        media = [ m.strip() for m in media[0].split( ',' ) if m.strip() ]
+
+    # {MEDIA} is filled in with nothing for a plain SMS
+    media = [ str( m ).strip() for m in media if str( m ).strip() ]
+
+    if text == '' and len( media ) == 0:
+        raise BadMessage( "{0}missing \'message\'".format( sprefix ))
+
+    # the date of the message, or else when it got here
+
+    date = _first( fields.get( 'date' ))
+    if date:
+        m = _DATE_RE.match( str( date ))
+        if m == None:
+            raise BadMessage( "{0}bad date: \'{1}\'".format( sprefix, date ))
+        date = "{0} {1}{2}".format( m.group(1), m.group(2),
+                                    m.group(3) or ':00' )
+    else:
+        date = time.strftime( '%Y-%m-%d %H:%M:%S' )
+
+    type_ = _first( fields.get( 'type' ))
+    if not type_:
+        type_ = 'MMS' if media else 'SMS'
+
+    return( {
+        'id':           _first( fields.get( 'id' )),
+        'date':         date,
+        'did':          numbers[ 'to' ],
+        'contact':      numbers[ 'from' ],
+        'direction':    sms_store.DIRECTION_RECEIVED,
+        'type':         str( type_ ).upper(),
+        'message':      text,
+        'media':        media,
+        'source':       'webhook',
+    } )
+
+
+def new_receiver( pathname, token=None, path=DEFAULT_PATH,
+                  batch_size=DEFAULT_BATCH_SIZE,
+                  flush_interval=DEFAULT_FLUSH_INTERVAL,
+                  request_timeout=DEFAULT_REQUEST_TIMEOUT ):
+    """
+    create a receiver
+
+    Arguments:
+        1:  pathname of the store.  See sms_store.py
+        2:  optional secret the callback has to give as the field 'token'
+        3:  optional path of the callback URL.  Default is /sms
+        4:  optional most messages stored in a single transaction
+        5:  optional seconds to wait for more messages before storing
+            a batch.  Default is 0: batches are only of the messages
+            that arrived while the last one was being stored
+        6:  optional seconds a client has to send a whole request in,
+            or to send the next one on a connection kept open
+    Returns:
+        receiver dictionary
+    Exceptions:
+        none
+    """
+
+    return( {
+        'pathname':         pathname,
+        'token':            token,
+        'path':             path,
+        'batch-size':       max( 1, int( batch_size )),
+        'flush-interval':   max( 0.0, float( flush_interval )),
+        'request-timeout':  float( request_timeout ),
+        'queue':            None,   # of ( message, future ).  See serve()
+        'counts':           { 'received': 0, 'stored': 0, 'duplicates': 0,
+                              'rejected': 0, 'batches': 0 },
+    } )
+
+
+async def read_request( reader ):
+    """
+    read an HTTP request
+
+    Arguments:
+        asyncio StreamReader
+    Returns:
+        dictionary of 'method', 'path', 'query', 'version', 'headers'
+        and 'body'.  None if the connection was closed
+    Exceptions:
+        BadRequest
+        asyncio.IncompleteReadError
+        ConnectionError
+    """
+
+    sprefix = sys._getframe().f_code.co_name + "(): "
+
+    try:
+        line = await reader.readline()
+    except ValueError:
+        raise BadRequest( "{0}request line too long".format( sprefix )) \
+            from None
+    if line == b'':
+        return( None )
+
+    try:
+        method, target, version = line.decode( 'latin-1' ).split()
+    except ValueError:
+        raise BadRequest( "{0}bad request line".format( sprefix )) from None
+
+    headers = {}
+    while True:
+        try:
+            line = await reader.readline()
+        except ValueError:
+            raise BadRequest( "{0}header line too long".format( sprefix )) \
+                from None
+        if line in ( b'\r\n', b'\n', b'' ):
+            break
+        if len( headers ) >= MAX_HEADERS:
+            raise BadRequest( "{0}too many headers".format( sprefix ))
+        name, colon, value = line.decode( 'latin-1' ).partition( ':' )
+        headers[ name.strip().lower() ] = value.strip()
+
+    body = b''
+    if 'transfer-encoding' in headers:
+        raise BadRequest( "{0}chunked bodies not supported".format( sprefix ))
+    length = headers.get( 'content-length' )
+    if length != None:
+        if not length.isdigit():
+            raise BadRequest( "{0}bad Content-Length".format( sprefix ))
+        if int( length ) > MAX_BODY:
+            raise BadRequest( "{0}body is too big".format( sprefix ))
+        body = await reader.readexactly( int( length ))
+
+    parts = urllib.parse.urlsplit( target )
+
+    return( {
+        'method':   method.upper(),
+        'path':     parts.path,
+        'query':    parts.query,
+        'version':  version,
+        'headers':  headers,
+        'body':     body,
+    } )
+
+
+def request_fields( request ):
+    """
+    get the fields of a message from a request: the query string, and
+    any form or JSON in the body
+
+    Arguments:
+        request from read_request()
+    Returns:
+        dictionary of fields
+    Exceptions:
+        BadMessage
+    """
+
+    fields = urllib.parse.parse_qs( request[ 'query' ], keep_blank_values=True )
+
+    body = request[ 'body' ]
+    if body:
+        content_type = request[ 'headers' ].get( 'content-type', '' )
+        if 'json' in content_type:
+            fields.update( ( k, v ) for k, v in
+                           fields_from_json( body ).items() if v != None )
+        else:
+            fields.update( urllib.parse.parse_qs(
+                body.decode( 'utf-8', 'replace' ), keep_blank_values=True ))
+
+    return( fields )
+
+
+async def handle_request( receiver, request ):
+    """
+    handle a request, storing the message it has
+
+    Arguments:
+        1:  receiver from new_receiver()
+        2:  request from read_request()
+    Returns:
+        tuple of ( HTTP status, text of the response )
+    Exceptions:
+        none
+    """
+
+    if request[ 'path' ] != receiver[ 'path' ]:
+        return( 404, 'not found' )
+    if request[ 'method' ] not in [ 'GET', 'POST' ]:
+        return( 405, 'method not allowed' )
+
+    counts = receiver[ 'counts' ]
+    try:
+        fields = request_fields( request )
+        if receiver[ 'token' ] != None:
+            token = str( _first( fields.pop( 'token', None )) or '' )
+            if not hmac.compare_digest( token.encode( 'utf-8' ),
+                                        receiver[ 'token' ].encode( 'utf-8' )):
+                counts[ 'rejected' ] += 1
+                return( 403, 'bad token' )
+        message = parse_message( fields )
+    except BadMessage as err:
+        counts[ 'rejected' ] += 1
+        log.warning( "rejected message: {0}", err )
+        return( 400, str( err ))
+
+    counts[ 'received' ] += 1
+    future = asyncio.get_running_loop().create_future()
+    await receiver[ 'queue' ].put( ( message, future ))
+    try:
+        await future
+    except sms_store.BadStore:
+        return( 500, 'could not store message' )
+
+    return( 200, 'ok' )
+
+
+async def handle_connection( receiver, reader, writer ):
+    """
+    handle the requests on a connection, until it is closed
+
+    Arguments:
+        1:  receiver from new_receiver()
+        2:  asyncio StreamReader
+        3:  asyncio StreamWriter
+    Returns:
+        None
+    Exceptions:
+        none
+    """
+
+    # clients that are idle or too slow are hung up on, so they can't
+    # hold connections open
+
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for( read_request( reader ),
+                    receiver[ 'request-timeout' ] )
+            except asyncio.TimeoutError:
+                break
+            except BadRequest as err:
+                writer.write( response( 400, str( err ), False ))
+                await writer.drain()
+                break
+            if request == None:
+                break
+
+            status, text = await handle_request( receiver, request )
+
+            connection = request[ 'headers' ].get( 'connection', '' ).lower()
+            keep_alive = connection != 'close'
+            if request[ 'version' ] == 'HTTP/1.0':
+                keep_alive = connection == 'keep-alive'
+
+            writer.write( response( status, text, keep_alive ))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ( asyncio.IncompleteReadError, ConnectionError ):
+        pass
+    finally:
+        writer.close()
+
+    return( None )
+
+
+def response( status, text, keep_alive ):
+    """
+    build an HTTP response
+
+    Arguments:
+        1:  HTTP status
+        2:  text of the body
+        3:  True to keep the connection open
+    Returns:
+        bytes
+    Exceptions:
+        none
+    """
+
+    body = ( text + '\n' ).encode( 'utf-8' )
+    head = "HTTP/1.1 {0} {1}\r\nContent-Type: text/plain; charset=utf-8\r\n" \
+        "Content-Length: {2}\r\nConnection: {3}\r\n\r\n". \
+        format( status, _REASONS.get( status, '' ), len( body ),
+                'keep-alive' if keep_alive else 'close' )
+
+    return( head.encode( 'latin-1' ) + body )
+
+
+async def store_batches( receiver, conn, executor ):
+    """
+    store the messages queued by handle_request(), in batches of those
+    queued, up to batch-size, waiting up to flush-interval seconds for
+    more.  The requests of its messages are answered once it's stored
+
+    Arguments:
+        1:  receiver from new_receiver()
+        2:  sqlite3 connection from sms_store.open_store()
+        3:  executor with a single thread, to use the connection in
+    Returns:
+        never.  Runs until cancelled
+    Exceptions:
+        none
+    """
+
+    loop = asyncio.get_running_loop()
+    queue = receiver[ 'queue' ]
+    counts = receiver[ 'counts' ]
+
+    while True:
+        batch = [ await queue.get() ]
+        while len( batch ) < receiver[ 'batch-size' ] and not queue.empty():
+            batch.append( queue.get_nowait() )
+        deadline = loop.time() + receiver[ 'flush-interval' ]
+        while len( batch ) < receiver[ 'batch-size' ]:
+            left = deadline - loop.time()
+            if left <= 0:
+                break
+            try:
+                batch.append( await asyncio.wait_for( queue.get(), left ))
+            except asyncio.TimeoutError:
+                break
+
+        messages = [ message for message, future in batch ]
+        try:
+            stored = await loop.run_in_executor( executor,
+                sms_store.add_messages, conn, messages )
+            error = None
+        except sms_store.BadStore as err:
+            stored = 0
+            error = err
+        except Exception as err:
+            # anything else fails the batch too, and we carry on with
+            # the next one, rather than leaving requests waiting forever
+            stored = 0
+            error = sms_store.BadStore( "can't store messages: {0}: {1}". \
+                format( type( err ).__name__, err ))
+
+        if error != None:
+            log.error( "{0}", error )
+
+        counts[ 'batches' ] += 1
+        counts[ 'stored' ] += stored
+        if error == None:
+            counts[ 'duplicates' ] += len( messages ) - stored
+        log.debug( "stored {0} of a batch of {1} messages", stored,
+                   len( messages ))
+
+        for message, future in batch:
+            if future.done():
+                continue
+            if error != None:
+                future.set_exception( error )
+            else:
+                future.set_result( None )
+
+
+async def serve( receiver, host, port, ready=None ):
+    """
+    receive messages until cancelled
+
+    Arguments:
+        1:  receiver from new_receiver()
+        2:  address to listen on.  eg: 127.0.0.1
+        3:  port to listen on.  0 for any free one
+        4:  optional function called with the ( host, port ) listened
+            on, once ready
+    Returns:
+        never.  Runs until cancelled
+    Exceptions:
+        sms_store.BadStore
+        OSError
+    """
+
+    executor = concurrent.futures.ThreadPoolExecutor( max_workers=1 )
+    loop = asyncio.get_running_loop()
+    conn = await loop.run_in_executor( executor, sms_store.open_store,
+                                       receiver[ 'pathname' ] )
+
+    receiver[ 'queue' ] = asyncio.Queue()
+    writer_task = asyncio.create_task( store_batches( receiver, conn,
+                                                      executor ))
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection( receiver, r, w ), host, port )
+
+    address = server.sockets[0].getsockname()[ :2 ]
+    log.info( "receiving SMS on http://{0}:{1}{2}", address[0], address[1],
+              receiver[ 'path' ] )
+    if ready != None:
+        ready( address )
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        writer_task.cancel()
+        await loop.run_in_executor( executor, conn.close )
+        executor.shutdown()